@@ -0,0 +1,169 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from simulation import ENGINES
+from simulation.precision import PRECISIONS
+from simulation.scenarios import SCENARIOS, get_scenario, scenario_size
+
+DEFAULT_SIZES = [64, 128, 256]
+DEFAULT_ENGINES = ['vectorized']
+DEFAULT_PRECISIONS = ['float64', 'float32']
+
+# Steps run before timing, so that e.g. the idle scenario has settled by the time it is measured
+WARMUP_STEPS = 20
+# Steps run while tracing the memory, which slows the simulation down too much to time it at once
+MEMORY_STEPS = 5
+
+
+def create(engine: str, scenario: str, size: int, precision: str = 'float64'):
+    setup = get_scenario(scenario)
+    simulation = ENGINES[engine](*scenario_size(setup, size, size), precision=precision)
+    setup(simulation)
+    return simulation
+
+
+def conservation_error(engine: str, scenario: str, size: int, precision: str, steps: int) -> float:
+    """Returns the largest change of the total liquid that its flows don't account for, relative to the total."""
+
+    simulation = create(engine, scenario, size, precision)
+    simulation.metrics.enabled = True
+    error = 0.0
+    for _ in range(WARMUP_STEPS + steps):
+        simulation.step()
+        error = max(error, abs(simulation.metrics.drift))
+
+    return error / simulation.metrics.total if simulation.metrics.total else error
+
+
+def measure(engine: str, scenario: str, size: int, steps: int, precision: str = 'float64') -> dict:
+    """
+    Runs the scenario on a square grid of the given size with the given precision and returns its throughput, peak
+    memory and conservation error. Scenario files run at their own size instead.
+    """
+
+    simulation = create(engine, scenario, size, precision)
+    height, width = simulation.cells.shape
+    for _ in range(WARMUP_STEPS):
+        simulation.step()
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        simulation.step()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    simulation = create(engine, scenario, size, precision)
+    for _ in range(MEMORY_STEPS):
+        simulation.step()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'scenario': scenario,
+        'engine': engine,
+        'precision': precision,
+        'width': width,
+        'height': height,
+        'steps': steps,
+        'steps_per_second': steps / elapsed,
+        'seconds_per_cell': elapsed / (steps * width * height),
+        'peak_memory_mb': peak / 2 ** 20,
+        'conservation_error': conservation_error(engine, scenario, size, precision, steps),
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[dict]:
+    """Returns the results whose throughput fell by more than `tolerance` compared to the baseline."""
+
+    def key(result: dict) -> tuple:
+        return (result['scenario'], result['engine'], result.get('precision', 'float64'), result['width'],
+                result['height'])
+
+    previous = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        reference = previous.get(key(result))
+        if reference is None:
+            continue
+
+        ratio = result['steps_per_second'] / reference['steps_per_second']
+        print(f"{'/'.join(map(str, key(result))):<40} {ratio:6.2f}x baseline")
+        if ratio < 1 - tolerance:
+            regressions.append(result)
+
+    return regressions
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmarks the simulation engines on the canonical scenarios.")
+    parser.add_argument('-s', '--scenarios', nargs='+', default=list(SCENARIOS),
+                        help="built-in scenarios or scenario files to run")
+    parser.add_argument('-e', '--engines', nargs='+', choices=sorted(ENGINES), default=DEFAULT_ENGINES,
+                        help="engines to run the scenarios on")
+    parser.add_argument('-p', '--precisions', nargs='+', choices=sorted(PRECISIONS), default=DEFAULT_PRECISIONS,
+                        help="precisions of the liquid to run the array engines with")
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help="side lengths of the grids")
+    parser.add_argument('-n', '--steps', type=int, default=100, help="number of timed steps per run")
+    parser.add_argument('-o', '--output', default='benchmark.json', help="file to write the results to")
+    parser.add_argument('-b', '--baseline', help="results file to compare against")
+    parser.add_argument('-t', '--tolerance', type=float, default=0.1,
+                        help="slowdown relative to the baseline reported as a regression")
+    args = parser.parse_args(argv)
+
+    # Scenario files can be given too, so the names are checked here rather than with `choices`
+    for scenario in args.scenarios:
+        try:
+            get_scenario(scenario)
+        except ValueError as error:
+            parser.error(str(error))
+    return args
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+
+    results = []
+    for engine in args.engines:
+        # The cell engine holds Python floats, so it only runs in double precision
+        for precision in args.precisions if engine != 'cell' else ['float64']:
+            for scenario in args.scenarios:
+                # Scenario files have a fixed size, so they run once
+                for size in args.sizes if scenario in SCENARIOS else args.sizes[:1]:
+                    result = measure(engine, scenario, size, args.steps, precision)
+                    results.append(result)
+                    print(f"{engine:<10} {precision:<7} {scenario:<10} {result['width']:>5}x{result['height']:<5} "
+                          f"{result['steps_per_second']:10.1f} steps/s "
+                          f"{result['seconds_per_cell'] * 1e9:8.2f} ns/cell "
+                          f"{result['peak_memory_mb']:8.1f} MB "
+                          f"{result['conservation_error']:9.2e} drift")
+
+    with open(args.output, 'w') as file:
+        json.dump({
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'results': results,
+        }, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -18,6 +18,36 @@ ADDED_LIQUID_AMOUNT = 1.5
 
 ITERATIONS_PER_FRAME = 3
 
+# "cell" for the `Cell` object grid, "vectorized" for the array based engine, "chunked" for sparse array chunks
+ENGINE = "vectorized"
+
+# Size of the square tiles which are skipped by the simulation while nothing moves in them
+TILE_SIZE = 16
+
+# Size of the square chunks the "chunked" engine allocates the grid in
+CHUNK_SIZE = 32
+
+# Flow rules of the array engines, "default" for those of the cell engine or "symmetric" for an even split of the liquid
+# between the left and the right neighbours, see `simulation.kernel.RULES`
+FLOW_RULE = "default"
+
+# Whether the simulations record the time spent in each phase of a step, see `simulation.profiling`
+PROFILING = False
+
+# Floating point type of the liquid in the array engines, 'float64' or 'float32'. Single precision halves the memory and
+# bandwidth the liquid takes, and the liquid it loses or gains to rounding is put back every
+# PRECISION_CORRECTION_INTERVAL steps, see `simulation.precision`
+PRECISION = 'float64'
+PRECISION_CORRECTION_INTERVAL = 50
+
+# Whether the simulations keep running totals of their liquid and its flows, see `simulation.metrics`
+METRICS = False
+
+# Regions of the grid whose liquid changes by less than EQUILIBRIUM_THRESHOLD per wet cell and step, on average, are
+# fast-forwarded to their resting state when checked every EQUILIBRIUM_INTERVAL steps, see `simulation.equilibrium`
+EQUILIBRIUM_THRESHOLD = 1e-3
+EQUILIBRIUM_INTERVAL = 100
+
 # --- DISPLAY CONFIG --- #
 PIXEL_SIZE = 10
 
@@ -27,9 +57,57 @@ DARK_WATER_COLOR = (0, 25, 50)  # dark blue
 SOURCE_COLOR = (0, 255, 0)
 DRAIN_COLOR = (255, 0, 0)
 
+# Largest size of the viewport the grid is shown in, in pixels. Grids which don't fit at PIXEL_SIZE are zoomed out, and
+# the view is zoomed with the mouse wheel up to MAX_ZOOM pixels per cell, by ZOOM_STEP per notch, and dragged with the
+# middle mouse button
+VIEWPORT_WIDTH = 1200
+VIEWPORT_HEIGHT = 800
+MAX_ZOOM = 40
+ZOOM_STEP = 1.25
+
+# "array" to draw the whole grid in one vectorized pass, "cells" to draw the cells one by one
+RENDERER = "array"
+
+# Whether the simulation steps continuously on a background thread, instead of a few steps before every frame
+BACKGROUND_SIMULATION = False
+
+# Whether to pick the iterations per frame automatically, so that stepping takes about SIMULATION_TIME_BUDGET seconds
+# of every frame, instead of using the "Sim speed" slider
+ADAPTIVE_STEPS = False
+SIMULATION_TIME_BUDGET = 0.010
+MAX_ITERATIONS_PER_FRAME = 50
+
+# Whether to keep the past states, to step back and forth through them with the arrow keys while paused
+HISTORY = False
+# Memory the history may take before its oldest states are dropped, and how often it keeps a full copy of the state
+HISTORY_MAX_BYTES = 256 * 2 ** 20
+HISTORY_KEYFRAME_INTERVAL = 50
+
+# Whether to show the per-phase simulation stats under the FPS counter, toggled with 'p'
+SHOW_STATS = False
+
+# Whether to draw again and send to the display only the parts of the screen which change, the cells of the blocks the
+# engine keeps awake and the widgets on input, instead of the whole screen every frame
+DIRTY_RECTS = True
+
 SCREEN_SIZE = [WIDTH * PIXEL_SIZE, HEIGHT * PIXEL_SIZE]
 
+# File the state is saved to with 'k' and loaded from with 'l'
+CHECKPOINT_FILE = "checkpoint.ssdc"
+
 # --- RECORDING CONFIG --- #
+# "state" streams the simulation state to RECORDING_STATE_FILE, to be rendered later with render_recording.py,
+# "screen" keeps screenshots in memory and saves them as a contact sheet to RECORDING_OUTPUT_FILE when stopped
+RECORDING_MODE = "state"
+RECORDING_STATE_FILE = "recording.ssdr"
 RECORDING_OUTPUT_FILE = "output.png"
 RECORDING_FREQUENCY = 20
 RECORDING_OUTPUT_COLUMNS = 5
+
+# --- STREAMING CONFIG --- #
+# Address the stream server of `headless.py --serve` listens on and `stream_client.py` connects to
+STREAM_HOST = "127.0.0.1"
+STREAM_PORT = 8765
+# Steps between the frames streamed to the viewers, and seconds a viewer may hold up the server before it is dropped
+STREAM_FREQUENCY = 3
+STREAM_TIMEOUT = 5.0
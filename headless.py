@@ -0,0 +1,153 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from simulation import ENGINES
+from simulation.recording import StateRecorder
+from simulation.checkpoint import Checkpoint, save_checkpoint
+from simulation.equilibrium import EquilibriumMonitor
+from simulation.kernel import RULES
+from simulation.precision import PRECISIONS
+from simulation.scenarios import SCENARIOS, get_scenario, scenario_size
+from simulation.streaming import StreamServer
+from config import ENGINE, WIDTH, HEIGHT, PRECISION, FLOW_RULE, STREAM_HOST, STREAM_PORT, STREAM_FREQUENCY
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def peak_memory_mb() -> float | None:
+    """Returns the peak resident memory of the process in MB, if it can be measured."""
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Runs the simulation without a display and reports its throughput.")
+    parser.add_argument('scenario', nargs='?',
+                        help=f"built-in scenario ({', '.join(SCENARIOS)}) or scenario file (.json, image or ASCII map)")
+    parser.add_argument('--restore',
+                        help="start from this checkpoint instead of a scenario, with its parameters and flow rules")
+    parser.add_argument('--checkpoint', help="write a checkpoint of the final state to this file")
+    parser.add_argument('-n', '--steps', type=int, default=1000, help="number of simulation steps to run")
+    parser.add_argument('-e', '--engine', choices=sorted(ENGINES), default=ENGINE, help="simulation engine")
+    parser.add_argument('-p', '--precision', choices=sorted(PRECISIONS), default=PRECISION,
+                        help="floating point type of the liquid, float32 only for the array engines")
+    parser.add_argument('--rule', choices=sorted(RULES), default=FLOW_RULE,
+                        help="flow rules, other than the default ones only for the array engines")
+    parser.add_argument('--width', type=int, default=WIDTH, help="grid width in cells")
+    parser.add_argument('--height', type=int, default=HEIGHT, help="grid height in cells")
+    parser.add_argument('-r', '--record', help="stream the state to this file while running, see render_recording.py")
+    parser.add_argument('--record-every', type=int, default=1, help="record only every n-th step")
+    parser.add_argument('--fast-forward', action='store_true',
+                        help="move regions which are close to rest straight to their resting state")
+    parser.add_argument('--metrics', action='store_true',
+                        help="keep running totals of the liquid and its flows, and report them at the end")
+    parser.add_argument('--serve', nargs='?', type=int, const=STREAM_PORT, metavar='PORT',
+                        help=f"stream the state to viewers connecting to this port (default {STREAM_PORT}), "
+                             f"see stream_client.py")
+    parser.add_argument('--host', default=STREAM_HOST, help="address the stream server listens on")
+    parser.add_argument('--stream-every', type=int, default=STREAM_FREQUENCY, help="stream only every n-th step")
+    parser.add_argument('-o', '--output', help="write the final liquid and cell type grids to this .npz file")
+    args = parser.parse_args(argv)
+    if not args.scenario and not args.restore:
+        parser.error("either a scenario or --restore is required")
+    return args
+
+
+def main(argv: list[str] | None = None):
+    args = parse_args(argv)
+
+    if args.restore:
+        checkpoint = Checkpoint(args.restore)
+        height, width = checkpoint.shape
+        simulation = ENGINES[args.engine](width, height, precision=args.precision, rule=args.rule)
+        try:
+            checkpoint.restore(simulation)
+        except ValueError as error:
+            sys.exit(str(error))
+    else:
+        try:
+            scenario = get_scenario(args.scenario)
+        except ValueError as error:
+            sys.exit(str(error))
+        width, height = scenario_size(scenario, args.width, args.height)
+        simulation = ENGINES[args.engine](width, height, precision=args.precision, rule=args.rule)
+        scenario(simulation)
+
+    if args.metrics:
+        simulation.metrics.enabled = True
+
+    recorder = StateRecorder(args.record, frequency=args.record_every) if args.record else None
+    if recorder:
+        recorder.start()
+
+    monitor = EquilibriumMonitor() if args.fast_forward else None
+
+    server = None
+    if args.serve is not None:
+        server = StreamServer(simulation, args.host, args.serve, args.stream_every)
+        print(f"Streaming on {server.address[0]}:{server.address[1]}")
+
+    start = time.perf_counter()
+    for step in range(args.steps):
+        simulation.step()
+        if monitor:
+            monitor.update(simulation)
+        if recorder:
+            recorder.record(simulation.state(), step)
+        if server:
+            server.update(step)
+    elapsed = time.perf_counter() - start
+
+    if recorder:
+        recorder.stop()
+    if server:
+        server.close()
+
+    steps_per_second = args.steps / elapsed if elapsed else float('inf')
+    print(f"Scenario:     {args.scenario or args.restore} "
+          f"({width}x{height}, {args.engine} engine, {args.precision}, {simulation.rule.name} rules)")
+    print(f"Steps:        {args.steps} in {elapsed:.3f} s")
+    print(f"Steps/s:      {steps_per_second:.1f}")
+    print(f"Cells/s:      {steps_per_second * width * height:.3e}")
+
+    memory = peak_memory_mb()
+    if memory is not None:
+        print(f"Peak memory:  {memory:.1f} MB")
+
+    if args.metrics:
+        print(f"Liquid:       {simulation.metrics.initial:.4f} -> {simulation.metrics.total:.4f}")
+        for name in ('inflow', 'outflow', 'truncated', 'edited', 'drift'):
+            print(f"  {name + ':':12}{getattr(simulation.metrics, name):.4e}")
+
+    if monitor:
+        print(f"Fast-forwarded to rest {monitor.fast_forwards} times")
+
+    if server:
+        print(f"Streamed {server.frames} frames, {server.bytes_sent / 2 ** 20:.2f} MB in total")
+
+    if recorder:
+        print(f"Recorded {recorder.frames} frames to {args.record}")
+
+    if args.checkpoint:
+        save_checkpoint(simulation, args.checkpoint)
+        print(f"Checkpoint written to {args.checkpoint}")
+
+    if args.output:
+        state = simulation.state()
+        np.savez_compressed(args.output, liquid=state['liquid'], types=state['types'])
+        print(f"Final state written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,18 @@
+import sys
+
 from visual import display
-from simulation import Simulation
+from simulation import ENGINES
+from simulation.scenarios import get_scenario, scenario_size
+from config import ENGINE, WIDTH, HEIGHT
+
+# An optional built-in scenario or scenario file to start from
+try:
+    scenario = get_scenario(sys.argv[1]) if len(sys.argv) > 1 else None
+except ValueError as error:
+    sys.exit(str(error))
 
-simulation = Simulation()
+simulation = ENGINES[ENGINE](*scenario_size(scenario, WIDTH, HEIGHT))
+if scenario:
+    scenario(simulation)
 
 display.run(simulation)
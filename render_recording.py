@@ -0,0 +1,62 @@
+import argparse
+import os
+
+import pygame as pg
+
+from config import PIXEL_SIZE, RECORDING_OUTPUT_COLUMNS
+from simulation.recording import StateRecording
+from visual.recorder import contact_sheet
+from visual.renderer import ArrayRenderer
+
+
+def render_frame(renderer: ArrayRenderer, state: dict, font: pg.font.Font, label: str) -> pg.Surface:
+    """Renders one recorded state to a surface, labelled like the frames of the live recorder."""
+
+    frame = renderer.render(state['liquid'], state['types'], state['flowing_down'])
+    width, height = frame.shape[:2]
+    surface = pg.transform.scale(pg.surfarray.make_surface(frame), (width * renderer.pixel_size, height))
+    surface.blit(font.render(label, True, (0, 0, 0)), (10, 10))
+    return surface
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Renders a recorded simulation state stream to images.")
+    parser.add_argument('recording', help="file written by the state recorder")
+    parser.add_argument('-o', '--output', default="output.png", help="contact sheet to write")
+    parser.add_argument('-f', '--frames', help="also write every rendered frame as a PNG into this directory")
+    parser.add_argument('--every', type=int, default=1, help="render only every n-th recorded frame")
+    parser.add_argument('--cols', type=int, default=RECORDING_OUTPUT_COLUMNS, help="columns of the contact sheet")
+    parser.add_argument('--pixel-size', type=int, default=PIXEL_SIZE, help="size of a cell in pixels")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None):
+    args = parse_args(argv)
+
+    pg.font.init()
+    font = pg.font.Font(None, 36)
+    renderer = ArrayRenderer(pixel_size=args.pixel_size)
+
+    if args.frames:
+        os.makedirs(args.frames, exist_ok=True)
+
+    surfaces = []
+    with StateRecording(args.recording) as recording:
+        start_cycle = recording.cycles[0] if len(recording) else 0
+        for index in range(0, len(recording), args.every):
+            cycle = recording.cycles[index]
+            surface = render_frame(renderer, recording[index], font, f"Cycle: {cycle - start_cycle}")
+            if args.frames:
+                pg.image.save(surface, os.path.join(args.frames, f"frame_{index:06d}.png"))
+            surfaces.append(surface)
+
+    if not surfaces:
+        print(f"{args.recording} contains no frames")
+        return
+
+    pg.image.save(contact_sheet(surfaces, args.cols), args.output)
+    print(f"Rendered {len(surfaces)} frames to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
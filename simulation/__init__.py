@@ -1,2 +1,49 @@
-from .simulation import Simulation
-from .cell import Cell, CellType
\ No newline at end of file
+from collections.abc import Mapping
+from importlib import import_module
+
+from .cell import Cell, CellType
+
+# Classes of the package imported from their module the first time they are used, so that importing the package only
+# loads what the caller needs. The parallel engine e.g. pulls in multiprocessing and shared memory.
+_LAZY = {
+    'Simulation': '.simulation',
+    'VectorizedSimulation': '.vectorized',
+    'CellView': '.vectorized',
+    'ChunkedSimulation': '.chunked',
+    'ParallelSimulation': '.parallel',
+    'Ensemble': '.ensemble',
+    'SimulationWorker': '.worker',
+    'Snapshot': '.worker',
+}
+
+
+class _Engines(Mapping):
+    """The engine classes by name, importing the module of an engine the first time it is looked up."""
+
+    def __init__(self, engines: dict[str, tuple[str, str]]):
+        self._engines = engines
+
+    def __getitem__(self, name: str) -> type:
+        module, cls = self._engines[name]
+        return getattr(import_module(module, __name__), cls)
+
+    def __iter__(self):
+        return iter(self._engines)
+
+    def __len__(self):
+        return len(self._engines)
+
+
+ENGINES = _Engines({
+    'cell': ('.simulation', 'Simulation'),
+    'vectorized': ('.vectorized', 'VectorizedSimulation'),
+    'chunked': ('.chunked', 'ChunkedSimulation'),
+    'parallel': ('.parallel', 'ParallelSimulation'),
+})
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        return getattr(import_module(_LAZY[name], __name__), name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
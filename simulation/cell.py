@@ -1,8 +1,11 @@
 from enum import Enum
-from typing import Any
+from typing import Any, TYPE_CHECKING
 
 import numpy as np
 
+if TYPE_CHECKING:
+    from .tiles import Tile
+
 
 class CellType(Enum):
     BLANK = 0
@@ -12,6 +15,10 @@ class CellType(Enum):
 
 
 class Cell:
+    __slots__ = (
+        'x', 'y', 'type', 'liquid', 'settled', 'settle_count', 'flowing_down', 'top', 'bottom', 'left', 'right', 'tile'
+    )
+
     def __init__(self, x: int, y: int, _type: CellType):
         self.x = x
         self.y = y
@@ -27,21 +34,31 @@ class Cell:
         self.left: Cell | None = None
         self.right: Cell | None = None
 
+        self.tile: 'Tile | None' = None
+
     def __repr__(self):
         # return f'<Cell x={self.x} y={self.y} liquid={self.liquid}>'
         return (f'{self.liquid:.1f}' if self.liquid else '' if self.type == CellType.BLANK else 'XXX').center(3)
 
+    def wake(self):
+        """Wakes up the tile containing the cell."""
+
+        if self.tile:
+            self.tile.awake = True
+
     def unsettle(self):
         """Unsettles the cell."""
 
         self.settled = False
         self.settle_count = 0
+        self.wake()
 
     def add_liquid(self, amount: float):
         """Adds liquid to the cell."""
 
         self.liquid += amount
         self.settled = False
+        self.wake()
 
     def set_type(self, new_type: CellType):
         """Sets the type of the cell."""
@@ -50,6 +67,7 @@ class Cell:
         if self.type != CellType.BLANK:
             self.liquid = 0
 
+        self.wake()
         self.unsettle_neighbors()
 
     def unsettle_neighbors(self):
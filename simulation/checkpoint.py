@@ -0,0 +1,138 @@
+import os
+import struct
+
+import numpy as np
+
+from .kernel import get_rule
+from .simulation import Simulation
+from .vectorized import VectorizedSimulation
+
+# Per-cell state arrays stored in a checkpoint, in the order they are laid out in the file
+CHECKPOINT_FIELDS = ('liquid', 'types', 'settled', 'settle_count', 'flowing_down')
+# Simulation parameters stored in a checkpoint
+PARAMETERS = ('compression_max', 'flow_speed', 'iterations_per_frame', 'source_rate', 'drain_rate')
+
+MAGIC = b'SSDC'
+VERSION = 2
+
+# Arrays start at multiples of this many bytes, so every one of them can be memory-mapped directly
+ALIGNMENT = 64
+
+# Magic, version, height, width, the `PARAMETERS`, the name of the flow rule, the steps the emitters ran and the number
+# of emitters with settings of their own
+_HEADER = struct.Struct('<4sHIIddIdd32sqI')
+# Dtype and offset of one array
+_FIELD = struct.Struct('<8sQ')
+# Position, rate (NaN for the engine's rate), period and duty of an emitter, see `Emitters.configure`
+_EMITTER = struct.Struct('<IIdqq')
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save_checkpoint(simulation: Simulation | VectorizedSimulation, filename: str):
+    """
+    Writes the full state of the simulation, its parameters, flow rule and emitter settings to a file. The file is
+    written next to the target and moved over it once complete, so a failed save never leaves a broken checkpoint
+    behind.
+    """
+
+    state = simulation.state()
+    arrays = [np.ascontiguousarray(state[name]) for name in CHECKPOINT_FIELDS]
+    height, width = arrays[0].shape
+
+    rule = simulation.rule.name.encode()
+    if len(rule) > 32:
+        raise ValueError(f"Can't store the name of the flow rule {simulation.rule.name!r}, longer than 32 bytes")
+    emitters = simulation.emitters.settings()
+
+    offset = _align(_HEADER.size + _FIELD.size * len(arrays) + _EMITTER.size * len(emitters))
+    fields = []
+    for array in arrays:
+        fields.append((array.dtype.str.encode(), offset))
+        offset = _align(offset + array.nbytes)
+
+    temporary = f"{filename}.tmp"
+    with open(temporary, 'wb') as file:
+        file.write(_HEADER.pack(
+            MAGIC, VERSION, height, width, *(getattr(simulation, name) for name in PARAMETERS),
+            rule, simulation.emitters.step, len(emitters)
+        ))
+        for dtype, field_offset in fields:
+            file.write(_FIELD.pack(dtype, field_offset))
+        for x, y, rate, period, duty in emitters:
+            file.write(_EMITTER.pack(x, y, np.nan if rate is None else rate, period, duty))
+        for array, (_, field_offset) in zip(arrays, fields):
+            file.seek(field_offset)
+            file.write(array.data)
+    os.replace(temporary, filename)
+
+
+class Checkpoint:
+    """
+    A checkpoint file, with its arrays memory-mapped read-only.
+
+    Opening a checkpoint reads only its header; the arrays are paged in when they are copied into a simulation.
+    """
+
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as file:
+            header = file.read(_HEADER.size + _FIELD.size * len(CHECKPOINT_FIELDS))
+            if len(header) < _HEADER.size or header[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{filename} is not a simulation checkpoint")
+
+            _, version, height, width, *values = _HEADER.unpack_from(header)
+            if version != VERSION:
+                raise ValueError(f"Unsupported checkpoint version {version}")
+
+            *parameters, rule, self.emitter_step, emitters = values
+            self.emitters = [
+                (x, y, None if np.isnan(rate) else rate, period, duty)
+                for x, y, rate, period, duty in _EMITTER.iter_unpack(file.read(_EMITTER.size * emitters))
+            ]
+
+        self.shape = (height, width)
+        self.parameters = dict(zip(PARAMETERS, parameters))
+        self.rule = rule.rstrip(b'\0').decode()
+        self.arrays: dict[str, np.ndarray] = {}
+        for index, name in enumerate(CHECKPOINT_FIELDS):
+            dtype, offset = _FIELD.unpack_from(header, _HEADER.size + index * _FIELD.size)
+            self.arrays[name] = np.memmap(
+                filename, dtype=np.dtype(dtype.rstrip(b'\0').decode()), mode='r', offset=offset, shape=self.shape
+            )
+
+    def check(self, simulation: Simulation | VectorizedSimulation):
+        """Raises a ValueError if the checkpoint can't be restored into the simulation."""
+
+        shape = (simulation.height, simulation.width)
+        if shape != self.shape:
+            raise ValueError(f"Can't load a {self.shape} checkpoint into a {shape} grid")
+        if simulation.rule.name != self.rule:
+            if isinstance(simulation, Simulation):
+                raise ValueError(f"The cell engine only supports the default flow rule, not {self.rule!r}")
+            get_rule(self.rule)
+
+    def restore(self, simulation: Simulation | VectorizedSimulation):
+        """
+        Loads the checkpoint into a simulation with a grid of the same size, along with its parameters, flow rule and
+        emitter settings. A simulation it can't be restored into, see `check`, is left unchanged.
+        """
+
+        self.check(simulation)
+        simulation.load_state(self.arrays)
+        if simulation.rule.name != self.rule:
+            simulation.rule = get_rule(self.rule)
+        simulation.emitters.load_settings(self.emitters, self.emitter_step)
+        for name, value in self.parameters.items():
+            setattr(simulation, name, value)
+
+
+def load_checkpoint(filename: str, simulation_class: type = VectorizedSimulation, **kwargs):
+    """Creates a simulation of the given class, sized like the checkpoint, and restores the checkpoint into it."""
+
+    checkpoint = Checkpoint(filename)
+    height, width = checkpoint.shape
+    simulation = simulation_class(width, height, **kwargs)
+    checkpoint.restore(simulation)
+    return simulation
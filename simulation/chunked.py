@@ -0,0 +1,653 @@
+import math
+from time import perf_counter
+
+import numpy as np
+
+from .cell import CellType
+from .emitters import Emitters
+from .metrics import Metrics, empty_tally
+from .precision import MassCorrection, liquid_dtype, spread_correction
+from .kernel import BLANK, SOLID, SOURCE, DRAIN, FlowRule, flow_step, get_rule, spread_to_neighbors
+from .regions import Region, region_blocks
+from .vectorized import CellView, CellGridView
+from .profiling import Profiler
+from config import (
+    WIDTH,
+    HEIGHT,
+    LIQUID_MIN,
+    FLOW_SPEED,
+    COMPRESSION_MAX,
+    ITERATIONS_PER_FRAME,
+    SOURCE_LIQUID_PER_ITERATION,
+    DRAIN_LIQUID_PER_ITERATION,
+    CHUNK_SIZE,
+    PRECISION,
+    PROFILING,
+    FLOW_RULE
+)
+
+# Per-cell fields of a chunk with their types and the values of a never allocated cell. The liquid is stored with the
+# precision of the simulation instead.
+FIELDS = {
+    'liquid': (np.float64, 0.0),
+    'types': (np.int8, BLANK),
+    'settled': (bool, True),
+    'settle_count': (np.int16, 0),
+    'flowing_down': (bool, False),
+}
+
+
+class Chunk:
+    """A square block of cells of a `ChunkedSimulation`, allocated once it holds liquid or a non-blank cell."""
+
+    def __init__(self, size: int, height: int, width: int, liquid_dtype: np.dtype = np.float64):
+        for name, (dtype, default) in FIELDS.items():
+            setattr(self, name, np.full((size, size), default, dtype=liquid_dtype if name == 'liquid' else dtype))
+
+        # Cells of the chunk lying outside of the grid act as walls
+        self.height = height
+        self.width = width
+        self.types[height:, :] = SOLID
+        self.types[:, width:] = SOLID
+
+        self.awake = True
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in FIELDS)
+
+    def is_busy(self) -> bool:
+        """Checks whether any of the chunk's cells need to be updated."""
+
+        return bool(
+            ((self.types == SOURCE) | (self.types == DRAIN)).any()
+            or (~self.settled & (self.liquid != 0) & (self.types == BLANK)).any()
+        )
+
+    def is_empty(self) -> bool:
+        """Checks whether the chunk holds neither liquid nor any non-blank cell of the grid."""
+
+        return not self.liquid.any() and not self.types[:self.height, :self.width].any()
+
+
+class ChunkedField:
+    """Array-like read access to one per-cell field of a `ChunkedSimulation`."""
+
+    def __init__(self, simulation: 'ChunkedSimulation', name: str):
+        self._simulation = simulation
+        self._name = name
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self._simulation.height, self._simulation.width
+
+    def __getitem__(self, position: tuple[int, int] | tuple[slice, slice]):
+        x, y = position
+        if isinstance(x, slice):
+            return self._window(x, y)
+
+        size = self._simulation.chunk_size
+        chunk = self._simulation.chunks.get((x // size, y // size))
+        if chunk is None:
+            return FIELDS[self._name][1]
+
+        return getattr(chunk, self._name)[x % size, y % size]
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        size = self._simulation.chunk_size
+        height, width = self.shape
+
+        default_dtype, default = FIELDS[self._name]
+        if self._name == 'liquid':
+            default_dtype = self._simulation.dtype
+        array = np.full((height, width), default, dtype=dtype or default_dtype)
+        for (cx, cy), chunk in self._simulation.chunks.items():
+            block = array[cx * size:(cx + 1) * size, cy * size:(cy + 1) * size]
+            block[:] = getattr(chunk, self._name)[:block.shape[0], :block.shape[1]]
+
+        return array
+
+    def _window(self, rows: slice, cols: slice) -> np.ndarray:
+        """Returns a dense copy of the cells in a window of the grid, only looking at the chunks it overlaps."""
+
+        size = self._simulation.chunk_size
+        (top, bottom, _), (left, right, _) = rows.indices(self.shape[0]), cols.indices(self.shape[1])
+
+        dtype, default = FIELDS[self._name]
+        if self._name == 'liquid':
+            dtype = self._simulation.dtype
+        array = np.full((max(bottom - top, 0), max(right - left, 0)), default, dtype=dtype)
+        for cx in range(top // size, -(-bottom // size)):
+            for cy in range(left // size, -(-right // size)):
+                chunk = self._simulation.chunks.get((cx, cy))
+                if chunk is None:
+                    continue
+
+                x0, x1 = max(cx * size, top), min((cx + 1) * size, bottom)
+                y0, y1 = max(cy * size, left), min((cy + 1) * size, right)
+                array[x0 - top:x1 - top, y0 - left:y1 - left] = getattr(chunk, self._name)[
+                    x0 - cx * size:x1 - cx * size, y0 - cy * size:y1 - cy * size
+                ]
+
+        return array
+
+
+class ChunkedSimulation:
+    """
+    Simulation engine storing the grid as sparse square chunks.
+
+    Only the chunks which hold liquid or non-blank cells are allocated, so the memory use follows the occupied area
+    rather than the grid size. Every awake chunk is stepped with `flow_step` on a copy padded with a one cell halo taken
+    from its neighbours, and the flows leaving it are added to the neighbouring chunks afterwards. The liquid is stored
+    with the given `precision`, corrected for rounding like in `VectorizedSimulation`, and flows following the `rule`.
+    """
+
+    def __init__(
+            self,
+            width: int = WIDTH,
+            height: int = HEIGHT,
+            chunk_size: int = CHUNK_SIZE,
+            precision: str = PRECISION,
+            rule: str | FlowRule = FLOW_RULE
+    ):
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.dtype = liquid_dtype(precision)
+        self.chunks: dict[tuple[int, int], Chunk] = {}
+        # Chunks dropped by an edit of the whole state since the last step, whose cells changed without being awake
+        self._dropped: set[tuple[int, int]] = set()
+
+        self.liquid = ChunkedField(self, 'liquid')
+        self.types = ChunkedField(self, 'types')
+        self.settled = ChunkedField(self, 'settled')
+        self.settle_count = ChunkedField(self, 'settle_count')
+        self.flowing_down = ChunkedField(self, 'flowing_down')
+
+        self._chunk_rows = math.ceil(height / chunk_size)
+        self._chunk_cols = math.ceil(width / chunk_size)
+        # How many times every chunk was awake at the start or the end of a step, see `awake_counts`
+        self._awake_counts = np.zeros((self._chunk_rows, self._chunk_cols), dtype=np.int64)
+        self._interior = np.zeros((chunk_size + 2, chunk_size + 2), dtype=bool)
+        self._interior[1:-1, 1:-1] = True
+        self.emitters = Emitters(height, width)
+        self.profiler = Profiler(PROFILING)
+        self.metrics = Metrics(lambda: np.asarray(self.liquid))
+        self.correction = None
+        if self.dtype != np.float64:
+            self.correction = MassCorrection(
+                lambda: sum(float(chunk.liquid.sum(dtype=np.float64)) for chunk in self.chunks.values())
+            )
+
+        self.compression_max = COMPRESSION_MAX
+        self.flow_speed = FLOW_SPEED
+        self.iterations_per_frame = ITERATIONS_PER_FRAME
+        self.source_rate = SOURCE_LIQUID_PER_ITERATION
+        self.drain_rate = DRAIN_LIQUID_PER_ITERATION
+        self.rule = get_rule(rule)
+
+    @property
+    def cells(self) -> CellGridView:
+        return CellGridView(self)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(chunk.nbytes for chunk in self.chunks.values())
+
+    def _allocate(self, key: tuple[int, int]) -> Chunk:
+        """Returns the chunk, allocating it if needed."""
+
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            size = self.chunk_size
+            chunk = Chunk(
+                size, min(self.height - key[0] * size, size), min(self.width - key[1] * size, size), self.dtype
+            )
+            self.chunks[key] = chunk
+
+        return chunk
+
+    def _is_blank(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Returns which of the given cells are blank."""
+
+        return np.array([self.types[x, y] == BLANK for x, y in zip(xs.tolist(), ys.tolist())], dtype=bool)
+
+    def _chunk_window(self, key: tuple[int, int]) -> tuple[slice, slice]:
+        """Returns the cells of the grid the chunk covers."""
+
+        size = self.chunk_size
+        chunk = self.chunks[key]
+        return slice(key[0] * size, key[0] * size + chunk.height), slice(key[1] * size, key[1] * size + chunk.width)
+
+    def _record_change(self, key: tuple[int, int], previous: np.ndarray | None, edit: bool = False):
+        """Reports the change of the liquid of the chunk from its previous values, if it had any, to the metrics."""
+
+        chunk = self.chunks[key]
+        delta = chunk.liquid if previous is None else np.subtract(chunk.liquid, previous, dtype=np.float64)
+        self.metrics.change(delta[:chunk.height, :chunk.width], self._chunk_window(key), edit)
+
+    def _invalidate_correction(self):
+        """Drops the reference total of the mass correction, if any, after an edit changed the liquid."""
+
+        if self.correction is not None:
+            self.correction.invalidate()
+
+    def _unsettle(self, x: int, y: int):
+        """Unsettles the target cell if its chunk is allocated."""
+
+        if not (0 <= x < self.height and 0 <= y < self.width):
+            return
+
+        size = self.chunk_size
+        chunk = self.chunks.get((x // size, y // size))
+        if chunk is not None:
+            chunk.settled[x % size, y % size] = False
+            chunk.settle_count[x % size, y % size] = 0
+            chunk.awake = True
+
+    def add_liquid(self, x: int, y: int, amount: float):
+        """Adds liquid to the target cell."""
+
+        size = self.chunk_size
+        chunk = self._allocate((x // size, y // size))
+        chunk.liquid[x % size, y % size] += amount
+        chunk.settled[x % size, y % size] = False
+        chunk.awake = True
+        if self.metrics.enabled:
+            self.metrics.change_cell(x, y, amount, edit=True)
+        self._invalidate_correction()
+
+    def set_cell_type(self, x: int, y: int, _type: CellType):
+        """Sets the type of the target cell."""
+
+        size = self.chunk_size
+        key = (x // size, y // size)
+        if _type == CellType.BLANK and key not in self.chunks:
+            return
+
+        chunk = self._allocate(key)
+        chunk.types[x % size, y % size] = _type.value
+        if _type != CellType.BLANK:
+            if self.metrics.enabled:
+                self.metrics.change_cell(x, y, -float(chunk.liquid[x % size, y % size]), edit=True)
+            chunk.liquid[x % size, y % size] = 0
+            self._invalidate_correction()
+        self.emitters.update(x, y, _type.value)
+
+        for nx, ny in ((x, y), (x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            self._unsettle(nx, ny)
+
+    def _edit_chunks(self, blocks: dict[tuple[int, int], np.ndarray], allocate: bool):
+        """
+        Yields the key, the chunk and the mask of its cells for every block of a region, see `region_blocks`.
+        Unallocated chunks are allocated if `allocate` is set and skipped otherwise.
+        """
+
+        for key, block in blocks.items():
+            chunk = self._allocate(key) if allocate else self.chunks.get(key)
+            if chunk is not None:
+                yield key, chunk, block
+
+    def _spread_blocks(self, blocks: dict[tuple[int, int], np.ndarray]) -> dict[tuple[int, int], np.ndarray]:
+        """Returns the blocks of a region grown by the cells next to it, which may lie in the neighbouring chunks."""
+
+        size = self.chunk_size
+        keys = set(blocks)
+        keys.update((cx + dx, cy + dy) for cx, cy in blocks for (dx, dy), _, _ in self._halos())
+
+        spread = {}
+        for key in keys:
+            if not (0 <= key[0] < self._chunk_rows and 0 <= key[1] < self._chunk_cols):
+                continue
+
+            padded = np.zeros((size + 2, size + 2), dtype=bool)
+            if key in blocks:
+                padded[1:-1, 1:-1] = blocks[key]
+            for (dx, dy), halo, edge in self._halos():
+                neighbor = blocks.get((key[0] + dx, key[1] + dy))
+                if neighbor is not None:
+                    padded[halo] = neighbor[edge]
+
+            cells = (padded | spread_to_neighbors(padded))[1:-1, 1:-1]
+            if cells.any():
+                spread[key] = cells
+        return spread
+
+    def _mark_edited(self, blocks: dict[tuple[int, int], np.ndarray]):
+        """Unsettles the cells of the blocks in the allocated chunks and wakes those chunks."""
+
+        for _, chunk, block in self._edit_chunks(blocks, allocate=False):
+            cells = block[:chunk.height, :chunk.width]
+            chunk.settled[:chunk.height, :chunk.width][cells] = False
+            chunk.settle_count[:chunk.height, :chunk.width][cells] = 0
+            chunk.awake = True
+        self._invalidate_correction()
+
+    def _chunk_values(self, values: float | np.ndarray, key: tuple[int, int], block: np.ndarray) -> float | np.ndarray:
+        """Returns the values for the cells of the block, from a single value or an array shaped like the grid."""
+
+        if np.ndim(values) == 0:
+            return values
+
+        size = self.chunk_size
+        padded = np.zeros((size, size), dtype=np.result_type(values))
+        part = np.broadcast_to(values, (self.height, self.width))[
+            key[0] * size:(key[0] + 1) * size, key[1] * size:(key[1] + 1) * size
+        ]
+        padded[:part.shape[0], :part.shape[1]] = part
+        return padded[block]
+
+    def set_cell_types(self, region: Region, _type: CellType):
+        """Sets the type of every cell in the region, then unsettles them and their neighbours in one pass."""
+
+        size = self.chunk_size
+        blocks = region_blocks(region, (self.height, self.width), size)
+        for key, chunk, block in self._edit_chunks(blocks, allocate=_type != CellType.BLANK):
+            xs, ys = np.nonzero(block)
+            self.emitters.update_cells(xs + key[0] * size, ys + key[1] * size, _type.value, chunk.types[block])
+            chunk.types[block] = _type.value
+            if _type != CellType.BLANK:
+                previous = chunk.liquid.copy() if self.metrics.enabled else None
+                chunk.liquid[block] = 0
+                if previous is not None:
+                    self._record_change(key, previous, edit=True)
+
+        self._mark_edited(self._spread_blocks(blocks))
+
+    def place_sources(self, region: Region):
+        """Turns every cell in the region into a source."""
+
+        self.set_cell_types(region, CellType.SOURCE)
+
+    def place_drains(self, region: Region):
+        """Turns every cell in the region into a drain."""
+
+        self.set_cell_types(region, CellType.DRAIN)
+
+    def add_liquid_region(self, region: Region, amount: float | np.ndarray):
+        """Adds liquid to every cell in the region, either the same amount or one per cell from a grid-shaped array."""
+
+        blocks = region_blocks(region, (self.height, self.width), self.chunk_size)
+        for key, chunk, block in self._edit_chunks(blocks, allocate=True):
+            previous = chunk.liquid.copy() if self.metrics.enabled else None
+            chunk.liquid[block] += self._chunk_values(amount, key, block)
+            if previous is not None:
+                self._record_change(key, previous, edit=True)
+
+        self._mark_edited(blocks)
+
+    def set_liquid_region(self, region: Region, amount: float | np.ndarray):
+        """Sets the liquid of every cell in the region, then unsettles them and their neighbours in one pass."""
+
+        blocks = region_blocks(region, (self.height, self.width), self.chunk_size)
+        for key, chunk, block in self._edit_chunks(blocks, allocate=bool(np.any(amount))):
+            previous = chunk.liquid.copy() if self.metrics.enabled else None
+            chunk.liquid[block] = self._chunk_values(amount, key, block)
+            if previous is not None:
+                self._record_change(key, previous, edit=True)
+
+        self._mark_edited(self._spread_blocks(blocks))
+
+    def state(self, window: tuple[slice, slice] | None = None) -> dict[str, np.ndarray]:
+        """Returns dense copies of the per-cell state, of the whole grid or of the cells in a window of it."""
+
+        if window is not None:
+            return {name: getattr(self, name)[window] for name in FIELDS}
+        return {name: np.asarray(getattr(self, name)) for name in FIELDS}
+
+    def load_state(self, state: dict[str, np.ndarray]):
+        """Replaces the per-cell state with copies of the given arrays, allocating only the chunks they occupy."""
+
+        shape = (self.height, self.width)
+        for name in FIELDS:
+            if state[name].shape != shape:
+                raise ValueError(f"Expected {name} of shape {shape}, got {state[name].shape}")
+
+        if self.metrics.enabled:
+            self.metrics.change(np.subtract(state['liquid'], np.asarray(self.liquid), dtype=np.float64), edit=True)
+        self._invalidate_correction()
+
+        self._dropped.update(self.chunks)
+        self.chunks.clear()
+        size = self.chunk_size
+        for cx in range(self._chunk_rows):
+            for cy in range(self._chunk_cols):
+                block = (slice(cx * size, (cx + 1) * size), slice(cy * size, (cy + 1) * size))
+                if not state['liquid'][block].any() and not state['types'][block].any():
+                    continue
+
+                chunk = self._allocate((cx, cy))
+                for name in FIELDS:
+                    getattr(chunk, name)[:chunk.height, :chunk.width] = state[name][block]
+
+        self.emitters.rebuild(state['types'])
+
+    def reset(self):
+        """Resets the simulation."""
+
+        if self.metrics.enabled:
+            for key, chunk in self.chunks.items():
+                self.metrics.change(-chunk.liquid[:chunk.height, :chunk.width], self._chunk_window(key), edit=True)
+        self._dropped.update(self.chunks)
+        self.chunks.clear()
+        self.emitters.clear()
+        self._invalidate_correction()
+
+    def _gather(self, key: tuple[int, int]) -> tuple[np.ndarray, ...]:
+        """Returns copies of the chunk's fields padded with a one cell halo from the neighbouring chunks."""
+
+        size = self.chunk_size
+        chunk = self.chunks[key]
+
+        liquid = np.zeros((size + 2, size + 2), dtype=self.dtype)
+        types = np.full((size + 2, size + 2), SOLID, dtype=np.int8)
+        settled = np.ones((size + 2, size + 2), dtype=bool)
+        settle_count = np.zeros((size + 2, size + 2), dtype=np.int16)
+        flowing_down = np.zeros((size + 2, size + 2), dtype=bool)
+
+        liquid[1:-1, 1:-1] = chunk.liquid
+        types[1:-1, 1:-1] = chunk.types
+        settled[1:-1, 1:-1] = chunk.settled
+        settle_count[1:-1, 1:-1] = chunk.settle_count
+        flowing_down[1:-1, 1:-1] = chunk.flowing_down
+
+        for (dx, dy), halo, edge in self._halos():
+            neighbor_key = (key[0] + dx, key[1] + dy)
+            if not (0 <= neighbor_key[0] < self._chunk_rows and 0 <= neighbor_key[1] < self._chunk_cols):
+                continue
+
+            neighbor = self.chunks.get(neighbor_key)
+            if neighbor is None:
+                types[halo] = BLANK
+            else:
+                liquid[halo] = neighbor.liquid[edge]
+                types[halo] = neighbor.types[edge]
+
+        return liquid, types, settled, settle_count, flowing_down
+
+    def _halos(self):
+        """Yields the offset of every neighbouring chunk, the padded halo it fills and the edge of it which does."""
+
+        inner = slice(1, -1)
+        yield (-1, 0), (0, inner), (-1, slice(None))
+        yield (1, 0), (-1, inner), (0, slice(None))
+        yield (0, -1), (inner, 0), (slice(None), -1)
+        yield (0, 1), (inner, -1), (slice(None), 0)
+
+    def step(self):
+        """Runs a single step of the simulation."""
+
+        profiler = self.profiler if self.profiler.enabled else None
+        if profiler is not None:
+            profiler.steps += 1
+
+        self._awake_counts += self.awake_blocks()[1]
+        self._dropped.clear()
+        awake = [key for key, chunk in self.chunks.items() if chunk.awake]
+        if not awake:
+            return
+
+        if self.correction is not None:
+            self.correction.start()
+
+        # The liquid of the chunks the step can change, which the metrics compare before and after it
+        tally = empty_tally() if self.metrics.enabled or self.correction is not None else None
+        if self.metrics.enabled:
+            previous = {}
+            for key in awake:
+                for neighbor in (key, *((key[0] + dx, key[1] + dy) for (dx, dy), _, _ in self._halos())):
+                    if neighbor in self.chunks and neighbor not in previous:
+                        previous[neighbor] = self.chunks[neighbor].liquid.copy()
+
+        # Drop the leftovers up front, so that every chunk sees the same neighbouring liquid as a contiguous grid would
+        for key in awake:
+            chunk = self.chunks[key]
+            tiny = (chunk.types == BLANK) & ~chunk.settled & (chunk.liquid != 0) & (chunk.liquid < LIQUID_MIN)
+            if tally is not None:
+                tally['truncated'] += float(chunk.liquid[tiny].sum())
+            chunk.liquid[tiny] = 0
+
+        size = self.chunk_size
+        emitters = self.emitters.batch(self._is_blank, self.source_rate, self.drain_rate)
+        emitter_chunks = emitters.emitter_x // size * self._chunk_cols + emitters.emitter_y // size
+
+        # Drains are stepped by the chunk of the cell they take from, if it is awake, so that its liquid isn't also
+        # flowing away in there
+        drained_chunks = emitters.x // size * self._chunk_cols + emitters.y // size
+        stepped = np.isin(drained_chunks, [x * self._chunk_cols + y for x, y in awake])
+        owners = np.where(~emitters.source & stepped, drained_chunks, emitter_chunks)
+
+        results = []
+        for key in awake:
+            liquid, types, settled, settle_count, flowing_down = self._gather(key)
+            diffs, unsettle = flow_step(
+                liquid,
+                types,
+                settled,
+                settle_count,
+                flowing_down,
+                self.compression_max,
+                self.flow_speed,
+                interior=self._interior,
+                emitters=emitters.local(
+                    key[0] * size - 1, key[1] * size - 1, owners == key[0] * self._chunk_cols + key[1]
+                ),
+                tally=tally,
+                profiler=profiler,
+                rule=self.rule
+            )
+            results.append((key, settled, settle_count, flowing_down, diffs, unsettle))
+
+        if profiler is not None:
+            start = perf_counter()
+
+        touched = set(awake)
+        for key, settled, settle_count, flowing_down, diffs, unsettle in results:
+            chunk = self.chunks[key]
+            chunk.settled[:] = settled[1:-1, 1:-1]
+            chunk.settle_count[:] = settle_count[1:-1, 1:-1]
+            chunk.flowing_down[:] = flowing_down[1:-1, 1:-1]
+
+        for key, _, _, _, diffs, unsettle in results:
+            chunk = self.chunks[key]
+            chunk.liquid += diffs[1:-1, 1:-1]
+            chunk.settled[unsettle[1:-1, 1:-1]] = False
+            chunk.settle_count[unsettle[1:-1, 1:-1]] = 0
+
+            for (dx, dy), halo, edge in self._halos():
+                neighbor_key = (key[0] + dx, key[1] + dy)
+                if not unsettle[halo].any() and not diffs[halo].any():
+                    continue
+
+                neighbor = self._allocate(neighbor_key) if diffs[halo].any() else self.chunks.get(neighbor_key)
+                if neighbor is None:
+                    continue
+
+                neighbor.liquid[edge] += diffs[halo]
+                neighbor.settled[edge] &= ~unsettle[halo]
+                neighbor.settle_count[edge] *= ~unsettle[halo]
+                touched.add(neighbor_key)
+
+        if self.metrics.enabled:
+            self.metrics.count(tally)
+            for key in touched:
+                self._record_change(key, previous.get(key))
+
+        if self.correction is not None:
+            self._correct(self.correction.finish(tally))
+
+        for key in touched:
+            chunk = self.chunks[key]
+            if chunk.is_empty():
+                del self.chunks[key]
+            else:
+                chunk.awake = chunk.is_busy()
+        self._awake_counts += self.awake_blocks()[1]
+
+        if profiler is not None:
+            profiler.lap('apply_diffs', start)
+            profiler.count('settled_cells', sum(
+                np.count_nonzero(chunk.settled & (chunk.liquid != 0)) for chunk in self.chunks.values()
+            ))
+
+    def awake_blocks(self) -> tuple[int, np.ndarray]:
+        """
+        Returns the size of the chunks and which of them are awake. A step only changes the cells of the chunks awake
+        before or after it, and the cells next to them. Chunks dropped by a reset or a loaded state count as awake until
+        the next step.
+        """
+
+        awake = np.zeros((self._chunk_rows, self._chunk_cols), dtype=bool)
+        for key, chunk in self.chunks.items():
+            awake[key] = chunk.awake
+        for key in self._dropped:
+            awake[key] = True
+        return self.chunk_size, awake
+
+    def awake_counts(self) -> np.ndarray:
+        """
+        Returns how many times each chunk was awake at the start or the end of a step. Between two calls, only the
+        cells of the chunks whose count changed or which are awake at the second one can have changed, along with the
+        cells next to them.
+        """
+
+        return self._awake_counts.copy()
+
+    def _correct(self, amount: float):
+        """Spreads the liquid lost or gained to rounding back over the chunks, see `MassCorrection`."""
+
+        if not amount:
+            return
+
+        # Without any moving liquid, the correction is spread over the wet cells of the sleeping chunks too
+        if not any(((chunk.liquid >= LIQUID_MIN) & ~chunk.settled).any() for chunk in self.chunks.values()):
+            for key in self.chunks:
+                self._awake_counts[key] += 1
+
+        previous = {key: chunk.liquid.copy() for key, chunk in self.chunks.items()} if self.metrics.enabled else None
+        fields = [(chunk.liquid, chunk.settled) for chunk in self.chunks.values()]
+        self.correction.corrected += spread_correction(fields, amount)
+        if previous is not None:
+            for key, liquid in previous.items():
+                self._record_change(key, liquid)
+
+    def run(self) -> set[CellView]:
+        """Runs `ITERATIONS_PER_FRAME` steps of the simulation. Returns the cells which need to be displayed."""
+
+        for _ in range(self.iterations_per_frame):
+            self.step()
+
+        start = perf_counter()
+        cells_to_display = set()
+        size = self.chunk_size
+        for (cx, cy), chunk in self.chunks.items():
+            visible = (chunk.types != BLANK) | (chunk.liquid >= LIQUID_MIN)
+            xs, ys = np.nonzero(visible[:chunk.height, :chunk.width])
+            cells_to_display.update(
+                CellView(self, cx * size + x, cy * size + y) for x, y in zip(xs.tolist(), ys.tolist())
+            )
+
+        if self.profiler.enabled:
+            self.profiler.lap('display', start)
+
+        return cells_to_display
@@ -0,0 +1,225 @@
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from .kernel import SOURCE, DRAIN
+
+# Offsets of the top, bottom, left and right neighbours of a cell
+OFFSETS = np.array([(-1, 0), (1, 0), (0, -1), (0, 1)])
+
+
+class EmitterBatch(NamedTuple):
+    """
+    The open neighbours of the emitters active in a step, one entry per neighbour: the position of the emitter, that
+    of the neighbour, the amount it receives from a source or at most gives to a drain, and whether it is a source.
+    """
+
+    emitter_x: np.ndarray
+    emitter_y: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    share: np.ndarray
+    source: np.ndarray
+
+    def __len__(self):
+        return len(self.x)
+
+    def local(self, x0: int, y0: int, selected: np.ndarray | None = None) -> 'EmitterBatch':
+        """Returns the selected entries (all by default) moved to the coordinates of an array starting at `(x0, y0)`."""
+
+        if selected is None:
+            selected = slice(None)
+
+        return EmitterBatch(
+            self.emitter_x[selected] - x0,
+            self.emitter_y[selected] - y0,
+            self.x[selected] - x0,
+            self.y[selected] - y0,
+            self.share[selected],
+            self.source[selected],
+        )
+
+
+class Emitters:
+    """
+    Registry of the sources and drains of a grid, with a rate and an on/off schedule for each of them.
+
+    The engines update it whenever a cell changes type, so finding the emitters never takes a scan of the grid. Their
+    open neighbours are cached until a cell type changes, and `batch` hands all the emitters active in a step to the
+    engine at once. An emitter without a rate of its own uses the engine's `source_rate` or `drain_rate`.
+    """
+
+    def __init__(self, height: int, width: int):
+        self.height = height
+        self.width = width
+
+        # Steps run so far, which the schedules are based on
+        self.step = 0
+
+        # (x, y) -> [cell type, rate or None, period, duty]
+        self._emitters: dict[tuple[int, int], list] = {}
+        self._arrays: dict[str, np.ndarray] | None = None
+        self._neighbors: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray] | None = None
+
+    def __len__(self):
+        return len(self._emitters)
+
+    def __contains__(self, position: tuple[int, int]):
+        return tuple(position) in self._emitters
+
+    def update(self, x: int, y: int, _type: int):
+        """Registers or unregisters the cell after its type changed. Keeps the settings of a cell staying an emitter."""
+
+        entry = self._emitters.get((x, y))
+        if _type in (SOURCE, DRAIN):
+            if entry is None or entry[0] != _type:
+                self._emitters[(x, y)] = [_type, None, 0, 0]
+                self._arrays = None
+        elif entry is not None:
+            del self._emitters[(x, y)]
+            self._arrays = None
+
+        self._neighbors = None
+
+    def update_mask(self, mask: np.ndarray, _type: int, previous: np.ndarray):
+        """Updates the registry for the cells of the mask, whose types changed from `previous`, see `update_cells`."""
+
+        self.update_cells(*np.nonzero(mask), _type, previous)
+
+    def update_cells(self, xs: np.ndarray, ys: np.ndarray, _type: int, previous: np.ndarray):
+        """
+        Registers or unregisters the cells after their type changed from the `previous` types to `_type`. Only the cells
+        which become or stop being an emitter are visited, so e.g. walls drawn over a large area cost nothing here.
+        """
+
+        if _type in (SOURCE, DRAIN):
+            changed = previous != _type
+        else:
+            changed = (previous == SOURCE) | (previous == DRAIN)
+
+        for x, y in zip(xs[changed].tolist(), ys[changed].tolist()):
+            self.update(x, y, _type)
+
+        self._neighbors = None
+
+    def rebuild(self, types: np.ndarray):
+        """Replaces the registry with the emitters of a grid of cell types, keeping the settings of those it had."""
+
+        previous = self._emitters
+        self._emitters = {}
+        for _type in (SOURCE, DRAIN):
+            xs, ys = np.nonzero(types == _type)
+            for x, y in zip(xs.tolist(), ys.tolist()):
+                entry = previous.get((x, y))
+                self._emitters[(x, y)] = entry if entry is not None and entry[0] == _type else [_type, None, 0, 0]
+
+        self._arrays = None
+        self._neighbors = None
+
+    def clear(self):
+        """Drops every emitter."""
+
+        self._emitters.clear()
+        self._arrays = None
+        self._neighbors = None
+
+    def configure(self, x: int, y: int, rate: float | None = None, period: int = 0, duty: int = 0):
+        """
+        Sets the rate of an emitter, `None` for the engine's rate, and its schedule: it is on for the first `duty` steps
+        of every `period` steps, or always if `period` is 0.
+        """
+
+        entry = self._emitters.get((x, y))
+        if entry is None:
+            raise ValueError(f"Cell ({x}, {y}) is neither a source nor a drain")
+        if period < 0 or not 0 <= duty <= period:
+            raise ValueError(f"Expected 0 <= duty <= period, got duty {duty} and period {period}")
+
+        entry[1:] = [rate, period, duty]
+        self._arrays = None
+
+    def settings(self) -> list[tuple[int, int, float | None, int, int]]:
+        """Returns the position, rate, period and duty of every emitter with settings of its own, see `configure`."""
+
+        return [
+            (x, y, rate, period, duty) for (x, y), (_, rate, period, duty) in sorted(self._emitters.items())
+            if rate is not None or period
+        ]
+
+    def load_settings(self, settings: list[tuple[int, int, float | None, int, int]], step: int):
+        """Replaces the settings of all the emitters with the given ones, see `settings`, and the steps run so far."""
+
+        for entry in self._emitters.values():
+            entry[1:] = [None, 0, 0]
+        for x, y, rate, period, duty in settings:
+            self.configure(x, y, rate, period, duty)
+
+        self.step = step
+        self._arrays = None
+
+    def invalidate(self):
+        """Drops the cached open neighbours, after a cell type changed somewhere on the grid."""
+
+        self._neighbors = None
+
+    def _build_arrays(self) -> dict[str, np.ndarray]:
+        """Returns the registry as arrays, sorted by position so that batches don't depend on the editing order."""
+
+        if self._arrays is None:
+            positions = sorted(self._emitters)
+            entries = [self._emitters[position] for position in positions]
+            self._arrays = {
+                'x': np.array([x for x, _ in positions], dtype=np.intp),
+                'y': np.array([y for _, y in positions], dtype=np.intp),
+                'source': np.array([entry[0] == SOURCE for entry in entries], dtype=bool),
+                'rate': np.array([np.nan if entry[1] is None else entry[1] for entry in entries], dtype=np.float64),
+                'period': np.array([entry[2] for entry in entries], dtype=np.int64),
+                'duty': np.array([entry[3] for entry in entries], dtype=np.int64),
+            }
+
+        return self._arrays
+
+    def _open_neighbors(self, arrays: dict[str, np.ndarray], is_blank: Callable[[np.ndarray, np.ndarray], np.ndarray]):
+        """Returns the neighbours of every emitter, which of them are open and the fraction of the rate each gets."""
+
+        if self._neighbors is None:
+            xs = arrays['x'][:, np.newaxis] + OFFSETS[:, 0]
+            ys = arrays['y'][:, np.newaxis] + OFFSETS[:, 1]
+            inside = (xs >= 0) & (xs < self.height) & (ys >= 0) & (ys < self.width)
+
+            is_open = np.zeros(xs.shape, dtype=bool)
+            is_open[inside] = is_blank(xs[inside], ys[inside])
+            per_neighbor = 1 / np.maximum(is_open.sum(axis=1), 1)
+            self._neighbors = xs, ys, is_open, per_neighbor
+
+        return self._neighbors
+
+    def batch(
+            self,
+            is_blank: Callable[[np.ndarray, np.ndarray], np.ndarray],
+            source_rate: float,
+            drain_rate: float
+    ) -> EmitterBatch:
+        """
+        Returns the batch of open neighbours of the emitters active in this step and advances the schedules by a step.
+        `is_blank` tells which of the given cells are blank, and is only called after the cell types changed.
+        """
+
+        arrays = self._build_arrays()
+        xs, ys, is_open, per_neighbor = self._open_neighbors(arrays, is_blank)
+
+        period = arrays['period']
+        active = (period == 0) | (self.step % np.maximum(period, 1) < arrays['duty'])
+        self.step += 1
+
+        rate = np.where(np.isnan(arrays['rate']), np.where(arrays['source'], source_rate, drain_rate), arrays['rate'])
+        selected = is_open & active[:, np.newaxis]
+        entries = np.nonzero(selected)[0]
+        return EmitterBatch(
+            arrays['x'][entries],
+            arrays['y'][entries],
+            xs[selected],
+            ys[selected],
+            (rate * per_neighbor)[entries],
+            arrays['source'][entries],
+        )
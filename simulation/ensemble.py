@@ -0,0 +1,140 @@
+from typing import Callable, Sequence
+
+import numpy as np
+
+from .kernel import BLANK, FlowRule, flow_step, get_rule
+from .vectorized import VectorizedSimulation
+from config import (
+    WIDTH,
+    HEIGHT,
+    LIQUID_MIN,
+    FLOW_SPEED,
+    COMPRESSION_MAX,
+    SOURCE_LIQUID_PER_ITERATION,
+    DRAIN_LIQUID_PER_ITERATION,
+    FLOW_RULE
+)
+
+
+def _per_member(value: float | Sequence[float], members: int) -> np.ndarray:
+    """Broadcasts a parameter to one value per member, shaped to broadcast against the stacked grids."""
+
+    values = np.broadcast_to(np.asarray(value, dtype=float), (members,))
+    return values.reshape(members, 1, 1).copy()
+
+
+class Ensemble:
+    """
+    Independent copies of a scenario, each with its own parameters, stacked along a leading array axis.
+
+    All the members are advanced together by a single vectorized `flow_step`, which makes sweeping the flow speed,
+    compression or source/drain rates much cheaper than running a `VectorizedSimulation` per sweep point.
+    The members all flow following the same `rule`.
+    """
+
+    def __init__(
+        self,
+        scenario: Callable[[VectorizedSimulation], None],
+        members: int,
+        width: int = WIDTH,
+        height: int = HEIGHT,
+        flow_speed: float | Sequence[float] = FLOW_SPEED,
+        compression_max: float | Sequence[float] = COMPRESSION_MAX,
+        source_rate: float | Sequence[float] = SOURCE_LIQUID_PER_ITERATION,
+        drain_rate: float | Sequence[float] = DRAIN_LIQUID_PER_ITERATION,
+        rule: str | FlowRule = FLOW_RULE
+    ):
+        template = VectorizedSimulation(width, height)
+        scenario(template)
+
+        self.members = members
+        self.liquid = np.repeat(template.liquid[np.newaxis], members, axis=0)
+        self.types = np.repeat(template.types[np.newaxis], members, axis=0)
+        self.settled = np.repeat(template.settled[np.newaxis], members, axis=0)
+        self.settle_count = np.repeat(template.settle_count[np.newaxis], members, axis=0)
+        self.flowing_down = np.repeat(template.flowing_down[np.newaxis], members, axis=0)
+
+        self.flow_speed = _per_member(flow_speed, members)
+        self.compression_max = _per_member(compression_max, members)
+        self.source_rate = _per_member(source_rate, members)
+        self.drain_rate = _per_member(drain_rate, members)
+        self.rule = get_rule(rule)
+
+        self.steps = 0
+
+    def step(self):
+        """Runs a single step of every member."""
+
+        diffs, unsettle = flow_step(
+            self.liquid,
+            self.types,
+            self.settled,
+            self.settle_count,
+            self.flowing_down,
+            self.compression_max,
+            self.flow_speed,
+            source_rate=self.source_rate,
+            drain_rate=self.drain_rate,
+            rule=self.rule
+        )
+
+        self.liquid += diffs
+        self.settled[unsettle] = False
+        self.settle_count[unsettle] = 0
+        self.steps += 1
+
+    def run(self, steps: int):
+        """Runs the given number of steps of every member."""
+
+        for _ in range(steps):
+            self.step()
+
+    def total_liquid(self) -> np.ndarray:
+        """Returns the total liquid of every member."""
+
+        return self.liquid.sum(axis=(1, 2))
+
+    def settled_fraction(self) -> np.ndarray:
+        """Returns, for every member, the fraction of the cells holding liquid which are settled."""
+
+        wet = (self.types == BLANK) & (self.liquid >= LIQUID_MIN)
+        wet_count = wet.sum(axis=(1, 2))
+        settled_count = (wet & self.settled).sum(axis=(1, 2))
+        return np.where(wet_count > 0, settled_count / np.maximum(wet_count, 1), 1.0)
+
+    def member(self, index: int) -> VectorizedSimulation:
+        """Returns a standalone simulation holding a copy of the member's current state and parameters."""
+
+        height, width = self.liquid.shape[1:]
+        simulation = VectorizedSimulation(width, height, rule=self.rule)
+        simulation.load_state({
+            'liquid': self.liquid[index],
+            'types': self.types[index],
+            'settled': self.settled[index],
+            'settle_count': self.settle_count[index],
+            'flowing_down': self.flowing_down[index],
+        })
+        simulation.flow_speed = self.flow_speed[index].item()
+        simulation.compression_max = self.compression_max[index].item()
+        simulation.source_rate = self.source_rate[index].item()
+        simulation.drain_rate = self.drain_rate[index].item()
+        return simulation
+
+    def results(self) -> list[dict]:
+        """Returns the total liquid, settled fraction and final liquid and cell type grids of every member."""
+
+        total_liquid = self.total_liquid()
+        settled_fraction = self.settled_fraction()
+        return [
+            {
+                'flow_speed': self.flow_speed[i].item(),
+                'compression_max': self.compression_max[i].item(),
+                'source_rate': self.source_rate[i].item(),
+                'drain_rate': self.drain_rate[i].item(),
+                'total_liquid': float(total_liquid[i]),
+                'settled_fraction': float(settled_fraction[i]),
+                'liquid': self.liquid[i].copy(),
+                'types': self.types[i].copy(),
+            }
+            for i in range(self.members)
+        ]
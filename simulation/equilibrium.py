@@ -0,0 +1,310 @@
+import numpy as np
+
+from .kernel import BLANK, SOURCE, DRAIN, spread_to_neighbors
+from config import LIQUID_MAX, LIQUID_MIN, EQUILIBRIUM_THRESHOLD, EQUILIBRIUM_INTERVAL
+
+
+class _Basin:
+    """
+    A node of the merge tree of the grid's blank cells: the cells of the child basins below its bottom row, which join
+    through its own runs of cells, and the runs of cells above them up to where it joins another basin or is closed off.
+    """
+
+    __slots__ = ('bottom', 'children', 'runs', 'counts', 'cells', 'row_sum', 'water')
+
+    def __init__(self, bottom: int, children: list['_Basin']):
+        self.bottom = bottom
+        self.children = children
+        self.runs: list[int] = []
+        # Number of own cells in every row, from the bottom row upwards
+        self.counts: list[int] = []
+
+        # Number of cells, sum of their rows and liquid over the whole subtree
+        self.cells = sum(child.cells for child in children)
+        self.row_sum = sum(child.row_sum for child in children)
+        self.water = sum(child.water for child in children)
+
+    @property
+    def top(self) -> int:
+        return self.bottom - len(self.counts) + 1
+
+    def add_row(self, row: int, runs: list[int], lengths: np.ndarray, water: np.ndarray):
+        """Adds the basin's own runs of a new row on top of it."""
+
+        count = int(lengths[runs].sum())
+        self.runs.extend(runs)
+        self.counts.append(count)
+        self.cells += count
+        self.row_sum += count * row
+        self.water += float(water[runs].sum())
+
+    def capacity(self, compression_max: float) -> float:
+        """Returns the liquid the basin holds when it is full up to its top row."""
+
+        return LIQUID_MAX * self.cells + compression_max * (self.row_sum - self.top * self.cells)
+
+
+def _runs(blank: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the row, first column and end column of every horizontal run of blank cells, in row-major order."""
+
+    padded = np.zeros((blank.shape[0], blank.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = blank
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+    return rows, starts, stops
+
+
+def _run_sums(values: np.ndarray, rows: np.ndarray, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """Returns the sum of the values over every run."""
+
+    sums = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(values, axis=1, out=sums[:, 1:])
+    return sums[rows, stops] - sums[rows, starts]
+
+
+def _run_cells(rows: np.ndarray, starts: np.ndarray, stops: np.ndarray, width: int) -> np.ndarray:
+    """Returns the flat indices of the cells of every run, run after run."""
+
+    lengths = stops - starts
+    offsets = np.repeat(rows * width + starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+def _merge_tree(rows: np.ndarray, starts: np.ndarray, stops: np.ndarray, water: np.ndarray, height: int):
+    """
+    Sweeps the runs from the bottom row upwards, joining the runs which touch into basins. Returns the root basin of
+    every connected region of blank cells and, for every run, the index of its region.
+    """
+
+    lengths = stops - starts
+    bounds = np.searchsorted(rows, np.arange(height + 1))
+    parent = list(range(len(rows)))
+
+    def find(run: int) -> int:
+        while parent[run] != run:
+            parent[run] = parent[parent[run]]
+            run = parent[run]
+        return run
+
+    basins: dict[int, _Basin] = {}
+    roots: list[_Basin] = []
+    for row in range(height - 1, -1, -1):
+        below = range(bounds[row + 1], bounds[row + 2]) if row + 1 < height else range(0)
+        below_roots = {run: find(run) for run in below}
+
+        # Runs of the row and the runs below them they touch, found by walking both rows from left to right
+        touching = []
+        j = below.start
+        for i in range(bounds[row], bounds[row + 1]):
+            while j < below.stop and stops[j] <= starts[i]:
+                j += 1
+            k = j
+            while k < below.stop and starts[k] < stops[i]:
+                touching.append((i, k))
+                k += 1
+
+        for i, k in touching:
+            parent[find(i)] = find(k)
+
+        groups: dict[int, tuple[list[int], set[int]]] = {}
+        for i in range(bounds[row], bounds[row + 1]):
+            groups.setdefault(find(i), ([], set()))[0].append(i)
+        for i, k in touching:
+            groups[find(i)][1].add(below_roots[k])
+
+        continued = set()
+        for root, (runs, below_basins) in groups.items():
+            children = [basins.pop(below_root) for below_root in below_basins]
+            continued.update(below_basins)
+            basin = children[0] if len(children) == 1 else _Basin(row, children)
+            basin.add_row(row, runs, lengths, water)
+            basins[root] = basin
+
+        # Basins no run of this row touches are closed off from above
+        for below_root in set(below_roots.values()) - continued:
+            roots.append(basins.pop(below_root))
+
+    roots.extend(basins.values())
+
+    regions = np.array([find(run) for run in range(len(rows))], dtype=np.intp)
+    return roots, regions
+
+
+def _fill(basin: _Basin, volume: float, compression_max: float, surface: np.ndarray, level: np.ndarray):
+    """
+    Spreads the volume of liquid over the basin at rest, setting the surface row and the liquid at the surface of every
+    run it fills. Liquid first fills the child basins, the ones overflowing spilling into the others, and only rises
+    into the basin's own rows once all of them are full.
+    """
+
+    stack = [(basin, volume)]
+    while stack:
+        basin, volume = stack.pop()
+
+        capacities = [child.capacity(compression_max) for child in basin.children]
+        if basin.children and volume <= sum(capacities):
+            claims = [min(child.water, capacity) for child, capacity in zip(basin.children, capacities)]
+            spare = [capacity - claim for capacity, claim in zip(capacities, claims)]
+            leftover = max(volume - sum(claims), 0.0)
+            total_spare = sum(spare)
+            for child, claim, room in zip(basin.children, claims, spare):
+                stack.append((child, claim + (leftover * room / total_spare if total_spare > 0 else 0.0)))
+            continue
+
+        # A single body of liquid over all the subtree, with its surface in one of the basin's own rows
+        cells = basin.cells - sum(basin.counts)
+        row_sum = basin.row_sum - sum(count * (basin.bottom - k) for k, count in enumerate(basin.counts))
+        for k, count in enumerate(basin.counts):
+            row = basin.bottom - k
+            full = LIQUID_MAX * (count + cells) + compression_max * (row_sum - row * cells)
+            if volume <= full or k == len(basin.counts) - 1:
+                break
+            cells += count
+            row_sum += count * row
+
+        empty = LIQUID_MAX * cells + compression_max * (row_sum - (row + 1) * cells)
+        amount = max(volume - empty, 0.0) / (count + compression_max / LIQUID_MAX * cells)
+
+        subtree = [basin]
+        while subtree:
+            node = subtree.pop()
+            surface[node.runs] = row
+            level[node.runs] = amount
+            subtree.extend(node.children)
+
+
+def basin_labels(types: np.ndarray) -> np.ndarray:
+    """Labels every blank cell with the connected region of blank cells it belongs to, and the other cells with -1."""
+
+    height, width = types.shape
+    rows, starts, stops = _runs(types == BLANK)
+    labels = np.full(height * width, -1, dtype=np.intp)
+    _, regions = _merge_tree(rows, starts, stops, np.zeros(len(rows)), height)
+    labels[_run_cells(rows, starts, stops, width)] = np.repeat(regions, stops - starts)
+    return labels.reshape(height, width)
+
+
+def solve_equilibrium(
+        liquid: np.ndarray,
+        types: np.ndarray,
+        compression_max: float,
+        selected: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the liquid of the grid at rest and the mask of the cells it was solved for: every connected region of blank
+    cells with a cell in `selected`, or all of them.
+
+    Every region is split into basins joined over their lowest rims, and its liquid settles into them with a flat
+    surface. Below the surface every cell holds `compression_max` more than the one above it, matching the pressure
+    profile of the flow model, so that the result is a resting state of the simulation. The liquid of a region stays
+    in it, but moves between its basins as they fill and spill. Regions next to a source or a drain never come to rest,
+    so they are left out.
+    """
+
+    height, width = liquid.shape
+    blank = types == BLANK
+    rows, starts, stops = _runs(blank)
+    water = _run_sums(np.where(blank, liquid, 0), rows, starts, stops)
+    roots, regions = _merge_tree(rows, starts, stops, water, height)
+
+    if selected is not None:
+        selected_regions = set(regions[_run_sums(selected.astype(np.float64), rows, starts, stops) > 0].tolist())
+    else:
+        selected_regions = set(regions.tolist())
+    fed = blank & spread_to_neighbors((types == SOURCE) | (types == DRAIN))
+    selected_regions -= set(regions[_run_sums(fed.astype(np.float64), rows, starts, stops) > 0].tolist())
+
+    # Runs of unsolved regions and the dry rows above a surface get a surface below the grid, so they come out empty
+    surface = np.full(len(rows), height, dtype=np.intp)
+    level = np.zeros(len(rows))
+    solved = np.zeros(len(rows), dtype=bool)
+    for root in roots:
+        if regions[root.runs[0]] in selected_regions:
+            _fill(root, root.water, compression_max, surface, level)
+    solved[np.isin(regions, list(selected_regions))] = True
+
+    depth = (rows - surface).astype(np.float64)
+    values = np.where(
+        depth < 0,
+        0.0,
+        np.where(depth == 0, level, LIQUID_MAX + level * compression_max / LIQUID_MAX + (depth - 1) * compression_max)
+    )
+
+    lengths = stops - starts
+    cells = _run_cells(rows[solved], starts[solved], stops[solved], width)
+    result = liquid.copy()
+    result.ravel()[cells] = np.repeat(values[solved], lengths[solved])
+    mask = np.zeros(height * width, dtype=bool)
+    mask[cells] = True
+    return result, mask.reshape(height, width)
+
+
+def fast_forward(simulation, selected: np.ndarray | None = None) -> np.ndarray:
+    """
+    Moves the liquid of the simulation straight to its resting state, in every region of blank cells with a cell in
+    `selected` or all of them, and settles it there. Regions next to a source or a drain are left as they are, see
+    `solve_equilibrium`. Returns the mask of the cells which were solved.
+    """
+
+    state = {name: np.array(array) for name, array in simulation.state().items()}
+    liquid, mask = solve_equilibrium(state['liquid'], state['types'], simulation.compression_max, selected)
+    if not mask.any():
+        return mask
+
+    state['liquid'] = liquid
+    state['settled'][mask] = True
+    state['settle_count'][mask] = 0
+    state['flowing_down'][mask] = False
+    simulation.load_state(state)
+    return mask
+
+
+class EquilibriumMonitor:
+    """
+    Fast-forwards the regions of a simulation which are close to rest.
+
+    Every `interval` steps, the liquid of every region of blank cells is compared to the previous check, and the regions
+    where it changed by less than `threshold` per wet cell and step, on average, are moved straight to their resting
+    state with `fast_forward`. Regions which didn't change at all are already at rest and left alone.
+    """
+
+    def __init__(self, threshold: float = EQUILIBRIUM_THRESHOLD, interval: int = EQUILIBRIUM_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.fast_forwards = 0
+
+        self._steps = 0
+        self._previous: np.ndarray | None = None
+        self._types: np.ndarray | None = None
+        self._labels: np.ndarray | None = None
+
+    def update(self, simulation, steps: int = 1) -> bool:
+        """Counts the steps run and checks the simulation once enough have passed. Returns whether it fast-forwarded."""
+
+        self._steps += steps
+        if self._steps < self.interval:
+            return False
+
+        state = simulation.state()
+        liquid, types = np.array(state['liquid']), np.array(state['types'])
+        if self._types is None or not np.array_equal(types, self._types):
+            self._types = types
+            self._labels = basin_labels(types)
+            self._previous = None
+
+        fast_forwarded = False
+        if self._previous is not None:
+            wet = (self._labels >= 0) & ((liquid >= LIQUID_MIN) | (self._previous >= LIQUID_MIN))
+            labels = self._labels[wet]
+            change = np.bincount(labels, np.abs(liquid - self._previous)[wet]) / self._steps
+            mean_change = change / np.maximum(np.bincount(labels), 1)
+            calm = np.nonzero((mean_change > 0) & (mean_change < self.threshold))[0]
+            if calm.size and fast_forward(simulation, np.isin(self._labels, calm)).any():
+                liquid = np.array(simulation.state()['liquid'])
+                self.fast_forwards += 1
+                fast_forwarded = True
+
+        self._previous = liquid
+        self._steps = 0
+        return fast_forwarded
@@ -0,0 +1,175 @@
+import numpy as np
+
+from .kernel import spread_to_neighbors
+from .simulation import Simulation
+from .tiles import group_tiles
+from .vectorized import VectorizedSimulation
+from config import HISTORY_MAX_BYTES, HISTORY_KEYFRAME_INTERVAL
+
+
+class Segment:
+    """A full copy of the state at one step, followed by the sparse changes of the steps after it."""
+
+    def __init__(self, step: int, keyframe: dict[str, np.ndarray]):
+        self.step = step
+        self.keyframe = keyframe
+        # For every following step, the flat indices and new values of the changed cells of every field
+        self.deltas: list[dict[str, tuple[np.ndarray, np.ndarray]]] = []
+        self.nbytes = sum(array.nbytes for array in keyframe.values())
+
+    @property
+    def last_step(self) -> int:
+        return self.step + len(self.deltas)
+
+    def add_delta(self, delta: dict[str, tuple[np.ndarray, np.ndarray]]):
+        self.deltas.append(delta)
+        self.nbytes += sum(indices.nbytes + values.nbytes for indices, values in delta.values())
+
+    def state_at(self, step: int) -> dict[str, np.ndarray]:
+        """Rebuilds the state at a step of the segment from the keyframe and the deltas up to it."""
+
+        state = {name: array.copy() for name, array in self.keyframe.items()}
+        for delta in self.deltas[:step - self.step]:
+            for name, (indices, values) in delta.items():
+                state[name].ravel()[indices] = values
+        return state
+
+    def truncate(self, step: int):
+        """Drops the deltas after the step."""
+
+        for delta in self.deltas[step - self.step:]:
+            self.nbytes -= sum(indices.nbytes + values.nbytes for indices, values in delta.values())
+        del self.deltas[step - self.step:]
+
+
+class History:
+    """
+    Keeps the past states of a simulation so that it can be rewound, within a memory budget.
+
+    Every `keyframe_interval` steps a full copy of the state is kept, and in between only the cells which changed in
+    each step, so a step is rebuilt from at most one keyframe and `keyframe_interval - 1` deltas. The deltas store the
+    new values of the cells rather than their differences, so rebuilt states match the recorded ones exactly. The
+    changed cells are only looked for around the blocks of the engine which were awake since the previous step, see
+    `awake_counts`, so recording a delta costs about as much as the change. Once the history takes more than
+    `max_bytes`, the oldest keyframes are evicted together with their deltas.
+    """
+
+    def __init__(self, max_bytes: int = HISTORY_MAX_BYTES, keyframe_interval: int = HISTORY_KEYFRAME_INTERVAL):
+        self.max_bytes = max_bytes
+        self.keyframe_interval = keyframe_interval
+        self.segments: list[Segment] = []
+        # Step the simulation is at, which is the last recorded one unless it was rewound
+        self.position = -1
+        self._previous: dict[str, np.ndarray] | None = None
+        # The engine's `awake_counts` when the previous state was taken
+        self._counts: np.ndarray | None = None
+
+    @property
+    def first_step(self) -> int:
+        return self.segments[0].step if self.segments else 0
+
+    @property
+    def last_step(self) -> int:
+        return self.segments[-1].last_step if self.segments else -1
+
+    @property
+    def nbytes(self) -> int:
+        previous = sum(array.nbytes for array in self._previous.values()) if self._previous else 0
+        return previous + sum(segment.nbytes for segment in self.segments)
+
+    def clear(self):
+        self.segments.clear()
+        self.position = -1
+        self._previous = None
+        self._counts = None
+
+    def record(self, simulation: Simulation | VectorizedSimulation):
+        """
+        Records the current state of the simulation as the step after the current position. Anything recorded after
+        the position, i.e. the future of a rewound simulation, is discarded.
+        """
+
+        if self.position < self.last_step:
+            self.truncate(self.position)
+
+        step = self.position + 1
+        counts = simulation.awake_counts()
+        if self._previous is None or step % self.keyframe_interval == 0:
+            state = simulation.state()
+            self.segments.append(Segment(step, {name: array.copy() for name, array in state.items()}))
+            self._previous = {name: array.copy() for name, array in state.items()}
+        else:
+            self.segments[-1].add_delta(self._delta(simulation, counts))
+
+        self._counts = counts
+        self.position = step
+        self._evict()
+
+    def _delta(self, simulation: Simulation | VectorizedSimulation, counts: np.ndarray) -> dict[str, tuple]:
+        """
+        Returns the flat indices and new values of the cells which changed since the previous state, for every field
+        with any, and takes them over into the previous state.
+        """
+
+        # Only the blocks awake since the previous state, and the cells next to them, can have changed
+        size, touched = simulation.awake_blocks()
+        touched |= counts != self._counts
+        touched |= spread_to_neighbors(touched)
+
+        width = self._previous['liquid'].shape[1]
+        found: dict[str, list[tuple[np.ndarray, np.ndarray]]] = {name: [] for name in self._previous}
+        for r0, r1, c0, c1 in group_tiles(touched).tolist():
+            window = (slice(r0 * size, r1 * size), slice(c0 * size, c1 * size))
+            for name, array in simulation.state(window).items():
+                previous = self._previous[name][window]
+                rows, cols = np.nonzero(array != previous)
+                if rows.size:
+                    values = array[rows, cols]
+                    previous[rows, cols] = values
+                    found[name].append((((rows + r0 * size) * width + cols + c0 * size).astype(np.int32), values))
+
+        return {
+            name: (np.concatenate([indices for indices, _ in parts]), np.concatenate([values for _, values in parts]))
+            for name, parts in found.items() if parts
+        }
+
+    def _evict(self):
+        while len(self.segments) > 1 and self.nbytes > self.max_bytes:
+            self.segments.pop(0)
+
+    def _segment(self, step: int) -> Segment:
+        if not self.first_step <= step <= self.last_step:
+            raise IndexError(f"Step {step} is not in the history ({self.first_step} to {self.last_step})")
+
+        for segment in reversed(self.segments):
+            if segment.step <= step:
+                return segment
+
+    def seek(self, step: int) -> dict[str, np.ndarray]:
+        """Returns the state at a recorded step."""
+
+        return self._segment(step).state_at(step)
+
+    def truncate(self, step: int):
+        """Drops everything recorded after the step."""
+
+        while self.segments and self.segments[-1].step > step:
+            self.segments.pop()
+        if self.segments:
+            self.segments[-1].truncate(step)
+            self._previous = self.segments[-1].state_at(step)
+        else:
+            self._previous = None
+        self.position = min(self.position, self.last_step)
+
+    def restore(self, simulation: Simulation | VectorizedSimulation, step: int):
+        """
+        Rewinds (or forwards) the simulation to a recorded step. The steps after it are kept, to be moved to again,
+        until the simulation records a new step from there.
+        """
+
+        state = self.seek(step)
+        simulation.load_state(state)
+        self._previous = state
+        self._counts = simulation.awake_counts()
+        self.position = step
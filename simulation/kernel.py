@@ -0,0 +1,365 @@
+from time import perf_counter
+from typing import Callable, NamedTuple, Sequence, TYPE_CHECKING
+
+import numpy as np
+
+from .cell import CellType
+from .profiling import Profiler
+from config import (
+    LIQUID_MAX,
+    LIQUID_MIN,
+    FLOW_MAX,
+    FLOW_MIN,
+    SOURCE_LIQUID_PER_ITERATION,
+    DRAIN_LIQUID_PER_ITERATION
+)
+
+if TYPE_CHECKING:
+    from .emitters import EmitterBatch
+
+BLANK = CellType.BLANK.value
+SOLID = CellType.SOLID.value
+SOURCE = CellType.SOURCE.value
+DRAIN = CellType.DRAIN.value
+
+SETTLE_ITERATIONS = 10
+
+_ALL = slice(None)
+_HEAD = slice(None, -1)
+_TAIL = slice(1, None)
+
+# (source cells, destination cells) index pairs over the last two axes of a grid,
+# so the same kernel works for a single grid and for a stack of grids.
+BOTTOM = ((..., _HEAD, _ALL), (..., _TAIL, _ALL))
+TOP = ((..., _TAIL, _ALL), (..., _HEAD, _ALL))
+LEFT = ((..., _ALL, _TAIL), (..., _ALL, _HEAD))
+RIGHT = ((..., _ALL, _HEAD), (..., _ALL, _TAIL))
+
+NEIGHBORS = (TOP, BOTTOM, LEFT, RIGHT)
+
+
+def calculate_vertical_flow_value(total: np.ndarray, compression_max) -> np.ndarray:
+    """Calculates how much liquid the lower of two vertically adjacent cells can hold, given their total liquid."""
+
+    return np.where(
+        total <= LIQUID_MAX,
+        LIQUID_MAX,
+        np.where(
+            total < 2 * LIQUID_MAX + compression_max,
+            (LIQUID_MAX * LIQUID_MAX + total * compression_max) / (LIQUID_MAX + compression_max),
+            (total + compression_max) / 2
+        )
+    )
+
+
+def constrain_flow(flow: np.ndarray, remaining_liquid: np.ndarray) -> np.ndarray:
+    """Constraints the flow."""
+
+    return np.minimum(np.maximum(flow, 0), np.minimum(FLOW_MAX, remaining_liquid))
+
+
+# The flow functions take the liquid the cells have left to give, that of their neighbours in the direction of the flow
+# at the start of the step, `compression_max` and `flow_speed`, and return the flow from each cell to its neighbour.
+
+def flow_bottom(remaining, neighbor, compression_max, flow_speed):
+    flow = calculate_vertical_flow_value(remaining + neighbor, compression_max) - neighbor
+    flow = np.where((neighbor > 0) & (flow > FLOW_MIN), flow * flow_speed, flow)
+    return constrain_flow(flow, remaining)
+
+
+def flow_left(remaining, neighbor, compression_max, flow_speed):
+    flow = (remaining - neighbor) / 4
+    flow = np.where(flow > FLOW_MIN, flow * flow_speed, flow)
+    return constrain_flow(flow, remaining)
+
+
+def flow_right(remaining, neighbor, compression_max, flow_speed):
+    flow = (remaining - neighbor) / 3
+    flow = np.where(flow > FLOW_MIN, flow * flow_speed, flow)
+    return constrain_flow(flow, remaining)
+
+
+def flow_top(remaining, neighbor, compression_max, flow_speed):
+    flow = remaining - calculate_vertical_flow_value(remaining + neighbor, compression_max)
+    flow = np.where(flow > FLOW_MIN, flow * flow_speed, flow)
+    return constrain_flow(flow, remaining)
+
+
+class Flow(NamedTuple):
+    """A flow of every cell to its neighbour in a direction, computed by a flow function and profiled as a phase."""
+
+    direction: tuple
+    function: Callable
+    phase: str
+
+
+class FlowRule:
+    """
+    A flow model for `flow_step`: the flows every moving cell tries in turn, and when it settles.
+
+    `flows` lists the flows in the order they run, each one taking what the cells have left after the previous ones. A
+    tuple of flows runs them together instead, from the same remaining liquid, scaled down wherever together they would
+    take more than a cell has. A cell settles once its liquid hasn't changed by more than `settle_tolerance` for
+    `settle_iterations` steps in a row, and only flows above the tolerance unsettle the cells they go to.
+
+    A rule is resolved into the stages `flow_step` runs when it is created, each of them a whole-grid array operation.
+    Its flow functions have to be module-level functions for the parallel engine to hand the rule to its workers.
+    """
+
+    def __init__(self, name: str, flows: Sequence[Flow | tuple[Flow, ...]], settle_iterations: int = SETTLE_ITERATIONS,
+                 settle_tolerance: float = 0.0):
+        self.name = name
+        self.stages = tuple((flow,) if isinstance(flow, Flow) else tuple(flow) for flow in flows)
+        self.settle_iterations = settle_iterations
+        self.settle_tolerance = settle_tolerance
+
+        for stage in self.stages:
+            if not stage or any(flow.direction not in NEIGHBORS for flow in stage):
+                raise ValueError(f"The flows of rule {name!r} have to go to one of the four neighbours")
+            if len({NEIGHBORS.index(flow.direction) for flow in stage}) != len(stage):
+                raise ValueError(f"Flows running together in rule {name!r} have to go in different directions")
+
+    def __repr__(self):
+        return f'FlowRule({self.name!r})'
+
+
+# The rules of `Simulation.run`: the liquid flows down, then a quarter of the difference to the left neighbour and a
+# third of what is left of it to the right one, then up under pressure
+DEFAULT_RULE = FlowRule('default', (
+    Flow(BOTTOM, flow_bottom, 'flow_bottom'),
+    Flow(LEFT, flow_left, 'flow_left'),
+    Flow(RIGHT, flow_right, 'flow_right'),
+    Flow(TOP, flow_top, 'flow_top'),
+))
+
+# Like the default rules, except that the liquid flows to the left and the right together, from the same remaining
+# liquid, with the flow of `flow_right` to each, so a mirrored grid flows the mirrored way up to rounding
+SYMMETRIC_RULE = FlowRule('symmetric', (
+    Flow(BOTTOM, flow_bottom, 'flow_bottom'),
+    (Flow(LEFT, flow_right, 'flow_left'), Flow(RIGHT, flow_right, 'flow_right')),
+    Flow(TOP, flow_top, 'flow_top'),
+))
+
+RULES = {rule.name: rule for rule in (DEFAULT_RULE, SYMMETRIC_RULE)}
+
+
+def get_rule(rule: 'str | FlowRule') -> FlowRule:
+    """Returns a rule given by name, see `RULES`, or the rule itself."""
+
+    if isinstance(rule, FlowRule):
+        return rule
+    if rule not in RULES:
+        raise ValueError(f"Unknown flow rule {rule!r}, expected one of {', '.join(RULES)}")
+
+    return RULES[rule]
+
+
+def neighbor_count(mask: np.ndarray) -> np.ndarray:
+    """Returns, for every cell, how many of its four neighbours are set in `mask`."""
+
+    count = np.zeros(mask.shape, dtype=np.int8)
+    for src, dst in NEIGHBORS:
+        count[src] += mask[dst]
+
+    return count
+
+
+def spread_to_neighbors(mask: np.ndarray) -> np.ndarray:
+    """Returns a mask of all the cells neighbouring a cell set in `mask`."""
+
+    spread = np.zeros(mask.shape, dtype=bool)
+    for src, dst in NEIGHBORS:
+        spread[dst] |= mask[src]
+
+    return spread
+
+
+def _handle_emitters(
+        types, liquid, interior, diffs, unsettle, source_rate, drain_rate, tally=None
+) -> np.ndarray | None:
+    """Pours liquid out of the sources and into the drains. Returns the liquid the drains took from each cell."""
+
+    blank = types == BLANK
+    sources = interior & (types == SOURCE)
+    drains = interior & (types == DRAIN)
+    if not sources.any() and not drains.any():
+        return None
+
+    per_neighbor = 1 / np.maximum(neighbor_count(blank), 1)
+    requested = np.zeros(liquid.shape, dtype=liquid.dtype)
+    for src, dst in NEIGHBORS:
+        target = blank[dst]
+
+        poured = sources[src] & target
+        inflow = np.where(poured, source_rate * per_neighbor[src], 0)
+        diffs[dst] += inflow
+        if tally is not None:
+            tally['inflow'] += float(inflow.sum())
+
+        drained = drains[src] & target
+        requested[dst] += np.where(drained, drain_rate * per_neighbor[src], 0)
+
+        unsettle[dst] |= poured | drained
+
+    return _drain(liquid, diffs, requested, tally)
+
+
+def pour_emitters(
+        liquid: np.ndarray,
+        diffs: np.ndarray,
+        unsettle: np.ndarray,
+        emitters: 'EmitterBatch',
+        tally: dict[str, float] | None = None
+) -> np.ndarray | None:
+    """
+    Pours liquid out of the sources and into the drains of a batch from `Emitters.batch`, in one operation. Returns the
+    liquid the drains took from each cell.
+    """
+
+    if not len(emitters):
+        return None
+
+    target = (emitters.x, emitters.y)
+    np.add.at(diffs, target, np.where(emitters.source, emitters.share, 0))
+    unsettle[target] = True
+    if tally is not None:
+        tally['inflow'] += float(emitters.share[emitters.source].sum())
+
+    requested = np.zeros(liquid.shape, dtype=liquid.dtype)
+    np.add.at(requested, target, np.where(emitters.source, 0, emitters.share))
+    return _drain(liquid, diffs, requested, tally)
+
+
+def _drain(
+        liquid: np.ndarray, diffs: np.ndarray, requested: np.ndarray, tally: dict[str, float] | None
+) -> np.ndarray:
+    """Takes the liquid requested by the drains out of the cells, at most all they have. Returns the liquid taken."""
+
+    drained = np.minimum(requested, liquid)
+    diffs -= drained
+    if tally is not None:
+        tally['outflow'] += float(drained.sum())
+
+    return drained
+
+
+def _share_remaining(stage: tuple[Flow, ...], flows: list[np.ndarray], remaining_liquid: np.ndarray):
+    """Scales the flows running together down, in place, wherever they would take more than a cell has left."""
+
+    taken = np.zeros(remaining_liquid.shape, dtype=remaining_liquid.dtype)
+    for ((src, _), _, _), flow in zip(stage, flows):
+        taken[src] += flow
+
+    scale = np.ones(remaining_liquid.shape, dtype=remaining_liquid.dtype)
+    over = taken > remaining_liquid
+    scale[over] = remaining_liquid[over] / taken[over]
+    for ((src, _), _, _), flow in zip(stage, flows):
+        flow *= scale[src]
+
+
+def flow_step(
+    liquid: np.ndarray,
+    types: np.ndarray,
+    settled: np.ndarray,
+    settle_count: np.ndarray,
+    flowing_down: np.ndarray,
+    compression_max,
+    flow_speed,
+    interior: np.ndarray | None = None,
+    source_rate=SOURCE_LIQUID_PER_ITERATION,
+    drain_rate=DRAIN_LIQUID_PER_ITERATION,
+    emitters: 'EmitterBatch | None' = None,
+    tally: dict[str, float] | None = None,
+    profiler: Profiler | None = None,
+    rule: FlowRule = DEFAULT_RULE
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Computes one step of the flow model as whole-grid array operations.
+
+    Only the cells in `interior` (all of them by default) are updated; the rest only act as neighbours. The state of the
+    updated cells is changed in place, except for their liquid which, like in `Simulation.run`, is returned as a diff to
+    apply afterwards. Returns the diffs and a mask of the cells to unsettle, both of which may cover non-interior cells.
+    The sources and drains are those of the `emitters` batch, in the coordinates of the arrays, or else found by
+    scanning the interior for them. The liquid poured in by the sources, taken out by the drains and dropped as
+    leftovers is added to the 'inflow', 'outflow' and 'truncated' entries of `tally`, and the time spent in each phase
+    is recorded into `profiler`, if given. The flows and the settling of the cells follow the `rule`.
+    """
+
+    if profiler is not None:
+        start = perf_counter()
+
+    if interior is None:
+        interior = np.ones(liquid.shape, dtype=bool)
+
+    diffs = np.zeros(liquid.shape, dtype=liquid.dtype)
+    unsettle = np.zeros(liquid.shape, dtype=bool)
+
+    active = interior & (types == BLANK) & ~settled & (liquid != 0)
+
+    # Leftovers too small to flow are dropped before the drains, which only take the liquid that is really there
+    tiny = active & (liquid < LIQUID_MIN)
+    if tally is not None:
+        tally['truncated'] += float(liquid[tiny].sum())
+    liquid[tiny] = 0
+    active &= ~tiny
+
+    if emitters is None:
+        drained = _handle_emitters(types, liquid, interior, diffs, unsettle, source_rate, drain_rate, tally)
+    else:
+        drained = pour_emitters(liquid, diffs, unsettle, emitters, tally)
+    if profiler is not None:
+        start = profiler.lap('sources_drains', start)
+
+    available = liquid if drained is None else liquid - drained
+
+    flowing_down[active] = False
+    blank = types == BLANK
+    remaining_liquid = np.where(active, available, 0)
+    if profiler is not None:
+        profiler.count('active_cells', np.count_nonzero(active))
+
+    for stage in rule.stages:
+        flows = []
+        for (src, dst), flow_function, phase in stage:
+            flow = flow_function(remaining_liquid[src], liquid[dst], compression_max, flow_speed)
+            flows.append(np.where(active[src] & blank[dst], flow, 0))
+            if profiler is not None and len(stage) > 1:
+                start = profiler.lap(phase, start)
+
+        if len(stage) > 1:
+            _share_remaining(stage, flows, remaining_liquid)
+
+        for (direction, _, _), flow in zip(stage, flows):
+            src, dst = direction
+            flowed = flow != 0
+
+            diffs[src] -= flow
+            diffs[dst] += flow
+            remaining_liquid[src] -= flow
+            unsettle[dst] |= np.abs(flow) > rule.settle_tolerance
+            if direction is BOTTOM:
+                flowing_down[src] |= flowed
+
+            if profiler is not None:
+                profiler.count('flow_events', np.count_nonzero(flowed))
+
+        # Leftovers too small to flow any further are discarded
+        spent = active & (remaining_liquid < LIQUID_MIN)
+        diffs[spent] -= remaining_liquid[spent]
+        if tally is not None:
+            tally['truncated'] += float(remaining_liquid[spent].sum())
+        active &= ~spent
+
+        if profiler is not None:
+            start = profiler.lap(stage[-1].phase, start)
+
+    changed = active & (np.abs(remaining_liquid - available) > rule.settle_tolerance)
+    unsettle |= spread_to_neighbors(changed)
+
+    unchanged = active & ~changed
+    settle_count[unchanged] += 1
+    settled[unchanged & (settle_count >= rule.settle_iterations)] = True
+    if profiler is not None:
+        profiler.lap('settle', start)
+
+    return diffs, unsettle
@@ -0,0 +1,124 @@
+from typing import Callable
+
+import numpy as np
+
+from .regions import Region, region_mask
+from config import METRICS
+
+# Flows the steps report to the metrics, see `flow_step`
+FLOWS = ('inflow', 'outflow', 'truncated')
+
+
+def empty_tally() -> dict[str, float]:
+    """Returns a tally of the flows of a step, for `flow_step` to add to."""
+
+    return dict.fromkeys(FLOWS, 0.0)
+
+
+class Metrics:
+    """
+    Running totals of the liquid of a simulation, kept up to date as the steps apply their diffs.
+
+    Besides the total liquid and the liquid of every region added with `add_region`, it adds up the liquid poured in by
+    the sources, taken out by the drains and dropped as leftovers below `LIQUID_MIN`, and the net change made by edits.
+    Reading any of them takes constant time. `drift` is the change of the total which none of those explain, i.e. the
+    error of the flows.
+
+    The engines only update the metrics while they are enabled, and enabling them counts the liquid once to start over.
+    """
+
+    def __init__(self, liquid: Callable[[], np.ndarray], enabled: bool = METRICS):
+        self._liquid = liquid
+        self._enabled = False
+
+        self.total = 0.0
+        self.initial = 0.0
+        self.inflow = 0.0
+        self.outflow = 0.0
+        self.truncated = 0.0
+        self.edited = 0.0
+        self.regions: dict[str, np.ndarray] = {}
+        self.region_totals: dict[str, float] = {}
+
+        self.enabled = enabled
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, enabled: bool):
+        if enabled and not self._enabled:
+            self._enabled = True
+            self.reset()
+        self._enabled = enabled
+
+    @property
+    def drift(self) -> float:
+        return self.total - (self.initial + self.edited + self.inflow - self.outflow - self.truncated)
+
+    def reset(self):
+        """Counts the liquid of the simulation and of every region, and clears the flows."""
+
+        liquid = self._liquid()
+        self.total = self.initial = float(liquid.sum(dtype=np.float64))
+        self.inflow = self.outflow = self.truncated = self.edited = 0.0
+        for name, mask in self.regions.items():
+            self.region_totals[name] = float(liquid[mask].sum(dtype=np.float64))
+
+    def add_region(self, name: str, region: Region):
+        """Starts keeping the total liquid of the region under the given name."""
+
+        liquid = self._liquid()
+        mask = region_mask(region, liquid.shape)
+        self.regions[name] = mask
+        self.region_totals[name] = float(liquid[mask].sum(dtype=np.float64))
+
+    def remove_region(self, name: str):
+        """Stops keeping the total liquid of the region."""
+
+        del self.regions[name]
+        del self.region_totals[name]
+
+    def count(self, tally: dict[str, float]):
+        """Adds the inflow, outflow and truncated liquid of a step."""
+
+        self.inflow += float(tally.get('inflow', 0.0))
+        self.outflow += float(tally.get('outflow', 0.0))
+        self.truncated += float(tally.get('truncated', 0.0))
+
+    def change(self, delta: np.ndarray, window: tuple[slice, slice] = (slice(None), slice(None)), edit: bool = False):
+        """Adds the change of the liquid over the window of the grid, made by a step or, if `edit` is set, an edit."""
+
+        amount = float(delta.sum(dtype=np.float64))
+        self.total += amount
+        if edit:
+            self.edited += amount
+
+        for name, mask in self.regions.items():
+            self.region_totals[name] += float(delta[mask[window]].sum(dtype=np.float64))
+
+    def change_cell(self, x: int, y: int, amount: float, edit: bool = False):
+        """Adds the change of the liquid of a single cell."""
+
+        amount = float(amount)
+        self.total += amount
+        if edit:
+            self.edited += amount
+
+        for name, mask in self.regions.items():
+            if mask[x, y]:
+                self.region_totals[name] += amount
+
+    def summary(self) -> dict[str, float]:
+        """Returns all the totals, with those of the regions prefixed by `region:`."""
+
+        return {
+            'total': self.total,
+            'inflow': self.inflow,
+            'outflow': self.outflow,
+            'truncated': self.truncated,
+            'edited': self.edited,
+            'drift': self.drift,
+            **{f'region:{name}': total for name, total in self.region_totals.items()},
+        }
@@ -0,0 +1,291 @@
+import math
+import multiprocessing
+import os
+import weakref
+from multiprocessing.shared_memory import SharedMemory
+from time import perf_counter
+
+import numpy as np
+
+from .emitters import EmitterBatch
+from .kernel import BLANK, SOURCE, DRAIN, FlowRule, flow_step
+from .metrics import empty_tally
+from .tiles import tile_any
+from .vectorized import VectorizedSimulation
+from config import (
+    WIDTH,
+    HEIGHT,
+    LIQUID_MIN,
+    TILE_SIZE,
+    PRECISION,
+    FLOW_RULE
+)
+
+# Arrays of the simulation attached to by a worker process, keyed by name
+_arrays: dict[str, np.ndarray] = {}
+_memory: list[SharedMemory] = []
+
+
+def _attach(layout: dict[str, tuple[str, tuple[int, ...], str]]):
+    """Initializes a worker process by attaching to the shared memory buffers of the simulation."""
+
+    for name, (memory_name, shape, dtype) in layout.items():
+        memory = SharedMemory(name=memory_name)
+        _memory.append(memory)
+        _arrays[name] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def _truncate_band(arrays: dict[str, np.ndarray], rows: slice) -> float:
+    """
+    Drops the leftover liquid of the band which `flow_step` would drop at its start, before any band is computed, so
+    that no band changes its liquid while others read it. Returns how much was dropped.
+    """
+
+    liquid = arrays['liquid'][rows]
+    tiny = (arrays['types'][rows] == BLANK) & ~arrays['settled'][rows] & (liquid != 0) & (liquid < LIQUID_MIN)
+    dropped = float(liquid[tiny].sum())
+    liquid[tiny] = 0
+    return dropped
+
+
+def _compute_band(arrays: dict[str, np.ndarray], band: int, rows: slice, compression_max: float, flow_speed: float,
+                  emitters: EmitterBatch, count: bool, rule: FlowRule) -> dict[str, float] | None:
+    """
+    Computes a step for the band following the rule, reading the rows around it as halos, with the emitters lying in the
+    band. Returns the tally of its flows if `count` is set.
+    """
+
+    height = arrays['liquid'].shape[0]
+    window = slice(max(rows.start - 1, 0), min(rows.stop + 1, height))
+    inner = slice(rows.start - window.start, rows.stop - window.start)
+
+    interior = np.zeros((window.stop - window.start, arrays['liquid'].shape[1]), dtype=bool)
+    interior[inner] = True
+
+    tally = empty_tally() if count else None
+    diffs, unsettle = flow_step(
+        arrays['liquid'][window],
+        arrays['types'][window],
+        arrays['settled'][window],
+        arrays['settle_count'][window],
+        arrays['flowing_down'][window],
+        compression_max,
+        flow_speed,
+        interior=interior,
+        emitters=emitters.local(window.start, 0),
+        tally=tally,
+        rule=rule
+    )
+
+    arrays['diffs'][rows] = diffs[inner]
+    arrays['unsettle'][rows] = unsettle[inner]
+    for side, halo, exists in ((0, 0, window.start < rows.start), (1, -1, window.stop > rows.stop)):
+        arrays['halo_diffs'][band, side] = diffs[halo] if exists else 0
+        arrays['halo_unsettle'][band, side] = unsettle[halo] if exists else False
+
+    return tally
+
+
+def _apply_band(arrays: dict[str, np.ndarray], band: int, rows: slice, computed: tuple[bool, bool, bool],
+                tile_size: int) -> np.ndarray:
+    """
+    Applies the diffs of the band and the halo diffs its neighbours computed for it, always in the same order.
+    Returns which of the band's tiles are busy.
+    """
+
+    liquid, settled, settle_count = arrays['liquid'], arrays['settled'], arrays['settle_count']
+    above, this, below = computed
+
+    if this:
+        liquid[rows] += arrays['diffs'][rows]
+        settled[rows][arrays['unsettle'][rows]] = False
+        settle_count[rows][arrays['unsettle'][rows]] = 0
+
+    for neighbor, side, row in ((above, 1, rows.start), (below, 0, rows.stop - 1)):
+        if neighbor:
+            neighbor_band = band - 1 if side == 1 else band + 1
+            liquid[row] += arrays['halo_diffs'][neighbor_band, side]
+            settled[row][arrays['halo_unsettle'][neighbor_band, side]] = False
+            settle_count[row][arrays['halo_unsettle'][neighbor_band, side]] = 0
+
+    types = arrays['types'][rows]
+    busy = (types == SOURCE) | (types == DRAIN) | (~settled[rows] & (liquid[rows] != 0))
+    return tile_any(busy, tile_size)
+
+
+def _pool_truncate(task):
+    return _truncate_band(_arrays, *task)
+
+
+def _pool_compute(task):
+    return _compute_band(_arrays, *task)
+
+
+def _pool_apply(task):
+    return _apply_band(_arrays, *task)
+
+
+def _release(pools: list, memory: list[SharedMemory]):
+    for pool in pools:
+        pool.close()
+        pool.join()
+
+    for buffer in memory:
+        buffer.close()
+        buffer.unlink()
+
+
+class ParallelSimulation(VectorizedSimulation):
+    """
+    Simulation engine splitting the grid into horizontal bands which are stepped by a pool of processes.
+
+    The state lives in shared memory, so the one row halos above and below each band are read directly from the
+    neighbouring bands. A step first computes the diffs of every awake band, keeping the diffs for the halo rows apart,
+    and then applies every band's own diffs followed by the halo diffs from the band above and the band below, so the
+    result does not depend on the order the workers finish in. Drains are stepped by the band of the cells they take
+    from, along with the other flows out of those cells. With a single band, the result matches that of
+    `VectorizedSimulation` exactly, and otherwise up to the rounding of the diffs added up in a different order. Bands
+    are aligned to tiles and sleep along with them.
+    The workers do not profile the phases of their steps, so only applying the diffs is timed. They are only started by
+    the first step, so creating a simulation which never steps stays cheap.
+    """
+
+    def __init__(
+            self,
+            width: int = WIDTH,
+            height: int = HEIGHT,
+            workers: int | None = None,
+            precision: str = PRECISION,
+            rule: str | FlowRule = FLOW_RULE
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self._memory: list[SharedMemory] = []
+        self._shared: dict[int, tuple[str, tuple[int, ...], str]] = {}
+
+        super().__init__(width, height, precision, rule)
+
+        band_height = math.ceil(math.ceil(height / self.workers) / TILE_SIZE) * TILE_SIZE
+        self.bands = [slice(row, min(row + band_height, height)) for row in range(0, height, band_height)]
+
+        self._arrays = {
+            'liquid': self.liquid,
+            'types': self.types,
+            'settled': self.settled,
+            'settle_count': self.settle_count,
+            'flowing_down': self.flowing_down,
+            'diffs': self._allocate((height, width), self.dtype, 0),
+            'unsettle': self._allocate((height, width), bool, False),
+            'halo_diffs': self._allocate((len(self.bands), 2, width), self.dtype, 0),
+            'halo_unsettle': self._allocate((len(self.bands), 2, width), bool, False),
+        }
+        self._layout = {name: self._shared[id(array)] for name, array in self._arrays.items()}
+
+        # The pool of worker processes, started by the first step that needs it
+        self._pools: list = []
+        self._finalizer = weakref.finalize(self, _release, self._pools, self._memory)
+
+    def _allocate(self, shape: tuple[int, ...], dtype, fill) -> np.ndarray:
+        """Allocates one of the per-cell state arrays in shared memory."""
+
+        dtype = np.dtype(dtype)
+        memory = SharedMemory(create=True, size=max(math.prod(shape) * dtype.itemsize, 1))
+        self._memory.append(memory)
+
+        array = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        array[...] = fill
+        self._shared[id(array)] = (memory.name, shape, dtype.str)
+        return array
+
+    def close(self):
+        """Stops the worker processes and releases the shared memory."""
+
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _map(self, function, pool_function, tasks: list[tuple]) -> list:
+        if self.workers == 1 or len(self.bands) == 1:
+            return [function(self._arrays, *task) for task in tasks]
+
+        if not self._pools:
+            self._pools.append(multiprocessing.Pool(min(self.workers, len(self.bands)), _attach, (self._layout,)))
+
+        return self._pools[0].map(pool_function, tasks)
+
+    def _emitter_bands(self, emitters: EmitterBatch, awake: list[bool]) -> np.ndarray:
+        """
+        Returns the band stepping each entry of the batch. Sources are stepped by the band they lie in, but drains by
+        the band of the neighbour they take from, if it is awake, so that its liquid isn't also flowing away in there.
+        """
+
+        starts = [band.start for band in self.bands]
+        bands = np.searchsorted(starts, emitters.emitter_x, side='right') - 1
+        drained = np.searchsorted(starts, emitters.x, side='right') - 1
+        return np.where(~emitters.source & np.array(awake)[drained], drained, bands)
+
+    def step(self):
+        """Runs a single step of the simulation."""
+
+        if self.profiler.enabled:
+            self.profiler.steps += 1
+
+        tile_rows = [slice(band.start // TILE_SIZE, math.ceil(band.stop / TILE_SIZE)) for band in self.bands]
+        awake = [bool(self.tiles.awake[rows].any()) for rows in tile_rows]
+        if not any(awake):
+            return
+        self._awake_counts += self.tiles.awake
+
+        padded = [False, *awake, False]
+        targets = [index for index in range(len(self.bands)) if any(padded[index:index + 3])]
+
+        # The rows whose liquid the step can change, which the metrics compare before and after it
+        metrics = self.metrics.enabled
+        if metrics:
+            changed = slice(self.bands[targets[0]].start, self.bands[targets[-1]].stop)
+            previous = self.liquid[changed].copy()
+
+        if self.correction is not None:
+            self.correction.start()
+
+        # Leftovers only lie in awake tiles, so only the awake bands need to drop theirs
+        count = metrics or self.correction is not None
+        truncated = sum(self._map(_truncate_band, _pool_truncate, [
+            (band,) for index, band in enumerate(self.bands) if awake[index]
+        ]))
+
+        emitters = self.emitters.batch(self._is_blank, self.source_rate, self.drain_rate)
+        owners = self._emitter_bands(emitters, awake)
+        tallies = self._map(_compute_band, _pool_compute, [
+            (index, band, self.compression_max, self.flow_speed, emitters.local(0, 0, owners == index), count, self.rule)
+            for index, band in enumerate(self.bands) if awake[index]
+        ])
+
+        start = perf_counter()
+        applied = self._map(_apply_band, _pool_apply, [
+            (index, self.bands[index], tuple(padded[index:index + 3]), TILE_SIZE) for index in targets
+        ])
+
+        for index, tiles in zip(targets, applied):
+            self.tiles.awake[tile_rows[index]] = tiles
+
+        if count:
+            tally = empty_tally()
+            for band_tally in tallies:
+                for flow, amount in band_tally.items():
+                    tally[flow] += amount
+            tally['truncated'] += truncated
+
+        if metrics:
+            self.metrics.count(tally)
+            self.metrics.change(np.subtract(self.liquid[changed], previous, dtype=np.float64), (changed, slice(None)))
+
+        if self.correction is not None:
+            self._correct(self.correction.finish(tally))
+        self._awake_counts += self.tiles.awake
+
+        if self.profiler.enabled:
+            self.profiler.lap('apply_diffs', start)
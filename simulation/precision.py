@@ -0,0 +1,87 @@
+from typing import Callable
+
+import numpy as np
+
+from config import LIQUID_MIN, PRECISION_CORRECTION_INTERVAL
+
+# Floating point types the liquid of the array engines can be stored in
+PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+
+
+def liquid_dtype(precision: str) -> np.dtype:
+    """Returns the floating point type of the liquid for a precision, see `PRECISIONS`."""
+
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {', '.join(PRECISIONS)}")
+
+    return np.dtype(PRECISIONS[precision])
+
+
+def spread_correction(fields: list[tuple[np.ndarray, np.ndarray]], amount: float) -> float:
+    """
+    Adds the amount of liquid to the given (liquid, settled) arrays, spread over their wet cells which aren't settled in
+    proportion to their liquid, or over all of their wet cells if none of them are moving. Returns how much was added,
+    which rounding makes differ from the amount.
+    """
+
+    masks = [(liquid >= LIQUID_MIN) & ~settled for liquid, settled in fields]
+    if not any(mask.any() for mask in masks):
+        masks = [liquid >= LIQUID_MIN for liquid, _ in fields]
+
+    total = sum(float(liquid[mask].sum(dtype=np.float64)) for (liquid, _), mask in zip(fields, masks))
+    if total <= 0:
+        return 0.0
+
+    # The share of every cell is computed in double precision, only adding it rounds
+    added = 0.0
+    for (liquid, _), mask in zip(fields, masks):
+        previous = liquid[mask]
+        corrected = previous + (previous * (amount / total)).astype(liquid.dtype)
+        liquid[mask] = corrected
+        added += float(np.subtract(corrected, previous, dtype=np.float64).sum())
+
+    return added
+
+
+class MassCorrection:
+    """
+    Keeps the total liquid of a single precision grid from drifting because of rounding.
+
+    Every step adds the liquid its sources poured in, its drains took out and its leftovers dropped to a double
+    precision reference total, and every `interval` steps the difference between the reference and the actual total is
+    spread back over the moving liquid with `spread_correction`. What rounding keeps it from putting back is left for
+    the next correction, so the relative error of the total stays within about 1e-7. Edits drop the reference, and the
+    next step starts a new one from the total they left behind.
+    """
+
+    def __init__(self, total: Callable[[], float], interval: int = PRECISION_CORRECTION_INTERVAL):
+        self._total = total
+        self.interval = interval
+        self.reference: float | None = None
+
+        # Liquid put back so far, positive when rounding lost liquid
+        self.corrected = 0.0
+        self._steps = 0
+
+    def invalidate(self):
+        """Drops the reference total, after an edit changed the liquid."""
+
+        self.reference = None
+
+    def start(self):
+        """Counts the reference total before a step, if an edit dropped it."""
+
+        if self.reference is None:
+            self.reference = self._total()
+            self._steps = 0
+
+    def finish(self, tally: dict[str, float]) -> float:
+        """Adds the flows of the step to the reference. Returns the liquid to put back when a correction is due."""
+
+        self.reference += tally['inflow'] - tally['outflow'] - tally['truncated']
+        self._steps += 1
+        if self._steps < self.interval:
+            return 0.0
+
+        self._steps = 0
+        return self.reference - self._total()
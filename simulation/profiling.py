@@ -0,0 +1,72 @@
+from collections import defaultdict
+from time import perf_counter
+
+# Phases of a step, in the order they run
+PHASES = (
+    'sources_drains',
+    'flow_bottom',
+    'flow_left',
+    'flow_right',
+    'flow_top',
+    'settle',
+    'apply_diffs',
+    'display',
+)
+
+COUNTS = (
+    'active_cells',
+    'settled_cells',
+    'flow_events',
+)
+
+
+class Profiler:
+    """
+    Accumulates the wall time spent in every phase of the simulation steps and counts of what happened in them.
+
+    The engines only look at the profiler when it is enabled, so leaving one attached costs a single check per step.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.steps = 0
+        self.times: dict[str, float] = defaultdict(float)
+        self.counts: dict[str, int] = defaultdict(int)
+
+    def reset(self):
+        """Clears the collected stats."""
+
+        self.steps = 0
+        self.times.clear()
+        self.counts.clear()
+
+    def lap(self, phase: str, start: float) -> float:
+        """Adds the time since `start` to the phase. Returns the current time, to start timing the next phase from."""
+
+        now = perf_counter()
+        self.times[phase] += now - start
+        return now
+
+    def count(self, name: str, amount: int):
+        """Adds to one of the counts."""
+
+        self.counts[name] += int(amount)
+
+    def stats(self) -> dict:
+        """Returns the total and per step time of every phase and the per step counts since the last reset."""
+
+        steps = self.steps or 1
+        return {
+            'steps': self.steps,
+            'times': {phase: self.times[phase] for phase in PHASES},
+            'times_per_step': {phase: self.times[phase] / steps for phase in PHASES},
+            'counts_per_step': {name: self.counts[name] / steps for name in COUNTS},
+        }
+
+    def summary(self) -> list[str]:
+        """Returns the stats as lines of text."""
+
+        stats = self.stats()
+        lines = [f"{phase}: {seconds * 1000:.3f} ms" for phase, seconds in stats['times_per_step'].items()]
+        lines += [f"{name}: {count:.0f}" for name, count in stats['counts_per_step'].items()]
+        return lines
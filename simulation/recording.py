@@ -0,0 +1,140 @@
+import mmap
+import os
+import struct
+import zlib
+from typing import Iterator
+
+import numpy as np
+
+# State arrays stored in every frame of a recording, enough to render it
+RECORDED_FIELDS = ('liquid', 'types', 'flowing_down')
+
+MAGIC = b'SSDR'
+VERSION = 1
+
+# Magic, version, height, width, then the dtype of every recorded field
+_HEADER = struct.Struct('<4sHII' + '8s' * len(RECORDED_FIELDS))
+# Cycle, then the compressed size of every recorded field
+_FRAME = struct.Struct('<q' + 'I' * len(RECORDED_FIELDS))
+
+
+class StateRecorder:
+    """
+    Streams the simulation state to an append-only file while recording, one compressed frame at a time.
+
+    Nothing but the frame being written is kept in memory, so recordings can be as long as the disk allows. The file
+    is read back with `StateRecording`, and rendered to images as a separate step.
+    """
+
+    def __init__(self, filename: str, frequency: int = 1, level: int = 1):
+        self._filename = filename
+        self._frequency = frequency
+        self._level = level
+        self._file = None
+        self.frames = 0
+
+    def start(self):
+        self.stop()
+        self._file = open(self._filename, 'wb')
+        self.frames = 0
+
+    def stop(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def record(self, state: dict[str, np.ndarray], cycle: int):
+        """Appends the recorded fields of the state, on every `frequency`-th cycle."""
+
+        if self._file is None or cycle % self._frequency != 0:
+            return
+
+        arrays = [np.ascontiguousarray(state[name]) for name in RECORDED_FIELDS]
+        if self.frames == 0:
+            height, width = arrays[0].shape
+            self._file.write(_HEADER.pack(MAGIC, VERSION, height, width, *(a.dtype.str.encode() for a in arrays)))
+
+        payloads = [zlib.compress(array.data, self._level) for array in arrays]
+        self._file.write(_FRAME.pack(cycle, *map(len, payloads)))
+        for payload in payloads:
+            self._file.write(payload)
+        self.frames += 1
+
+
+class StateRecording:
+    """
+    Reads a file written by `StateRecorder`.
+
+    The file is memory-mapped and only the frame headers are read up front, so frames are decompressed one at a time
+    as they are accessed. A frame cut short, e.g. by a crash while recording, is ignored, and a recording stopped
+    before its first frame opens with no frames and no `shape`.
+    """
+
+    def __init__(self, filename: str):
+        self.shape: tuple[int, int] | None = None
+        self.dtypes: dict[str, np.dtype] = {}
+        self.cycles: list[int] = []
+        self._offsets: list[tuple[int, list[int]]] = []
+        self._map: mmap.mmap | None = None
+
+        # The header is only written along with the first frame
+        if os.path.getsize(filename) < _HEADER.size:
+            return
+        with open(filename, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, height, width, *dtypes = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a simulation recording")
+        if version != VERSION:
+            raise ValueError(f"Unsupported recording version {version}")
+
+        self.shape = (height, width)
+        self.dtypes = {name: np.dtype(dtype.rstrip(b'\0').decode()) for name, dtype in zip(RECORDED_FIELDS, dtypes)}
+
+        offset = _HEADER.size
+        while offset + _FRAME.size <= len(self._map):
+            cycle, *sizes = _FRAME.unpack_from(self._map, offset)
+            end = offset + _FRAME.size + sum(sizes)
+            if end > len(self._map):
+                break
+            self.cycles.append(cycle)
+            self._offsets.append((offset + _FRAME.size, sizes))
+            offset = end
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> dict[str, np.ndarray]:
+        """Returns the recorded fields of the frame."""
+
+        offset, sizes = self._offsets[index]
+        state = {}
+        for (name, dtype), size in zip(self.dtypes.items(), sizes):
+            data = zlib.decompress(self._map[offset:offset + size])
+            state[name] = np.frombuffer(data, dtype=dtype).reshape(self.shape)
+            offset += size
+        return state
+
+    def __iter__(self) -> Iterator[tuple[int, dict[str, np.ndarray]]]:
+        """Yields the cycle and the recorded fields of every frame."""
+
+        for index, cycle in enumerate(self.cycles):
+            yield cycle, self[index]
@@ -0,0 +1,74 @@
+import numpy as np
+
+# A set of cells of the grid: a boolean mask shaped like the grid, or a (rows, columns) index made of ints, slices or
+# index arrays, e.g. `rect(...)` or `(xs, ys)`
+Region = np.ndarray | tuple
+
+
+def rect(x0: int, x1: int, y0: int, y1: int) -> tuple[slice, slice]:
+    """Returns the region of the cells in rows `[x0, x1)` and columns `[y0, y1)`."""
+
+    return slice(x0, x1), slice(y0, y1)
+
+
+def region_mask(region: Region, shape: tuple[int, int]) -> np.ndarray:
+    """Returns the region as a boolean mask of the given shape."""
+
+    if isinstance(region, np.ndarray) and region.dtype == bool:
+        if region.shape != shape:
+            raise ValueError(f"Expected a mask of shape {shape}, got {region.shape}")
+        return region
+
+    mask = np.zeros(shape, dtype=bool)
+    mask[tuple(region)] = True
+    return mask
+
+
+def region_blocks(region: Region, shape: tuple[int, int], size: int) -> dict[tuple[int, int], np.ndarray]:
+    """
+    Returns the region split into the square blocks of `size` by `size` cells it touches, as the row and column of every
+    block mapped to a mask of its cells, without building a mask of the whole grid.
+    """
+
+    if isinstance(region, np.ndarray) and region.dtype == bool:
+        xs, ys = np.nonzero(region_mask(region, shape))
+    else:
+        rows, cols = (np.arange(length)[index] for index, length in zip(tuple(region), shape))
+        if isinstance(region[0], slice) or isinstance(region[1], slice):
+            # Slices pick every combination of their rows and columns, which only needs to be split along each axis
+            return _outer_blocks(np.atleast_1d(rows).ravel(), np.atleast_1d(cols).ravel(), size)
+        xs, ys = (array.ravel() for array in np.broadcast_arrays(rows, cols))
+
+    blocks = {}
+    keys = xs // size * -(-shape[1] // size) + ys // size
+    order = np.argsort(keys, kind='stable')
+    xs, ys, keys = xs[order], ys[order], keys[order]
+    starts = np.flatnonzero(np.diff(keys, prepend=-1))
+    for start, stop in zip(starts.tolist(), [*starts[1:].tolist(), len(keys)]):
+        block = np.zeros((size, size), dtype=bool)
+        block[xs[start:stop] % size, ys[start:stop] % size] = True
+        blocks[(int(xs[start]) // size, int(ys[start]) // size)] = block
+    return blocks
+
+
+def _outer_blocks(rows: np.ndarray, cols: np.ndarray, size: int) -> dict[tuple[int, int], np.ndarray]:
+    """Returns the blocks of every combination of the rows and the columns, see `region_blocks`."""
+
+    row_groups = {int(row): rows[rows // size == row] % size for row in np.unique(rows // size)}
+    col_groups = {int(col): cols[cols // size == col] % size for col in np.unique(cols // size)}
+
+    blocks = {}
+    for row, local_rows in row_groups.items():
+        for col, local_cols in col_groups.items():
+            block = np.zeros((size, size), dtype=bool)
+            block[np.ix_(local_rows, local_cols)] = True
+            blocks[(row, col)] = block
+    return blocks
+
+
+def region_values(value: float | np.ndarray, mask: np.ndarray) -> float | np.ndarray:
+    """Returns the values for the cells of the mask, from a single value or an array shaped like the grid."""
+
+    if np.ndim(value) == 0:
+        return value
+    return np.broadcast_to(value, mask.shape)[mask]
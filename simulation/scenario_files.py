@@ -0,0 +1,226 @@
+import json
+import os
+
+import numpy as np
+
+from .kernel import BLANK, SOLID, SOURCE, DRAIN, spread_to_neighbors
+from .simulation import Simulation
+from .vectorized import VectorizedSimulation
+from config import LIQUID_MAX, WALL_COLOR, SOURCE_COLOR, DRAIN_COLOR, WATER_COLOR
+
+# Simulation attributes a scenario file may set
+PARAMETERS = ('compression_max', 'flow_speed', 'iterations_per_frame', 'source_rate', 'drain_rate')
+
+# Settings of an individual emitter a scenario file may set
+EMITTER_SETTINGS = ('rate', 'period', 'duty')
+
+CELL_TYPE_NAMES = {'blank': BLANK, 'solid': SOLID, 'source': SOURCE, 'drain': DRAIN}
+
+# Characters of an ASCII map, with the cell type and liquid they stand for
+ASCII_LEGEND = {
+    '.': (BLANK, 0.0),
+    ' ': (BLANK, 0.0),
+    '#': (SOLID, 0.0),
+    'S': (SOURCE, 0.0),
+    'D': (DRAIN, 0.0),
+    '~': (BLANK, LIQUID_MAX),
+}
+
+# Colours of an image map, with the cell type and liquid they stand for. Any other colour is a blank cell.
+IMAGE_PALETTE = {
+    WALL_COLOR: (SOLID, 0.0),
+    SOURCE_COLOR: (SOURCE, 0.0),
+    DRAIN_COLOR: (DRAIN, 0.0),
+    WATER_COLOR: (BLANK, LIQUID_MAX),
+}
+
+IMAGE_EXTENSIONS = ('.png', '.bmp', '.tga', '.gif', '.jpg', '.jpeg')
+
+
+class Scenario:
+    """
+    A starting state for a simulation: the grid's cell types and liquid, the simulation parameters to use and the
+    settings of individual emitters, see `Emitters.configure`.
+
+    Scenarios are loaded from files with `load_scenario` and can be called on a simulation like the built-in
+    scenarios of `simulation.scenarios`.
+    """
+
+    def __init__(
+            self,
+            types: np.ndarray,
+            liquid: np.ndarray,
+            parameters: dict | None = None,
+            emitters: list[dict] | None = None,
+            name: str = ''
+    ):
+        self.types = types
+        self.liquid = liquid
+        self.parameters = parameters or {}
+        self.emitters = emitters or []
+        self.name = name
+
+    @property
+    def height(self) -> int:
+        return self.types.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.types.shape[1]
+
+    def state(self) -> dict[str, np.ndarray]:
+        """Returns the scenario as a simulation state, unsettled where it was edited like the bulk edits would."""
+
+        typed = self.types != BLANK
+        return {
+            'liquid': self.liquid.astype(np.float64),
+            'types': self.types.astype(np.int8),
+            'settled': ~((self.liquid != 0) | typed | spread_to_neighbors(typed)),
+            'settle_count': np.zeros(self.types.shape, dtype=np.int16),
+            'flowing_down': np.zeros(self.types.shape, dtype=bool),
+        }
+
+    def apply(self, simulation: Simulation | VectorizedSimulation):
+        """Loads the scenario into a simulation with a grid of the same size."""
+
+        simulation.load_state(self.state())
+        for name, value in self.parameters.items():
+            setattr(simulation, name, value)
+        for emitter in self.emitters:
+            settings = {key: emitter[key] for key in EMITTER_SETTINGS if key in emitter}
+            simulation.emitters.configure(*emitter['at'], **settings)
+
+    def __call__(self, simulation: Simulation | VectorizedSimulation):
+        self.apply(simulation)
+
+    def create(self, simulation_class: type = VectorizedSimulation, **kwargs):
+        """Creates a simulation of the given class, sized like the scenario, and loads the scenario into it."""
+
+        simulation = simulation_class(self.width, self.height, **kwargs)
+        self.apply(simulation)
+        return simulation
+
+
+def _lookup_tables(legend: dict, size: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns tables mapping the legend's keys to cell types and liquid, and which keys are known."""
+
+    types = np.zeros(size, dtype=np.int8)
+    liquid = np.zeros(size)
+    known = np.zeros(size, dtype=bool)
+    for key, (_type, amount) in legend.items():
+        types[key] = _type
+        liquid[key] = amount
+        known[key] = True
+    return types, liquid, known
+
+
+def parse_ascii(lines: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the cell types and liquid of an ASCII map, see `ASCII_LEGEND`. Short lines are padded with blanks."""
+
+    width = max((len(line) for line in lines), default=0)
+    data = ''.join(line.ljust(width, '.') for line in lines).encode('ascii')
+    codes = np.frombuffer(data, dtype=np.uint8).reshape(len(lines), width)
+
+    types, liquid, known = _lookup_tables({ord(char): value for char, value in ASCII_LEGEND.items()}, 256)
+    if not known[codes].all():
+        unknown = sorted({chr(code) for code in np.unique(codes[~known[codes]])})
+        raise ValueError(f"Unknown characters in the map: {''.join(unknown)!r}")
+
+    return types[codes], liquid[codes]
+
+
+def load_ascii(path: str) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the cell types and liquid of an ASCII map file."""
+
+    with open(path) as file:
+        return parse_ascii(file.read().splitlines())
+
+
+def load_image(path: str) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the cell types and liquid of an image, one cell per pixel, see `IMAGE_PALETTE`."""
+
+    import pygame as pg  # Only needed for images, so the rest of the simulation works without it
+
+    pixels = pg.surfarray.array3d(pg.image.load(path)).transpose(1, 0, 2).astype(np.uint32)
+    colors = (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+
+    types = np.zeros(colors.shape, dtype=np.int8)
+    liquid = np.zeros(colors.shape)
+    for (r, g, b), (_type, amount) in IMAGE_PALETTE.items():
+        match = colors == ((r << 16) | (g << 8) | b)
+        types[match] = _type
+        liquid[match] = amount
+
+    return types, liquid
+
+
+def load_layout(path: str) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the cell types and liquid of an image or an ASCII map file, told apart by the extension."""
+
+    if path.lower().endswith(IMAGE_EXTENSIONS):
+        return load_image(path)
+    return load_ascii(path)
+
+
+def load_scenario(path: str) -> Scenario:
+    """
+    Loads a scenario from a JSON scenario file, or from a bare image or ASCII map. A scenario file looks like this,
+    with every key optional as long as the grid size follows from `layout`, `map` or `width` and `height`:
+
+        {
+            "layout": "level.png",
+            "map": ["#......#", "#~~~~~~#", "########"],
+            "width": 128,
+            "height": 64,
+            "cells": [{"type": "source", "rect": [x0, x1, y0, y1]}],
+            "liquid": [{"rect": [x0, x1, y0, y1], "amount": 1.0}],
+            "parameters": {"flow_speed": 0.9, "source_rate": 0.2},
+            "emitters": [{"at": [x, y], "rate": 0.5, "period": 100, "duty": 20}]
+        }
+
+    `layout` is an image or ASCII map file relative to the scenario file and `map` an inline ASCII map; `cells` and
+    `liquid` are applied on top of them, in order. Rects span rows `[x0, x1)` and columns `[y0, y1)`. `emitters` sets
+    the rate and schedule of individual sources and drains.
+    """
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    if not path.lower().endswith('.json'):
+        types, liquid = load_layout(path)
+        return Scenario(types, liquid, name=name)
+
+    with open(path) as file:
+        spec = json.load(file)
+
+    if 'layout' in spec:
+        types, liquid = load_layout(os.path.join(os.path.dirname(path), spec['layout']))
+    elif 'map' in spec:
+        types, liquid = parse_ascii(spec['map'])
+    elif 'width' in spec and 'height' in spec:
+        types = np.zeros((spec['height'], spec['width']), dtype=np.int8)
+        liquid = np.zeros((spec['height'], spec['width']))
+    else:
+        raise ValueError(f"{path} defines neither a layout, a map nor the grid size")
+
+    for cells in spec.get('cells', []):
+        x0, x1, y0, y1 = cells['rect']
+        _type = CELL_TYPE_NAMES[cells['type']]
+        types[x0:x1, y0:y1] = _type
+        if _type != BLANK:
+            liquid[x0:x1, y0:y1] = 0
+
+    for pool in spec.get('liquid', []):
+        x0, x1, y0, y1 = pool['rect']
+        liquid[x0:x1, y0:y1] = np.where(types[x0:x1, y0:y1] == BLANK, pool['amount'], 0)
+
+    parameters = spec.get('parameters', {})
+    unknown = set(parameters) - set(PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown parameters in {path}: {', '.join(sorted(unknown))}")
+
+    emitters = spec.get('emitters', [])
+    for emitter in emitters:
+        x, y = emitter['at']
+        if not (0 <= x < types.shape[0] and 0 <= y < types.shape[1]) or types[x, y] not in (SOURCE, DRAIN):
+            raise ValueError(f"Emitter at ({x}, {y}) in {path} is neither a source nor a drain")
+
+    return Scenario(types, liquid, parameters, emitters, name=name)
@@ -0,0 +1,94 @@
+import os
+from typing import Callable
+
+from .cell import CellType
+from .regions import rect
+from .scenario_files import Scenario, load_scenario
+from .simulation import Simulation
+from .vectorized import VectorizedSimulation
+
+AnySimulation = Simulation | VectorizedSimulation
+
+
+def _fill_walls(simulation: AnySimulation, x0: int, x1: int, y0: int, y1: int):
+    simulation.set_cell_types(rect(x0, x1, y0, y1), CellType.SOLID)
+
+
+def dam_break(simulation: AnySimulation):
+    """A column of water filling the left third of the grid, free to collapse to the right."""
+
+    height, width = simulation.cells.shape
+    simulation.add_liquid_region(rect(height // 3, height, 0, width // 3), 1.0)
+
+
+def basin_fill(simulation: AnySimulation):
+    """A source pouring water into an open-topped basin."""
+
+    height, width = simulation.cells.shape
+    _fill_walls(simulation, height - 2, height - 1, width // 4, 3 * width // 4)
+    _fill_walls(simulation, height // 2, height - 1, width // 4, width // 4 + 1)
+    _fill_walls(simulation, height // 2, height - 1, 3 * width // 4 - 1, 3 * width // 4)
+    simulation.set_cell_type(2, width // 2, CellType.SOURCE)
+
+
+def pipeline(simulation: AnySimulation):
+    """Sources feeding a horizontal pipe which leads to drains at its other end."""
+
+    height, width = simulation.cells.shape
+    middle = height // 2
+    _fill_walls(simulation, middle - 2, middle - 1, 0, width)
+    _fill_walls(simulation, middle + 2, middle + 3, 0, width)
+    simulation.place_sources(rect(middle - 1, middle + 2, 0, 1))
+    simulation.place_drains(rect(middle - 1, middle + 2, width - 1, width))
+
+
+def u_tube(simulation: AnySimulation):
+    """A U-shaped tube with one arm filled with water, which pressure pushes up the other arm."""
+
+    height, width = simulation.cells.shape
+    top, bottom = height // 4, height - 2
+    left, right = width // 4, 3 * width // 4
+    arm = max((right - left) // 5, 1)
+
+    _fill_walls(simulation, bottom, bottom + 1, left, right)
+    _fill_walls(simulation, top, bottom, left, left + 1)
+    _fill_walls(simulation, top, bottom, right - 1, right)
+    _fill_walls(simulation, top, bottom - 1, left + arm + 1, right - arm - 1)
+
+    simulation.add_liquid_region(rect(top, bottom, left + 1, left + arm + 1), 1.0)
+
+
+def idle(simulation: AnySimulation):
+    """Still pools of water resting on shelves, which settle within a few steps and never move again."""
+
+    height, width = simulation.cells.shape
+    for floor in range(height - 1, height // 2, -4):
+        _fill_walls(simulation, floor, floor + 1, 0, width)
+        simulation.add_liquid_region(rect(floor - 1, floor, 0, width), 1.0)
+
+
+SCENARIOS: dict[str, Callable[[AnySimulation], None]] = {
+    'dam_break': dam_break,
+    'basin_fill': basin_fill,
+    'pipeline': pipeline,
+    'u_tube': u_tube,
+    'idle': idle,
+}
+
+
+def get_scenario(name: str) -> Callable[[AnySimulation], None]:
+    """Returns the built-in scenario of that name, or loads the scenario file at that path."""
+
+    if name in SCENARIOS:
+        return SCENARIOS[name]
+    if not os.path.exists(name):
+        raise ValueError(f"{name} is neither a built-in scenario ({', '.join(SCENARIOS)}) nor a scenario file")
+    return load_scenario(name)
+
+
+def scenario_size(scenario: Callable[[AnySimulation], None], width: int, height: int) -> tuple[int, int]:
+    """Returns the grid size a scenario needs, which is fixed for scenario files and up to the caller otherwise."""
+
+    if isinstance(scenario, Scenario):
+        return scenario.width, scenario.height
+    return width, height
@@ -0,0 +1,73 @@
+from time import perf_counter
+
+from .simulation import Simulation
+from .vectorized import VectorizedSimulation
+from config import SIMULATION_TIME_BUDGET, MAX_ITERATIONS_PER_FRAME
+
+# Seconds over which the effective steps per second are measured
+RATE_WINDOW = 1.0
+
+
+class StepScheduler:
+    """
+    Picks how many steps to run per frame so that they take about `budget` seconds.
+
+    The cost of a step is tracked as an exponential moving average, and the number of steps only changes once the
+    number that fits the budget differs from it by more than the `hysteresis` fraction, so that it doesn't flip back
+    and forth between two values on every frame.
+    """
+
+    def __init__(
+            self,
+            budget: float = SIMULATION_TIME_BUDGET,
+            min_steps: int = 1,
+            max_steps: int = MAX_ITERATIONS_PER_FRAME,
+            hysteresis: float = 0.25,
+            smoothing: float = 0.2
+    ):
+        self.budget = budget
+        self.min_steps = min_steps
+        self.max_steps = max_steps
+        self.hysteresis = hysteresis
+        self.smoothing = smoothing
+
+        self.steps = min_steps
+        self.step_time: float | None = None
+
+        # Simulated steps per second of wall time, including the time spent outside of the steps
+        self.steps_per_second = 0.0
+        self._window_start = perf_counter()
+        self._window_steps = 0
+
+    def update(self, steps: int, elapsed: float):
+        """Feeds back that `steps` steps took `elapsed` seconds and picks the number of steps for the next frame."""
+
+        now = perf_counter()
+        self._window_steps += steps
+        if now - self._window_start >= RATE_WINDOW:
+            self.steps_per_second = self._window_steps / (now - self._window_start)
+            self._window_start = now
+            self._window_steps = 0
+
+        if steps == 0:
+            return
+
+        cost = elapsed / steps
+        if self.step_time is None:
+            self.step_time = cost
+        else:
+            self.step_time += self.smoothing * (cost - self.step_time)
+
+        target = self.budget / self.step_time if self.step_time > 0 else self.max_steps
+        if abs(target - self.steps) > self.hysteresis * self.steps:
+            self.steps = int(min(max(target, self.min_steps), self.max_steps))
+
+    def run(self, simulation: Simulation | VectorizedSimulation) -> int:
+        """Runs as many steps as fit the budget. Returns how many were run."""
+
+        steps = self.steps
+        start = perf_counter()
+        for _ in range(steps):
+            simulation.step()
+        self.update(steps, perf_counter() - start)
+        return steps
@@ -1,6 +1,17 @@
+import gc
+from contextlib import contextmanager
+from itertools import repeat
+from time import perf_counter
+
 import numpy as np
 
 from .cell import Cell, CellType, CellGrid
+from .emitters import Emitters
+from .kernel import DEFAULT_RULE, FlowRule, get_rule, spread_to_neighbors
+from .metrics import Metrics, empty_tally
+from .regions import Region, region_mask
+from .tiles import split_into_tiles
+from .profiling import Profiler
 from config import (
     WIDTH,
     HEIGHT,
@@ -12,38 +23,77 @@ from config import (
     COMPRESSION_MAX,
     ITERATIONS_PER_FRAME,
     SOURCE_LIQUID_PER_ITERATION,
-    DRAIN_LIQUID_PER_ITERATION
+    DRAIN_LIQUID_PER_ITERATION,
+    TILE_SIZE,
+    PROFILING
 )
 
 
+@contextmanager
+def _paused_gc():
+    """Pauses the garbage collector, which would otherwise scan the grid over and over while its cells are created."""
+
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
 class Simulation:
-    def __init__(self):
-        self.cells: CellGrid = np.array(
-            [[Cell(x, y, CellType.BLANK) for y in range(WIDTH)] for x in range(HEIGHT)],
-            dtype=Cell
-        )
-        self.diffs = np.zeros((HEIGHT, WIDTH))
-        for cell in self.cells.flatten():
-            self._init_cell_neighbors(cell)
+    def __init__(self, width: int = WIDTH, height: int = HEIGHT, precision: str = 'float64',
+                 rule: str | FlowRule = 'default'):
+        # The cells hold Python floats, so `PRECISION` only applies to the array engines
+        if precision != 'float64':
+            raise ValueError(f"The cell engine only supports the float64 precision, got {precision!r}")
+        # The cells flow one by one following the default rules, and `FLOW_RULE` only applies to the array engines
+        if get_rule(rule) is not DEFAULT_RULE:
+            raise ValueError(f"The cell engine only supports the default flow rule, got {rule!r}")
+
+        self.width = width
+        self.height = height
+        with _paused_gc():
+            self.cells = self._create_cells(width, height)
+            self.tiles = split_into_tiles(self.cells, TILE_SIZE)
+        self.diffs = np.zeros((height, width))
+        # How many times every tile was awake at the start or the end of a step, see `awake_counts`
+        self._awake_counts = np.zeros((len(self.tiles), len(self.tiles[0])), dtype=np.int64)
+
+        self.emitters = Emitters(height, width)
+        self.profiler = Profiler(PROFILING)
+        self.metrics = Metrics(lambda: self.state()['liquid'])
+        self._tally: dict[str, float] | None = None
+        self._profiler: Profiler | None = None
+        # The liquid the drains take from each cell during the current step
+        self._drained: dict[tuple[int, int], float] = {}
 
         self.compression_max = COMPRESSION_MAX
         self.flow_speed = FLOW_SPEED
         self.iterations_per_frame = ITERATIONS_PER_FRAME
+        self.source_rate = SOURCE_LIQUID_PER_ITERATION
+        self.drain_rate = DRAIN_LIQUID_PER_ITERATION
+        self.rule = DEFAULT_RULE
 
-    def _init_cell_neighbors(self, cell: Cell):
-        """Initializes the neighbors of a cell."""
+    @staticmethod
+    def _create_cells(width: int, height: int) -> CellGrid:
+        """Creates a grid of blank cells, linking the neighbours by pairing whole shifted slices of the grid."""
 
-        if cell.x - 1 >= 0:
-            cell.top = self.cells[cell.x - 1, cell.y]
+        xs = np.repeat(np.arange(height), width).tolist()
+        ys = np.tile(np.arange(width), height).tolist()
+        cells = np.empty((height, width), dtype=object)
+        cells.ravel()[:] = list(map(Cell, xs, ys, repeat(CellType.BLANK)))
 
-        if cell.x + 1 < HEIGHT:
-            cell.bottom = self.cells[cell.x + 1, cell.y]
+        for cell, bottom in zip(cells[:-1].ravel().tolist(), cells[1:].ravel().tolist()):
+            cell.bottom = bottom
+            bottom.top = cell
 
-        if cell.y - 1 >= 0:
-            cell.left = self.cells[cell.x, cell.y - 1]
+        for cell, right in zip(cells[:, :-1].ravel().tolist(), cells[:, 1:].ravel().tolist()):
+            cell.right = right
+            right.left = cell
 
-        if cell.y + 1 < WIDTH:
-            cell.right = self.cells[cell.x, cell.y + 1]
+        return cells
 
     def _calculate_vertical_flow_value(self, remaining_liquid: float, destination: Cell):
         """Calculates how much liquid the destination cell can take."""
@@ -63,17 +113,17 @@ class Simulation:
 
         return min(max(flow, 0), min(FLOW_MAX, remaining_liquid))
 
-    def _flow_bottom(self, cell: Cell) -> float:
+    def _flow_bottom(self, cell: Cell, remaining_liquid: float) -> float:
         """Flows the liquid to the bottom cell."""
 
         if cell.bottom is None or cell.bottom.type != CellType.BLANK:
             return 0
 
-        flow = self._calculate_vertical_flow_value(cell.liquid, cell.bottom) - cell.bottom.liquid
+        flow = self._calculate_vertical_flow_value(remaining_liquid, cell.bottom) - cell.bottom.liquid
         if cell.bottom.liquid > 0 and flow > FLOW_MIN:
             flow *= self.flow_speed
 
-        flow = self._constrain_flow(flow, cell.liquid)
+        flow = self._constrain_flow(flow, remaining_liquid)
 
         if flow:
             self.diffs[cell.x, cell.y] -= flow
@@ -140,165 +190,339 @@ class Simulation:
 
         return flow
 
-    def _handle_source(self, source: Cell):
-        """Handles a source cell."""
-
-        cells_to_flow = []
-
-        if source.top and source.top.type == CellType.BLANK:
-            cells_to_flow.append(source.top)
-
-        if source.bottom and source.bottom.type == CellType.BLANK:
-            cells_to_flow.append(source.bottom)
-
-        if source.left and source.left.type == CellType.BLANK:
-            cells_to_flow.append(source.left)
-
-        if source.right and source.right.type == CellType.BLANK:
-            cells_to_flow.append(source.right)
+    def _is_blank(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Returns which of the given cells are blank."""
 
-        liquid_each_cell = SOURCE_LIQUID_PER_ITERATION / (len(cells_to_flow) or 1)
-
-        for cell in cells_to_flow:
-            cell.settled = False
-            self.diffs[cell.x, cell.y] += liquid_each_cell
-
-    def _handle_drain(self, drain: Cell):
-        """Handles a drain cell."""
-
-        cells_to_flow = []
-
-        if drain.top and drain.top.type == CellType.BLANK:
-            cells_to_flow.append(drain.top)
-
-        if drain.bottom and drain.bottom.type == CellType.BLANK:
-            cells_to_flow.append(drain.bottom)
-
-        if drain.left and drain.left.type == CellType.BLANK:
-            cells_to_flow.append(drain.left)
-
-        if drain.right and drain.right.type == CellType.BLANK:
-            cells_to_flow.append(drain.right)
-
-        liquid_each_cell = DRAIN_LIQUID_PER_ITERATION / (len(cells_to_flow) or 1)
+        return np.array(
+            [self.cells[x, y].type == CellType.BLANK for x, y in zip(xs.tolist(), ys.tolist())], dtype=bool
+        )
 
-        for cell in cells_to_flow:
+    def _handle_emitters(self):
+        """
+        Pours liquid out of the active sources and into the active drains, all in one batch from the registry. The
+        drains take at most the liquid a cell has, and nothing from the leftovers about to be dropped.
+        """
+
+        self._drained = {}
+        emitters = self.emitters.batch(self._is_blank, self.source_rate, self.drain_rate)
+        for x, y, share, source in zip(
+            emitters.x.tolist(), emitters.y.tolist(), emitters.share.tolist(), emitters.source.tolist()
+        ):
+            cell = self.cells[x, y]
             cell.settled = False
-            self.diffs[cell.x, cell.y] -= min(liquid_each_cell, cell.liquid)
+            cell.wake()
+            if source:
+                self.diffs[x, y] += share
+                if self._tally is not None:
+                    self._tally['inflow'] += share
+            elif cell.liquid >= LIQUID_MIN:
+                self._drained[x, y] = self._drained.get((x, y), 0) + share
+
+        for (x, y), requested in self._drained.items():
+            amount = min(requested, self.cells[x, y].liquid)
+            self._drained[x, y] = amount
+            self.diffs[x, y] -= amount
+            if self._tally is not None:
+                self._tally['outflow'] += amount
 
     def add_liquid(self, x: int, y: int, amount: float):
         """Adds liquid to the target cell."""
 
         self.cells[x, y].add_liquid(amount)
+        if self.metrics.enabled:
+            self.metrics.change_cell(x, y, amount, edit=True)
 
     def set_cell_type(self, x: int, y: int, _type: CellType):
         """Sets the type of the target cell."""
 
+        if self.metrics.enabled and _type != CellType.BLANK:
+            self.metrics.change_cell(x, y, -self.cells[x, y].liquid, edit=True)
         self.cells[x, y].set_type(_type)
+        self.emitters.update(x, y, _type.value)
+
+    def set_cell_types(self, region: Region, _type: CellType):
+        """Sets the type of every cell in the region, then unsettles their neighbours in one pass."""
+
+        mask = region_mask(region, self.cells.shape)
+        self.emitters.update_mask(mask, _type.value, np.array([cell.type.value for cell in self.cells[mask]]))
+        for cell in self.cells[mask]:
+            cell.type = _type
+            if _type != CellType.BLANK:
+                if self.metrics.enabled and cell.liquid:
+                    self.metrics.change_cell(cell.x, cell.y, -cell.liquid, edit=True)
+                cell.liquid = 0
+            cell.wake()
+
+        for cell in self.cells[spread_to_neighbors(mask)]:
+            cell.unsettle()
+
+    def place_sources(self, region: Region):
+        """Turns every cell in the region into a source."""
+
+        self.set_cell_types(region, CellType.SOURCE)
+
+    def place_drains(self, region: Region):
+        """Turns every cell in the region into a drain."""
+
+        self.set_cell_types(region, CellType.DRAIN)
+
+    def add_liquid_region(self, region: Region, amount: float | np.ndarray):
+        """Adds liquid to every cell in the region, either the same amount or one per cell from a grid-shaped array."""
+
+        mask = region_mask(region, self.cells.shape)
+        for cell, value in zip(self.cells[mask], np.broadcast_to(amount, mask.shape)[mask].tolist()):
+            cell.add_liquid(value)
+            if self.metrics.enabled:
+                self.metrics.change_cell(cell.x, cell.y, value, edit=True)
+
+    def set_liquid_region(self, region: Region, amount: float | np.ndarray):
+        """Sets the liquid of every cell in the region, then unsettles them and their neighbours in one pass."""
+
+        mask = region_mask(region, self.cells.shape)
+        for cell, value in zip(self.cells[mask], np.broadcast_to(amount, mask.shape)[mask].tolist()):
+            if self.metrics.enabled:
+                self.metrics.change_cell(cell.x, cell.y, value - cell.liquid, edit=True)
+            cell.liquid = value
+
+        for cell in self.cells[mask | spread_to_neighbors(mask)]:
+            cell.unsettle()
+
+    def state(self, window: tuple[slice, slice] | None = None) -> dict[str, np.ndarray]:
+        """Returns copies of the per-cell state as arrays, of the whole grid or of the cells in a window of it."""
+
+        grid = self.cells if window is None else self.cells[window]
+        cells = grid.ravel()
+        return {
+            'liquid': np.array([cell.liquid for cell in cells], dtype=np.float64).reshape(grid.shape),
+            'types': np.array([cell.type.value for cell in cells], dtype=np.int8).reshape(grid.shape),
+            'settled': np.array([cell.settled for cell in cells], dtype=bool).reshape(grid.shape),
+            'settle_count': np.array([cell.settle_count for cell in cells], dtype=np.int16).reshape(grid.shape),
+            'flowing_down': np.array([cell.flowing_down for cell in cells], dtype=bool).reshape(grid.shape),
+        }
+
+    def load_state(self, state: dict[str, np.ndarray]):
+        """Replaces the per-cell state with the values of the given arrays, shaped like the grid."""
+
+        if state['liquid'].shape != self.cells.shape:
+            raise ValueError(f"Expected a state of shape {self.cells.shape}, got {state['liquid'].shape}")
+
+        if self.metrics.enabled:
+            self.metrics.change(state['liquid'] - self.state()['liquid'], edit=True)
+
+        cell_types = tuple(CellType)
+        for cell, liquid, _type, settled, settle_count, flowing_down in zip(
+            self.cells.ravel(),
+            state['liquid'].ravel().tolist(),
+            state['types'].ravel().tolist(),
+            state['settled'].ravel().tolist(),
+            state['settle_count'].ravel().tolist(),
+            state['flowing_down'].ravel().tolist(),
+        ):
+            cell.liquid = liquid
+            cell.type = cell_types[_type]
+            cell.settled = settled
+            cell.settle_count = settle_count
+            cell.flowing_down = flowing_down
+
+        self.emitters.rebuild(state['types'])
+        for tiles_row in self.tiles:
+            for tile in tiles_row:
+                tile.wake()
 
     def reset(self):
         """Resets the simulation."""
 
-        for row in self.cells:
-            for cell in row:
-                cell.liquid = 0
-                cell.type = CellType.BLANK
-
-    def run(self) -> set[Cell]:
-        """Runs `ITERATIONS_PER_FRAME` steps of the simulation. Returns the cells which need to be displayed."""
-
-        cells_to_display = set()
-
-        for i in range(1, self.iterations_per_frame + 1):
-            for row in self.cells:
-                for cell in row:
-                    if i == self.iterations_per_frame and (cell.type != CellType.BLANK or cell.liquid >= LIQUID_MIN):
-                        cells_to_display.add(cell)
-
-                    if cell.type == CellType.SOURCE:
-                        self._handle_source(cell)
-                        continue
-
-                    if cell.type == CellType.DRAIN:
-                        self._handle_drain(cell)
-                        continue
-
-                    if cell.settled:
-                        continue
-
-                    if not cell.liquid:
-                        continue
-
-                    if cell.liquid < LIQUID_MIN:
-                        cell.liquid = 0
-                        continue
-
-                    x, y = cell.x, cell.y
-
-                    start_liquid = cell.liquid
-                    remaining_liquid = cell.liquid
-
-                    if cell.flowing_down:
-                        cell.flowing_down = False
+        if self.metrics.enabled:
+            self.metrics.change(-self.state()['liquid'], edit=True)
+
+        for cell in self.cells.ravel().tolist():
+            cell.liquid = 0
+            cell.type = CellType.BLANK
+
+        self.emitters.clear()
+        for tiles_row in self.tiles:
+            for tile in tiles_row:
+                tile.wake()
+
+    def awake_blocks(self) -> tuple[int, np.ndarray]:
+        """
+        Returns the size of the tiles and which of them are awake. A step only changes the cells of the tiles awake
+        before or after it, and the cells next to them.
+        """
+
+        return TILE_SIZE, np.array([[tile.awake for tile in tiles_row] for tiles_row in self.tiles], dtype=bool)
+
+    def awake_counts(self) -> np.ndarray:
+        """
+        Returns how many times each tile was awake at the start or the end of a step. Between two calls, only the
+        cells of the tiles whose count changed or which are awake at the second one can have changed, along with the
+        cells next to them.
+        """
+
+        return self._awake_counts.copy()
+
+    def _update_cell(self, cell: Cell):
+        """Runs a single step of the simulation for the cell."""
+
+        if cell.type in (CellType.SOURCE, CellType.DRAIN):
+            return
+
+        if cell.settled:
+            return
+
+        if not cell.liquid:
+            return
+
+        if cell.liquid < LIQUID_MIN:
+            if self._tally is not None:
+                self._tally['truncated'] += cell.liquid
+                self.metrics.change_cell(cell.x, cell.y, -cell.liquid)
+            cell.liquid = 0
+            return
+
+        x, y = cell.x, cell.y
+
+        # Only the liquid left by the drains flows
+        start_liquid = remaining_liquid = cell.liquid - self._drained.get((x, y), 0)
+
+        if cell.flowing_down:
+            cell.flowing_down = False
+
+        profiler = self._profiler
+        if profiler is not None:
+            profiler.count('active_cells', 1)
+            start = perf_counter()
+
+        flow = self._flow_bottom(cell, remaining_liquid)
+        if profiler is not None:
+            start = self._lap(profiler, 'flow_bottom', start, flow)
+        remaining_liquid -= flow
+        if remaining_liquid < LIQUID_MIN:
+            self._discard(x, y, remaining_liquid)
+            return
+
+        flow = self._flow_left(cell, remaining_liquid)
+        if profiler is not None:
+            start = self._lap(profiler, 'flow_left', start, flow)
+        remaining_liquid -= flow
+        if remaining_liquid < LIQUID_MIN:
+            self._discard(x, y, remaining_liquid)
+            return
+
+        flow = self._flow_right(cell, remaining_liquid)
+        if profiler is not None:
+            start = self._lap(profiler, 'flow_right', start, flow)
+        remaining_liquid -= flow
+        if remaining_liquid < LIQUID_MIN:
+            self._discard(x, y, remaining_liquid)
+            return
+
+        flow = self._flow_top(cell, remaining_liquid)
+        if profiler is not None:
+            self._lap(profiler, 'flow_top', start, flow)
+        remaining_liquid -= flow
+        if remaining_liquid < LIQUID_MIN:
+            self._discard(x, y, remaining_liquid)
+            return
+
+        if remaining_liquid != start_liquid:
+            cell.unsettle_neighbors()
+        else:
+            cell.settle_count += 1
+            if cell.settle_count >= 10:
+                cell.settled = True
 
-                    remaining_liquid -= self._flow_bottom(cell)
-                    if i == self.iterations_per_frame and cell.bottom and not cell.bottom.settled:
-                        cells_to_display.add(cell.bottom)
+    def _discard(self, x: int, y: int, remaining_liquid: float):
+        """Drops the leftover liquid of a cell, too little to flow any further."""
 
-                    if remaining_liquid < LIQUID_MIN:
-                        self.diffs[x, y] -= remaining_liquid
-                        continue
+        self.diffs[x, y] -= remaining_liquid
+        if self._tally is not None:
+            self._tally['truncated'] += remaining_liquid
 
-                    remaining_liquid -= self._flow_left(cell, remaining_liquid)
-                    if i == self.iterations_per_frame and cell.left and not cell.left.settled:
-                        cells_to_display.add(cell.left)
+    def _update_tiles(self):
+        """Updates the cells of the awake tiles."""
 
-                    if remaining_liquid < LIQUID_MIN:
-                        self.diffs[x, y] -= remaining_liquid
-                        continue
+        for tiles_row in self.tiles:
+            for x in range(tiles_row[0].x0, tiles_row[0].x1):
+                for tile in tiles_row:
+                    if tile.awake:
+                        for cell in tile.rows[x - tile.x0]:
+                            self._update_cell(cell)
 
-                    remaining_liquid -= self._flow_right(cell, remaining_liquid)
-                    if i == self.iterations_per_frame and cell.right and not cell.right.settled:
-                        cells_to_display.add(cell.right)
+    def _apply_diffs(self):
+        """Applies the diffs of the awake tiles and puts the idle ones to sleep."""
 
-                    if remaining_liquid < LIQUID_MIN:
-                        self.diffs[x, y] -= remaining_liquid
-                        continue
+        for tiles_row in self.tiles:
+            for tile in tiles_row:
+                if not tile.awake:
+                    continue
 
-                    remaining_liquid -= self._flow_top(cell, remaining_liquid)
-                    if i == self.iterations_per_frame and cell.top and not cell.top.settled:
-                        cells_to_display.add(cell.top)
+                diffs = self.diffs[tile.x0:tile.x1, tile.y0:tile.y1]
+                for x, y in zip(*np.nonzero(diffs)):
+                    tile.cells[x, y].liquid += diffs[x, y]
 
-                    if remaining_liquid < LIQUID_MIN:
-                        self.diffs[x, y] -= remaining_liquid
-                        continue
+                if self._tally is not None:
+                    self.metrics.change(diffs, (slice(tile.x0, tile.x1), slice(tile.y0, tile.y1)))
+                diffs[:] = 0
+                if tile.is_idle():
+                    tile.sleep()
 
-                    if remaining_liquid != start_liquid:
-                        cell.unsettle_neighbors()
-                        if i == self.iterations_per_frame:
-                            if cell.top:
-                                cells_to_display.add(cell.top)
+    @staticmethod
+    def _lap(profiler: Profiler, phase: str, start: float, flow: float) -> float:
+        """Adds the time since `start` and the flow, if any, of a cell's update to the phase."""
 
-                            if cell.bottom:
-                                cells_to_display.add(cell.bottom)
+        if flow:
+            profiler.count('flow_events', 1)
+        return profiler.lap(phase, start)
+
+    def step(self):
+        """
+        Runs a single step of the simulation.
+
+        Only the awake tiles are visited, in the same row by row order as the whole grid would be. A tile falls asleep
+        once none of its cells need updating and is woken up whenever one of its cells is unsettled or changed. The
+        sources and drains are handled first, in one batch.
+        """
+
+        self._tally = empty_tally() if self.metrics.enabled else None
+        self._profiler = profiler = self.profiler if self.profiler.enabled else None
+        if profiler is not None:
+            profiler.steps += 1
+            start = perf_counter()
+
+        self._awake_counts += self.awake_blocks()[1]
+        self._handle_emitters()
+        if profiler is not None:
+            profiler.lap('sources_drains', start)
+
+        self._update_tiles()
+        if profiler is not None:
+            start = perf_counter()
+
+        self._apply_diffs()
+        if profiler is not None:
+            profiler.lap('apply_diffs', start)
+            profiler.count('settled_cells', sum(1 for cell in self.cells.flat if cell.settled and cell.liquid))
+            self._profiler = None
+
+        if self._tally is not None:
+            self.metrics.count(self._tally)
+            self._tally = None
+        self._awake_counts += self.awake_blocks()[1]
 
-                            if cell.left:
-                                cells_to_display.add(cell.left)
+    def run(self) -> set[Cell]:
+        """Runs `ITERATIONS_PER_FRAME` steps of the simulation. Returns the cells which need to be displayed."""
 
-                            if cell.right:
-                                cells_to_display.add(cell.right)
-                    else:
-                        cell.settle_count += 1
-                        if cell.settle_count >= 10:
-                            cell.settled = True
+        for _ in range(self.iterations_per_frame):
+            self.step()
 
-            for x in range(HEIGHT):
-                for y in range(WIDTH):
-                    diff = self.diffs[x, y]
-                    if diff:
-                        self.cells[x, y].liquid += diff
+        start = perf_counter()
+        cells_to_display = set()
+        for tiles_row in self.tiles:
+            for tile in tiles_row:
+                cells_to_display.update(tile.collect_visible() if tile.awake else tile.visible)
 
-            self.diffs = np.zeros((HEIGHT, WIDTH))
+        if self.profiler.enabled:
+            self.profiler.lap('display', start)
 
         return cells_to_display
-
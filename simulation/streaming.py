@@ -0,0 +1,289 @@
+import select
+import socket
+import struct
+import zlib
+
+import numpy as np
+
+from .kernel import spread_to_neighbors
+from .recording import RECORDED_FIELDS
+from config import STREAM_HOST, STREAM_PORT, STREAM_FREQUENCY, STREAM_TIMEOUT
+
+MAGIC = b'SSDS'
+VERSION = 1
+
+# Magic, version, height, width, then the dtype of every streamed field
+_HEADER = struct.Struct('<4sHII' + '8s' * len(RECORDED_FIELDS))
+# Cycle, whether the frame is a keyframe, then the size of its compressed payload
+_FRAME = struct.Struct('<q?I')
+# Number of cells of a delta frame
+_COUNT = struct.Struct('<I')
+
+
+def encode_keyframe(state: dict[str, np.ndarray], level: int = 1) -> bytes:
+    """Returns the payload of a keyframe: the streamed fields of the whole grid, compressed."""
+
+    return zlib.compress(b''.join(np.ascontiguousarray(state[name]).tobytes() for name in RECORDED_FIELDS), level)
+
+
+def encode_delta(indices: np.ndarray, values: dict[str, np.ndarray], level: int = 1) -> bytes:
+    """
+    Returns the payload of a delta frame: the number of changed cells, the gaps between their sorted flat indices, which
+    compress much better than the indices themselves, and the new values of the streamed fields, compressed.
+    """
+
+    gaps = np.diff(indices, prepend=0).astype(np.uint32)
+    fields = b''.join(np.ascontiguousarray(values[name]).tobytes() for name in RECORDED_FIELDS)
+    return zlib.compress(_COUNT.pack(len(indices)) + gaps.tobytes() + fields, level)
+
+
+def apply_frame(state: dict[str, np.ndarray], keyframe: bool, payload: bytes):
+    """Applies the payload of a keyframe or a delta frame to the streamed fields of the state, in place."""
+
+    data = zlib.decompress(payload)
+    if keyframe:
+        offset = 0
+        for name in RECORDED_FIELDS:
+            array = state[name]
+            array.ravel()[:] = np.frombuffer(data, dtype=array.dtype, count=array.size, offset=offset)
+            offset += array.nbytes
+        return
+
+    count, = _COUNT.unpack_from(data)
+    offset = _COUNT.size
+    indices = np.cumsum(np.frombuffer(data, dtype=np.uint32, count=count, offset=offset), dtype=np.intp)
+    offset += count * 4
+    for name in RECORDED_FIELDS:
+        array = state[name]
+        array.ravel()[indices] = np.frombuffer(data, dtype=array.dtype, count=count, offset=offset)
+        offset += count * array.itemsize
+
+
+def _disconnect(client: socket.socket):
+    """Closes the connection to a viewer, shutting it down first so that a viewer waiting for a frame sees it end."""
+
+    try:
+        client.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    client.close()
+
+
+class ChangeTracker:
+    """
+    Finds the cells of a simulation whose streamed fields changed since the last frame.
+
+    A step only changes the cells of the blocks the engine reports awake before or after it, and the cells next to
+    them, so after every step the awake blocks are added up and only those and their neighbours are compared with the
+    previous frame. The work follows the amount of change, except that the cell and chunked engines copy their whole
+    state to be read.
+    """
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.reset()
+
+    def reset(self):
+        """Takes the current state as the previous frame."""
+
+        state = self.simulation.state()
+        self.previous = {name: np.array(state[name]) for name in RECORDED_FIELDS}
+        self.block_size, self._touched = self.simulation.awake_blocks()
+
+    def step(self):
+        """Adds the blocks which are awake after a step."""
+
+        self._touched |= self.simulation.awake_blocks()[1]
+
+    def changes(self) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+        """Returns the sorted flat indices and the new values of the cells which changed, and takes them over."""
+
+        state = self.simulation.state()
+        size = self.block_size
+        width = self.previous['liquid'].shape[1]
+
+        found = []
+        touched = self._touched | spread_to_neighbors(self._touched)
+        for row, col in zip(*np.nonzero(touched)):
+            block = (slice(row * size, (row + 1) * size), slice(col * size, (col + 1) * size))
+            changed = np.zeros(self.previous['liquid'][block].shape, dtype=bool)
+            for name in RECORDED_FIELDS:
+                changed |= state[name][block] != self.previous[name][block]
+
+            xs, ys = np.nonzero(changed)
+            if xs.size:
+                found.append((xs + row * size) * width + ys + col * size)
+                for name in RECORDED_FIELDS:
+                    self.previous[name][block][changed] = state[name][block][changed]
+
+        indices = np.sort(np.concatenate(found)) if found else np.zeros(0, dtype=np.intp)
+        self._touched = self.simulation.awake_blocks()[1]
+        return indices, {name: self.previous[name].ravel()[indices] for name in RECORDED_FIELDS}
+
+
+class StreamServer:
+    """
+    Streams the state of a simulation over TCP to any number of viewers, see `StreamClient`.
+
+    A viewer first gets the whole grid as a keyframe and then, every `frequency` steps, a delta frame of the cells which
+    changed, found by a `ChangeTracker`. Each frame is compressed once for all the viewers, so the bandwidth and the
+    work of the server follow the amount of change rather than the grid size. New viewers are let in between frames,
+    and those which hold up the server for more than `timeout` seconds are dropped.
+    """
+
+    def __init__(
+            self,
+            simulation,
+            host: str = STREAM_HOST,
+            port: int = STREAM_PORT,
+            frequency: int = STREAM_FREQUENCY,
+            timeout: float = STREAM_TIMEOUT,
+            level: int = 1
+    ):
+        self.frequency = frequency
+        self.timeout = timeout
+        self.level = level
+        self.frames = 0
+        self.bytes_sent = 0
+
+        self._socket = socket.create_server((host, port))
+        self._socket.setblocking(False)
+        self.address: tuple[str, int] = self._socket.getsockname()[:2]
+
+        self._tracker = ChangeTracker(simulation)
+        self._clients: list[socket.socket] = []
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
+
+    def close(self):
+        for client in self._clients:
+            _disconnect(client)
+        self._clients.clear()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, cycle: int):
+        """Notes a step of the simulation, and streams a frame to the viewers on every `frequency`-th cycle."""
+
+        self._tracker.step()
+        if cycle % self.frequency != 0:
+            return
+
+        if self._clients:
+            indices, values = self._tracker.changes()
+            self._broadcast(self._clients, cycle, False, encode_delta(indices, values, self.level))
+            self.frames += 1
+
+        self._accept(cycle)
+
+    def _accept(self, cycle: int):
+        """Lets the waiting viewers in, sending them the header and a keyframe of the previous frame."""
+
+        new_clients = []
+        while True:
+            try:
+                client, _ = self._socket.accept()
+            except BlockingIOError:
+                break
+            client.setblocking(True)
+            client.settimeout(self.timeout)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            new_clients.append(client)
+
+        if not new_clients:
+            return
+
+        # Without viewers, the tracker stopped following the changes
+        if not self._clients:
+            self._tracker.reset()
+
+        previous = self._tracker.previous
+        height, width = previous['liquid'].shape
+        header = _HEADER.pack(
+            MAGIC, VERSION, height, width, *(previous[name].dtype.str.encode() for name in RECORDED_FIELDS)
+        )
+        self._broadcast(new_clients, cycle, True, encode_keyframe(previous, self.level), header)
+        self._clients.extend(new_clients)
+
+    def _broadcast(self, clients: list[socket.socket], cycle: int, keyframe: bool, payload: bytes, prefix: bytes = b''):
+        """Sends a frame to the viewers, dropping those it can't be sent to."""
+
+        data = prefix + _FRAME.pack(cycle, keyframe, len(payload)) + payload
+        for client in list(clients):
+            try:
+                client.sendall(data)
+                self.bytes_sent += len(data)
+            except OSError:
+                _disconnect(client)
+                clients.remove(client)
+
+
+class StreamClient:
+    """
+    Receives the frames of a `StreamServer`, keeping a copy of the streamed fields of the simulation in `state`.
+    """
+
+    def __init__(self, host: str = STREAM_HOST, port: int = STREAM_PORT):
+        self._socket = socket.create_connection((host, port))
+
+        magic, version, height, width, *dtypes = _HEADER.unpack(self._receive(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{host}:{port} is not a simulation stream")
+        if version != VERSION:
+            raise ValueError(f"Unsupported stream version {version}")
+
+        self.shape = (height, width)
+        self.state = {
+            name: np.zeros(self.shape, dtype=np.dtype(dtype.rstrip(b'\0').decode()))
+            for name, dtype in zip(RECORDED_FIELDS, dtypes)
+        }
+        self.cycle: int | None = None
+        self.frames = 0
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def pending(self) -> bool:
+        """Checks whether a frame arrived which `receive` can read without waiting."""
+
+        return bool(select.select([self._socket], [], [], 0)[0])
+
+    def receive(self) -> bool:
+        """Waits for the next frame and applies it to `state`. Returns False once the server closed the stream."""
+
+        try:
+            cycle, keyframe, size = _FRAME.unpack(self._receive(_FRAME.size))
+            payload = self._receive(size)
+        except ConnectionError:
+            return False
+
+        apply_frame(self.state, keyframe, payload)
+        self.cycle = cycle
+        self.frames += 1
+        return True
+
+    def _receive(self, size: int) -> bytes:
+        """Reads exactly `size` bytes from the server."""
+
+        chunks = []
+        while size:
+            chunk = self._socket.recv(min(size, 2 ** 20))
+            if not chunk:
+                raise ConnectionError("The server closed the stream")
+            chunks.append(chunk)
+            size -= len(chunk)
+
+        return b''.join(chunks)
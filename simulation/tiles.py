@@ -0,0 +1,201 @@
+import math
+
+import numpy as np
+
+from .cell import Cell, CellType, CellGrid
+from config import LIQUID_MIN
+
+
+class Tile:
+    """A fixed-size block of cells which `Simulation.run` skips while it is asleep."""
+
+    def __init__(self, cells: CellGrid, x0: int, y0: int):
+        self.cells = cells
+        self.rows: list[list[Cell]] = [list(row) for row in cells]
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x0 + cells.shape[0]
+        self.y1 = y0 + cells.shape[1]
+
+        self.awake = True
+        self.visible: list[Cell] = []
+
+        for row in self.rows:
+            for cell in row:
+                cell.tile = self
+
+    def wake(self):
+        """Wakes the tile up."""
+
+        self.awake = True
+
+    def is_idle(self) -> bool:
+        """Checks whether none of the tile's cells need to be updated."""
+
+        for row in self.rows:
+            for cell in row:
+                if cell.type in (CellType.SOURCE, CellType.DRAIN) or (not cell.settled and cell.liquid):
+                    return False
+
+        return True
+
+    def collect_visible(self) -> list[Cell]:
+        """Returns the tile's cells which need to be displayed."""
+
+        return [
+            cell for row in self.rows for cell in row
+            if cell.type != CellType.BLANK or cell.liquid >= LIQUID_MIN
+        ]
+
+    def sleep(self):
+        """Puts the tile to sleep, caching its visible cells for as long as it sleeps."""
+
+        self.awake = False
+        self.visible = self.collect_visible()
+
+
+def split_into_tiles(cells: CellGrid, tile_size: int) -> list[list[Tile]]:
+    """Splits the grid into rows of tiles."""
+
+    height, width = cells.shape
+    return [
+        [Tile(cells[x:x + tile_size, y:y + tile_size], x, y) for y in range(0, width, tile_size)]
+        for x in range(0, height, tile_size)
+    ]
+
+
+class TileMask:
+    """Keeps track of which fixed-size tiles of an array based grid are awake."""
+
+    def __init__(self, height: int, width: int, tile_size: int):
+        self.height = height
+        self.width = width
+        self.tile_size = tile_size
+        self.awake = np.ones((math.ceil(height / tile_size), math.ceil(width / tile_size)), dtype=bool)
+
+    def wake(self, x0: int, x1: int, y0: int, y1: int):
+        """Wakes the tiles overlapping the cells in `[x0, x1) x [y0, y1)`."""
+
+        size = self.tile_size
+        self.awake[max(x0, 0) // size:(x1 - 1) // size + 1, max(y0, 0) // size:(y1 - 1) // size + 1] = True
+
+    def wake_mask(self, mask: np.ndarray):
+        """Wakes the tiles containing a cell set in the grid-shaped mask."""
+
+        self.awake |= tile_any(mask, self.tile_size)
+
+    def wake_all(self):
+        """Wakes all the tiles."""
+
+        self.awake[:] = True
+
+    def windows(self) -> list[tuple[slice, slice]]:
+        """
+        Returns the cells of every group of awake tiles plus a one cell border, which only holds sleeping cells.
+
+        Awake tiles touching each other, even diagonally, make a group, and groups whose boxes come closer than two
+        cells are joined, so the windows never overlap. Stepping the windows costs about as much as the awake tiles,
+        however far apart they are.
+        """
+
+        size = self.tile_size
+        return [
+            (slice(max(r0 * size - 1, 0), min(r1 * size + 1, self.height)),
+             slice(max(c0 * size - 1, 0), min(c1 * size + 1, self.width)))
+            for r0, r1, c0, c1 in group_tiles(self.awake, 1 if size > 1 else 2).tolist()
+        ]
+
+    def covering(self, window: tuple[slice, slice]) -> tuple[slice, slice]:
+        """Returns the cells of all the tiles overlapping `window`."""
+
+        size = self.tile_size
+        return (
+            slice(window[0].start // size * size, min(((window[0].stop - 1) // size + 1) * size, self.height)),
+            slice(window[1].start // size * size, min(((window[1].stop - 1) // size + 1) * size, self.width))
+        )
+
+    def update(self, busy: np.ndarray, region: tuple[slice, slice]):
+        """Wakes the tiles of a `covering` region which contain a busy cell and puts the rest of them to sleep."""
+
+        tiles = tile_any(busy, self.tile_size)
+        row, col = region[0].start // self.tile_size, region[1].start // self.tile_size
+        self.awake[row:row + tiles.shape[0], col:col + tiles.shape[1]] = tiles
+
+
+def tile_any(mask: np.ndarray, tile_size: int) -> np.ndarray:
+    """Reduces the mask to one value per tile, set if any of the tile's cells are set."""
+
+    rows, cols = math.ceil(mask.shape[0] / tile_size), math.ceil(mask.shape[1] / tile_size)
+    padded = np.zeros((rows * tile_size, cols * tile_size), dtype=bool)
+    padded[:mask.shape[0], :mask.shape[1]] = mask
+
+    return padded.reshape(rows, tile_size, cols, tile_size).any(axis=(1, 3))
+
+
+def group_tiles(mask: np.ndarray, spacing: int = 1) -> np.ndarray:
+    """
+    Returns the boxes of the groups of set tiles of a tile mask, see `TileMask.windows`, as rows of the first row, the
+    row past the last one, the first column and the column past the last one. Boxes less than `spacing` tiles apart
+    are joined.
+    """
+
+    edges = np.diff(np.pad(mask.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    stops = np.nonzero(edges == -1)[1]
+    rows, starts, stops = rows.tolist(), starts.tolist(), stops.tolist()
+
+    # Joins every run of set tiles along a row with the runs of the row above it touches, even diagonally
+    parent = list(range(len(rows)))
+
+    def find(run: int) -> int:
+        while parent[run] != run:
+            parent[run] = parent[parent[run]]
+            run = parent[run]
+        return run
+
+    above = end = first = 0
+    for run, row in enumerate(rows):
+        if run and row != rows[run - 1]:
+            above, end = (first, run) if rows[run - 1] == row - 1 else (run, run)
+            first = run
+
+        while above < end and stops[above] < starts[run]:
+            above += 1
+        other = above
+        while other < end and starts[other] <= stops[run]:
+            parent[find(run)] = find(other)
+            other += 1
+
+    groups: dict[int, list[int]] = {}
+    for run, row in enumerate(rows):
+        box = groups.setdefault(find(run), [row, row + 1, starts[run], stops[run]])
+        box[1], box[2], box[3] = row + 1, min(box[2], starts[run]), max(box[3], stops[run])
+
+    boxes = np.array(list(groups.values()), dtype=np.intp).reshape(-1, 4)
+
+    # Joins the groups whose boxes are too close, until none are
+    while len(boxes) > 1:
+        box, other = boxes[:, np.newaxis], boxes[np.newaxis, :]
+        near = ((box[..., 0] < other[..., 1] + spacing) & (other[..., 0] < box[..., 1] + spacing)
+                & (box[..., 2] < other[..., 3] + spacing) & (other[..., 2] < box[..., 3] + spacing))
+        if np.count_nonzero(near) == len(boxes):
+            break
+
+        labels = np.arange(len(boxes))
+        while True:
+            joined = np.where(near, labels, len(boxes)).min(axis=1)
+            joined = joined[joined]
+            if np.array_equal(joined, labels):
+                break
+            labels = joined
+
+        labels = np.unique(labels, return_inverse=True)[1]
+        merged = np.zeros((labels.max() + 1, 4), dtype=np.intp)
+        merged[:, 0::2] = boxes.max()
+        np.minimum.at(merged[:, 0], labels, boxes[:, 0])
+        np.maximum.at(merged[:, 1], labels, boxes[:, 1])
+        np.minimum.at(merged[:, 2], labels, boxes[:, 2])
+        np.maximum.at(merged[:, 3], labels, boxes[:, 3])
+        boxes = merged
+
+    return boxes
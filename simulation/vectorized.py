@@ -0,0 +1,426 @@
+from time import perf_counter
+
+import numpy as np
+
+from .cell import CellType
+from .emitters import Emitters
+from .kernel import BLANK, SOURCE, DRAIN, FlowRule, flow_step, get_rule, spread_to_neighbors
+from .metrics import Metrics, empty_tally
+from .precision import MassCorrection, liquid_dtype, spread_correction
+from .regions import Region, region_mask, region_values
+from .tiles import TileMask, tile_any
+from .profiling import Profiler
+from config import (
+    WIDTH,
+    HEIGHT,
+    LIQUID_MIN,
+    FLOW_SPEED,
+    COMPRESSION_MAX,
+    ITERATIONS_PER_FRAME,
+    SOURCE_LIQUID_PER_ITERATION,
+    DRAIN_LIQUID_PER_ITERATION,
+    TILE_SIZE,
+    PRECISION,
+    PROFILING,
+    FLOW_RULE
+)
+
+_CELL_TYPES = tuple(CellType)
+
+
+class CellView:
+    """A read-only `Cell`-like view of a single cell of a `VectorizedSimulation`."""
+
+    __slots__ = ('_simulation', 'x', 'y')
+
+    def __init__(self, simulation: 'VectorizedSimulation', x: int, y: int):
+        self._simulation = simulation
+        self.x = x
+        self.y = y
+
+    def __repr__(self):
+        return (f'{self.liquid:.1f}' if self.liquid else '' if self.type == CellType.BLANK else 'XXX').center(3)
+
+    def __eq__(self, other):
+        return (isinstance(other, CellView) and self._simulation is other._simulation
+                and self.x == other.x and self.y == other.y)
+
+    def __hash__(self):
+        return hash((id(self._simulation), self.x, self.y))
+
+    @property
+    def type(self) -> CellType:
+        return _CELL_TYPES[self._simulation.types[self.x, self.y]]
+
+    @property
+    def liquid(self) -> float:
+        return float(self._simulation.liquid[self.x, self.y])
+
+    @property
+    def settled(self) -> bool:
+        return bool(self._simulation.settled[self.x, self.y])
+
+    @property
+    def settle_count(self) -> int:
+        return int(self._simulation.settle_count[self.x, self.y])
+
+    @property
+    def flowing_down(self) -> bool:
+        return bool(self._simulation.flowing_down[self.x, self.y])
+
+    @property
+    def top(self) -> 'CellView | None':
+        return self._neighbor(self.x - 1, self.y)
+
+    @property
+    def bottom(self) -> 'CellView | None':
+        return self._neighbor(self.x + 1, self.y)
+
+    @property
+    def left(self) -> 'CellView | None':
+        return self._neighbor(self.x, self.y - 1)
+
+    @property
+    def right(self) -> 'CellView | None':
+        return self._neighbor(self.x, self.y + 1)
+
+    def _neighbor(self, x: int, y: int) -> 'CellView | None':
+        height, width = self._simulation.liquid.shape
+        if 0 <= x < height and 0 <= y < width:
+            return CellView(self._simulation, x, y)
+
+        return None
+
+
+class CellGridView:
+    """A `CellGrid`-like view of a `VectorizedSimulation`, creating `CellView`s on access."""
+
+    def __init__(self, simulation: 'VectorizedSimulation'):
+        self._simulation = simulation
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self._simulation.liquid.shape
+
+    def __getitem__(self, position: tuple[int, int]) -> CellView:
+        x, y = position
+        return CellView(self._simulation, x, y)
+
+    def __iter__(self):
+        height, width = self.shape
+        for x in range(height):
+            yield [CellView(self._simulation, x, y) for y in range(width)]
+
+
+class VectorizedSimulation:
+    """
+    Simulation engine keeping the cell state in flat typed arrays instead of `Cell` objects.
+
+    Every step computes each flow direction as a whole-grid array operation. Unlike `Simulation.run`, which updates the
+    cells one by one, cells unsettled during a step are only picked up in the next one. The step is restricted to
+    windows around the groups of awake tiles, so its cost follows the regions where liquid is moving rather than how far
+    apart they are. Sources and drains are kept in the `emitters` registry, where each of them can be given its own rate
+    and schedule.
+
+    The liquid is stored with the given `precision`, see `simulation.precision`. In single precision, a `MassCorrection`
+    puts back the liquid lost or gained to rounding. The flows follow the given `rule`, a `FlowRule` or the name of one
+    of `simulation.kernel.RULES`, which can be swapped for another one at any time through the `rule` attribute.
+    """
+
+    def __init__(self, width: int = WIDTH, height: int = HEIGHT, precision: str = PRECISION,
+                 rule: str | FlowRule = FLOW_RULE):
+        self.width = width
+        self.height = height
+        self.dtype = liquid_dtype(precision)
+        self.liquid = self._allocate((height, width), self.dtype, 0)
+        self.types = self._allocate((height, width), np.int8, BLANK)
+        self.settled = self._allocate((height, width), bool, True)
+        self.settle_count = self._allocate((height, width), np.int16, 0)
+        self.flowing_down = self._allocate((height, width), bool, False)
+        self.tiles = TileMask(height, width, TILE_SIZE)
+        # How many times every tile was awake at the start or the end of a step, see `awake_counts`
+        self._awake_counts = np.zeros(self.tiles.awake.shape, dtype=np.int64)
+        self.emitters = Emitters(height, width)
+        self.profiler = Profiler(PROFILING)
+        self.metrics = Metrics(lambda: self.liquid)
+        self.correction = None
+        if self.dtype != np.float64:
+            self.correction = MassCorrection(lambda: float(self.liquid.sum(dtype=np.float64)))
+
+        self.compression_max = COMPRESSION_MAX
+        self.flow_speed = FLOW_SPEED
+        self.iterations_per_frame = ITERATIONS_PER_FRAME
+        self.source_rate = SOURCE_LIQUID_PER_ITERATION
+        self.drain_rate = DRAIN_LIQUID_PER_ITERATION
+        self.rule = get_rule(rule)
+
+    @property
+    def cells(self) -> CellGridView:
+        return CellGridView(self)
+
+    def _allocate(self, shape: tuple[int, ...], dtype, fill) -> np.ndarray:
+        """Allocates one of the per-cell state arrays."""
+
+        return np.full(shape, fill, dtype=dtype)
+
+    def _is_blank(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Returns which of the given cells are blank."""
+
+        return self.types[xs, ys] == BLANK
+
+    def _unsettle(self, mask: np.ndarray):
+        """Unsettles the cells in the mask."""
+
+        self.settled[mask] = False
+        self.settle_count[mask] = 0
+
+    def _record_edit(self, mask: np.ndarray | tuple, previous: np.ndarray):
+        """Reports the change of the liquid of the masked cells from their previous values to the metrics."""
+
+        delta = np.zeros(self.liquid.shape)
+        delta[mask] = np.subtract(self.liquid[mask], previous, dtype=np.float64)
+        self.metrics.change(delta, edit=True)
+
+    def _invalidate_correction(self):
+        """Drops the reference total of the mass correction, if any, after an edit changed the liquid."""
+
+        if self.correction is not None:
+            self.correction.invalidate()
+
+    def add_liquid(self, x: int, y: int, amount: float):
+        """Adds liquid to the target cell."""
+
+        self.liquid[x, y] += amount
+        if self.metrics.enabled:
+            self.metrics.change_cell(x, y, amount, edit=True)
+        self._invalidate_correction()
+        self.settled[x, y] = False
+        self.tiles.wake(x, x + 1, y, y + 1)
+
+    def set_cell_type(self, x: int, y: int, _type: CellType):
+        """Sets the type of the target cell."""
+
+        self.types[x, y] = _type.value
+        if _type != CellType.BLANK:
+            if self.metrics.enabled:
+                self.metrics.change_cell(x, y, -float(self.liquid[x, y]), edit=True)
+            self.liquid[x, y] = 0
+            self._invalidate_correction()
+        self.emitters.update(x, y, _type.value)
+
+        self._unsettle((slice(max(x - 1, 0), x + 2), y))
+        self._unsettle((x, slice(max(y - 1, 0), y + 2)))
+        self.tiles.wake(x - 1, x + 2, y - 1, y + 2)
+
+    def _mark_edited(self, mask: np.ndarray):
+        """Unsettles the edited cells of the mask and wakes their tiles."""
+
+        self._unsettle(mask)
+        self.tiles.wake_mask(mask)
+        self._invalidate_correction()
+
+    def set_cell_types(self, region: Region, _type: CellType):
+        """Sets the type of every cell in the region, then unsettles them and their neighbours in one pass."""
+
+        mask = region_mask(region, self.liquid.shape)
+        self.emitters.update_mask(mask, _type.value, self.types[mask])
+        self.types[mask] = _type.value
+        if _type != CellType.BLANK:
+            previous = self.liquid[mask]
+            self.liquid[mask] = 0
+            if self.metrics.enabled:
+                self._record_edit(mask, previous)
+
+        self._mark_edited(mask | spread_to_neighbors(mask))
+
+    def place_sources(self, region: Region):
+        """Turns every cell in the region into a source."""
+
+        self.set_cell_types(region, CellType.SOURCE)
+
+    def place_drains(self, region: Region):
+        """Turns every cell in the region into a drain."""
+
+        self.set_cell_types(region, CellType.DRAIN)
+
+    def add_liquid_region(self, region: Region, amount: float | np.ndarray):
+        """Adds liquid to every cell in the region, either the same amount or one per cell from a grid-shaped array."""
+
+        mask = region_mask(region, self.liquid.shape)
+        previous = self.liquid[mask]
+        self.liquid[mask] += region_values(amount, mask)
+        if self.metrics.enabled:
+            self._record_edit(mask, previous)
+        self._mark_edited(mask)
+
+    def set_liquid_region(self, region: Region, amount: float | np.ndarray):
+        """Sets the liquid of every cell in the region, then unsettles them and their neighbours in one pass."""
+
+        mask = region_mask(region, self.liquid.shape)
+        previous = self.liquid[mask]
+        self.liquid[mask] = region_values(amount, mask)
+        if self.metrics.enabled:
+            self._record_edit(mask, previous)
+        self._mark_edited(mask | spread_to_neighbors(mask))
+
+    def state(self, window: tuple[slice, slice] | None = None) -> dict[str, np.ndarray]:
+        """
+        Returns the per-cell state arrays, or the cells in a window of them. These are the simulation's own arrays, not
+        copies.
+        """
+
+        state = {
+            'liquid': self.liquid,
+            'types': self.types,
+            'settled': self.settled,
+            'settle_count': self.settle_count,
+            'flowing_down': self.flowing_down,
+        }
+        return state if window is None else {name: array[window] for name, array in state.items()}
+
+    def load_state(self, state: dict[str, np.ndarray]):
+        """Replaces the per-cell state with copies of the given arrays, shaped like the grid."""
+
+        previous = self.liquid.copy() if self.metrics.enabled else None
+        for name, array in self.state().items():
+            if state[name].shape != array.shape:
+                raise ValueError(f"Expected {name} of shape {array.shape}, got {state[name].shape}")
+            np.copyto(array, state[name])
+        if previous is not None:
+            self.metrics.change(np.subtract(self.liquid, previous, dtype=np.float64), edit=True)
+        self._invalidate_correction()
+        self.emitters.rebuild(self.types)
+        self.tiles.wake_all()
+
+    def reset(self):
+        """Resets the simulation."""
+
+        if self.metrics.enabled:
+            self.metrics.change(-self.liquid, edit=True)
+        self.liquid[:] = 0
+        self.types[:] = BLANK
+        self.emitters.clear()
+        self._invalidate_correction()
+        self.tiles.wake_all()
+
+    def step(self):
+        """Runs a single step of the simulation."""
+
+        profiler = self.profiler if self.profiler.enabled else None
+        if profiler is not None:
+            profiler.steps += 1
+
+        windows = self.tiles.windows()
+        if not windows:
+            return
+
+        self._awake_counts += self.tiles.awake
+        if self.correction is not None:
+            self.correction.start()
+
+        emitters = self.emitters.batch(self._is_blank, self.source_rate, self.drain_rate)
+        tally = empty_tally() if self.metrics.enabled or self.correction is not None else None
+
+        # The windows don't overlap and their borders only hold sleeping cells, which take part in the step as
+        # neighbours only, so the windows can be stepped one after the other
+        for window in windows:
+            rows, cols = window
+            selected = ((emitters.emitter_x >= rows.start) & (emitters.emitter_x < rows.stop)
+                        & (emitters.emitter_y >= cols.start) & (emitters.emitter_y < cols.stop))
+            previous = self.liquid[window].copy() if self.metrics.enabled else None
+
+            diffs, unsettle = flow_step(
+                self.liquid[window],
+                self.types[window],
+                self.settled[window],
+                self.settle_count[window],
+                self.flowing_down[window],
+                self.compression_max,
+                self.flow_speed,
+                source_rate=self.source_rate,
+                drain_rate=self.drain_rate,
+                emitters=emitters.local(rows.start, cols.start, selected),
+                tally=tally,
+                profiler=profiler,
+                rule=self.rule
+            )
+
+            if profiler is not None:
+                start = perf_counter()
+
+            self.liquid[window] += diffs
+            self.settled[window][unsettle] = False
+            self.settle_count[window][unsettle] = 0
+            if previous is not None:
+                self.metrics.change(np.subtract(self.liquid[window], previous, dtype=np.float64), window)
+
+            if profiler is not None:
+                profiler.lap('apply_diffs', start)
+
+        if profiler is not None:
+            start = perf_counter()
+
+        # Windows may share the tiles around them, which are only updated once all of them were applied
+        for window in windows:
+            region = self.tiles.covering(window)
+            types = self.types[region]
+            busy = (types == SOURCE) | (types == DRAIN) | (~self.settled[region] & (self.liquid[region] != 0))
+            self.tiles.update(busy, region)
+
+        if self.metrics.enabled:
+            self.metrics.count(tally)
+
+        if self.correction is not None:
+            self._correct(self.correction.finish(tally))
+        self._awake_counts += self.tiles.awake
+
+        if profiler is not None:
+            profiler.lap('apply_diffs', start)
+            profiler.count('settled_cells', np.count_nonzero(self.settled & (self.liquid != 0)))
+
+    def awake_blocks(self) -> tuple[int, np.ndarray]:
+        """
+        Returns the size of the tiles and a copy of which of them are awake. A step only changes the cells of the tiles
+        awake before or after it, and the cells next to them.
+        """
+
+        return self.tiles.tile_size, self.tiles.awake.copy()
+
+    def awake_counts(self) -> np.ndarray:
+        """
+        Returns how many times each tile was awake at the start or the end of a step. Between two calls, only the
+        cells of the tiles whose count changed or which are awake at the second one can have changed, along with the
+        cells next to them.
+        """
+
+        return self._awake_counts.copy()
+
+    def _correct(self, amount: float):
+        """Spreads the liquid lost or gained to rounding back over the grid, see `MassCorrection`."""
+
+        if not amount:
+            return
+
+        # Without any moving liquid, the correction is spread over the wet cells of the sleeping tiles too
+        wet = self.liquid >= LIQUID_MIN
+        if not (wet & ~self.settled).any():
+            self._awake_counts += tile_any(wet, self.tiles.tile_size)
+
+        previous = self.liquid.copy() if self.metrics.enabled else None
+        self.correction.corrected += spread_correction([(self.liquid, self.settled)], amount)
+        if previous is not None:
+            self.metrics.change(np.subtract(self.liquid, previous, dtype=np.float64))
+
+    def run(self) -> set[CellView]:
+        """Runs `ITERATIONS_PER_FRAME` steps of the simulation. Returns the cells which need to be displayed."""
+
+        for _ in range(self.iterations_per_frame):
+            self.step()
+
+        start = perf_counter()
+        xs, ys = np.nonzero((self.types != BLANK) | (self.liquid >= LIQUID_MIN))
+        cells_to_display = {CellView(self, x, y) for x, y in zip(xs.tolist(), ys.tolist())}
+        if self.profiler.enabled:
+            self.profiler.lap('display', start)
+
+        return cells_to_display
@@ -0,0 +1,149 @@
+import threading
+from collections import deque
+from time import perf_counter, sleep
+from typing import Callable
+
+import numpy as np
+
+from .cell import CellType
+from .simulation import Simulation
+from .vectorized import VectorizedSimulation
+
+# How long the worker waits before looking for new commands while it is paused
+PAUSED_POLL_INTERVAL = 0.005
+
+
+class Snapshot:
+    """A read-only copy of the simulation state, published by a `SimulationWorker`."""
+
+    def __init__(self, state: dict[str, np.ndarray]):
+        self._buffers = {name: array.copy() for name, array in state.items()}
+        self.arrays: dict[str, np.ndarray] = {}
+        for name, buffer in self._buffers.items():
+            self.arrays[name] = buffer.view()
+            self.arrays[name].flags.writeable = False
+        self.step = 0
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    def _write(self, state: dict[str, np.ndarray], step: int):
+        for name, buffer in self._buffers.items():
+            np.copyto(buffer, state[name])
+        self.step = step
+
+
+class SimulationWorker:
+    """
+    Steps a simulation continuously on a background thread, independently of the frame rate of the display.
+
+    Edits are put on a command queue and applied between steps, and the state is published through two snapshot
+    buffers. Neither side ever waits for the other: the worker only writes the back buffer once the reader has taken
+    the front one, so the snapshot returned by `snapshot` stays untouched until the reader asks for the next one.
+    """
+
+    def __init__(self, simulation: Simulation | VectorizedSimulation, steps_per_second: float | None = None):
+        self.simulation = simulation
+        self.steps_per_second = steps_per_second
+        self.paused = False
+        self.steps = 0
+
+        # Appending and popping on the two ends of a deque is atomic, so it needs no lock with a single consumer
+        self._commands: deque[tuple[Callable, tuple]] = deque()
+
+        state = simulation.state()
+        self._snapshots = (Snapshot(state), Snapshot(state))
+        self._front = 0
+        self._taken = 0
+
+        self._running = False
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        """Starts stepping the simulation on the background thread."""
+
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="simulation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread, after it finishes its current step."""
+
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._apply_commands()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def submit(self, command: Callable, *args):
+        """Queues a call to be made on the worker thread between two steps."""
+
+        self._commands.append((command, args))
+
+    def add_liquid(self, x: int, y: int, amount: float):
+        self.submit(self.simulation.add_liquid, x, y, amount)
+
+    def set_cell_type(self, x: int, y: int, _type: CellType):
+        self.submit(self.simulation.set_cell_type, x, y, _type)
+
+    def reset(self):
+        self.submit(self.simulation.reset)
+
+    def snapshot(self) -> Snapshot:
+        """Returns the latest published state. It is not overwritten until the next call."""
+
+        front = self._front
+        self._taken = front
+        return self._snapshots[front]
+
+    def _apply_commands(self) -> bool:
+        """Runs the queued commands. Returns whether there were any."""
+
+        applied = False
+        while self._commands:
+            command, args = self._commands.popleft()
+            command(*args)
+            applied = True
+        return applied
+
+    def _publish(self) -> bool:
+        """
+        Copies the state into the back buffer and swaps it to the front, unless the reader hasn't taken the front yet
+        and so may still be reading the back buffer. Returns whether the state was published.
+        """
+
+        if self._taken != self._front:
+            return False
+
+        back = 1 - self._front
+        self._snapshots[back]._write(self.simulation.state(), self.steps)
+        self._front = back
+        return True
+
+    def _run(self):
+        published = True
+        while self._running:
+            edited = self._apply_commands()
+
+            if self.paused:
+                if edited or not published:
+                    published = self._publish()
+                sleep(PAUSED_POLL_INTERVAL)
+                continue
+
+            start = perf_counter()
+            self.simulation.step()
+            self.steps += 1
+            published = self._publish()
+
+            if self.steps_per_second:
+                sleep(max(1 / self.steps_per_second - (perf_counter() - start), 0))
@@ -0,0 +1,57 @@
+import argparse
+import sys
+
+import pygame as pg
+
+from config import PIXEL_SIZE, FPS, STREAM_HOST, STREAM_PORT
+from simulation.streaming import StreamClient
+from visual.renderer import ArrayRenderer
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Shows a simulation streamed by `headless.py --serve`.")
+    parser.add_argument('--host', default=STREAM_HOST, help="address of the stream server")
+    parser.add_argument('-p', '--port', type=int, default=STREAM_PORT, help="port of the stream server")
+    parser.add_argument('--pixel-size', type=int, default=PIXEL_SIZE, help="size of a cell in pixels")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None):
+    args = parse_args(argv)
+
+    try:
+        client = StreamClient(args.host, args.port)
+    except (OSError, ValueError) as error:
+        sys.exit(f"Could not connect to {args.host}:{args.port}: {error}")
+
+    pg.init()
+    height, width = client.shape
+    screen = pg.display.set_mode((width * args.pixel_size, height * args.pixel_size))
+    renderer = ArrayRenderer(pixel_size=args.pixel_size)
+    clock = pg.time.Clock()
+
+    streaming = True
+    with client:
+        while True:
+            if any(event.type == pg.QUIT for event in pg.event.get()):
+                break
+
+            # Catch up with every frame which arrived since the last redraw, then draw only the latest state
+            received = False
+            while streaming and client.pending():
+                streaming = client.receive()
+                received = received or streaming
+
+            if received:
+                renderer.draw(screen, client.state)
+                pg.display.flip()
+
+            status = f"cycle {client.cycle}" if streaming else f"stream ended at cycle {client.cycle}"
+            pg.display.set_caption(f"{args.host}:{args.port} - {status}")
+            clock.tick(FPS)
+
+    pg.quit()
+
+
+if __name__ == '__main__':
+    main()
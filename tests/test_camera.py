@@ -0,0 +1,60 @@
+import pytest
+
+from visual.camera import Camera
+
+
+def _camera(zoom: float, x: float, y: float) -> Camera:
+    """Returns a camera over a 1000 by 500 grid, which only fits the 800 by 600 viewport below a zoom of 0.8."""
+
+    camera = Camera((1000, 500), (800, 600), zoom=zoom, max_zoom=40)
+    camera.zoom, camera.x, camera.y = zoom, x, y
+    return camera
+
+
+def test_visible_cells():
+    camera = _camera(4, 10.5, 20.0)
+
+    # 800 by 600 pixels show 200 columns and 150 rows, starting in the column under the left edge
+    assert camera.visible() == (slice(20, 170), slice(10, 211))
+    assert camera.visible(16) == (slice(1, 11), slice(0, 14))
+
+
+@pytest.mark.parametrize('zoom', [0.25, 0.5, 1])
+def test_visible_cells_zoomed_out(zoom):
+    camera = _camera(zoom, 200.0, 0.0)
+
+    rows, columns = camera.visible()
+    assert (rows.start, rows.stop) == (0, min(int(600 / zoom), 500))
+    assert (columns.start, columns.stop) == (200, min(200 + int(800 / zoom), 1000))
+    # Blocks are cut off at the edge of the grid, rounded up so a partial block is still shown
+    rows, columns = camera.visible(64)
+    assert (rows.start, rows.stop) == (0, min(-(-600 // (64 * zoom)), 8))
+    assert (columns.start, columns.stop) == (3, min(-(-(200 + 800 / zoom) // 64), 16))
+
+
+def test_the_grid_fits_when_zoomed_out():
+    camera = Camera((1000, 500), (800, 600), zoom=10)
+    assert camera.zoom == camera.min_zoom == 0.8
+    assert camera.visible() == (slice(0, 500), slice(0, 1000))
+    assert camera.level == 1
+
+
+@pytest.mark.parametrize('zoom', [40, 10, 2.5, 1, 0.8, 0.3])
+def test_pixels(zoom):
+    camera = _camera(zoom, 3.25, 7.0)
+
+    assert camera.pixel(3.25, 7) == (0, 0)
+    assert camera.pixel(13.25, 8) == (round(10 * zoom), round(zoom))
+    # Neighbouring cells are drawn edge to edge, without gaps or overlaps
+    edges = [camera.pixel(column, 0)[0] for column in range(4, 60)]
+    widths = {right - left for left, right in zip(edges, edges[1:])}
+    assert widths <= {int(zoom), -(-zoom // 1)}
+
+
+def test_zoom_keeps_the_cell_under_the_cursor():
+    camera = _camera(4, 100.0, 50.0)
+    cell = camera.to_grid((400, 300))
+
+    for factor in (2.0, 1.5, 0.5, 0.5):
+        camera.zoom_at(factor, (400, 300))
+        assert camera.to_grid((400, 300)) == cell
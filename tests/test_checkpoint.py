@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from simulation import CellType, ChunkedSimulation, Simulation, VectorizedSimulation
+from simulation.checkpoint import CHECKPOINT_FIELDS, Checkpoint, load_checkpoint, save_checkpoint
+from simulation.kernel import SYMMETRIC_RULE
+from simulation.regions import rect
+
+
+def _configured(simulation):
+    simulation.add_liquid_region(rect(4, 12, 2, 18), 1.0)
+    simulation.set_cell_type(2, 3, CellType.SOURCE)
+    simulation.set_cell_type(10, 10, CellType.DRAIN)
+    simulation.emitters.configure(2, 3, rate=0.5, period=7, duty=3)
+    simulation.emitters.configure(10, 10, rate=0.02)
+    simulation.flow_speed = 0.5
+    simulation.source_rate = 0.3
+    simulation.drain_rate = 0.1
+    for _ in range(5):
+        simulation.step()
+
+
+@pytest.mark.parametrize('engine', [Simulation, VectorizedSimulation, ChunkedSimulation])
+def test_round_trip(engine, tmp_path):
+    simulation = engine(20, 16)
+    _configured(simulation)
+    filename = str(tmp_path / 'state.ssdc')
+    save_checkpoint(simulation, filename)
+
+    # Loaded into a fresh engine, the run goes on exactly as it would have
+    loaded = load_checkpoint(filename, engine)
+    for name in CHECKPOINT_FIELDS:
+        assert np.array_equal(loaded.state()[name], simulation.state()[name])
+    assert (loaded.flow_speed, loaded.source_rate, loaded.drain_rate) == (0.5, 0.3, 0.1)
+    assert loaded.emitters.settings() == simulation.emitters.settings()
+    assert loaded.emitters.step == simulation.emitters.step
+
+    for _ in range(20):
+        simulation.step()
+        loaded.step()
+    assert np.array_equal(loaded.state()['liquid'], simulation.state()['liquid'])
+
+
+def test_restore_replaces_rule_and_emitter_settings(tmp_path):
+    simulation = VectorizedSimulation(20, 16, rule=SYMMETRIC_RULE)
+    _configured(simulation)
+    filename = str(tmp_path / 'state.ssdc')
+    save_checkpoint(simulation, filename)
+
+    target = VectorizedSimulation(20, 16)
+    target.set_cell_type(10, 10, CellType.DRAIN)
+    target.emitters.configure(10, 10, rate=0.9, period=4, duty=1)
+    Checkpoint(filename).restore(target)
+    assert target.rule is SYMMETRIC_RULE
+    assert target.emitters.settings() == [(2, 3, 0.5, 7, 3), (10, 10, 0.02, 0, 0)]
+
+    # The cell engine can't follow the symmetric rule, so it is left as it was
+    cell = Simulation(20, 16)
+    with pytest.raises(ValueError):
+        Checkpoint(filename).restore(cell)
+    assert not cell.state()['liquid'].any()
+
+
+def test_rejects_other_files_and_sizes(tmp_path):
+    filename = tmp_path / 'state.ssdc'
+    filename.write_bytes(b'not a checkpoint')
+    with pytest.raises(ValueError):
+        Checkpoint(str(filename))
+
+    save_checkpoint(VectorizedSimulation(20, 16), str(filename))
+    with pytest.raises(ValueError):
+        Checkpoint(str(filename)).restore(VectorizedSimulation(16, 20))
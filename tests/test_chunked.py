@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from simulation import CellType, ChunkedSimulation, VectorizedSimulation
+from simulation.scenarios import SCENARIOS
+
+
+# A grid whose size isn't a multiple of the chunks, so the last row and column of chunks are cut short
+@pytest.mark.parametrize('scenario', ['basin_fill', 'pipeline', 'dam_break', 'u_tube'])
+def test_matches_the_vectorized_engine(scenario):
+    expected = VectorizedSimulation(70, 45)
+    simulation = ChunkedSimulation(70, 45, chunk_size=16)
+    for engine in (expected, simulation):
+        SCENARIOS[scenario](engine)
+        for _ in range(100):
+            engine.step()
+
+    state = simulation.state()
+    np.testing.assert_allclose(state['liquid'], expected.liquid, rtol=0, atol=1e-12)
+    assert np.array_equal(state['types'], expected.types)
+    # Chunks which ran dry are freed, so only the flags of the wet cells are kept
+    wet = expected.liquid != 0
+    for name in ('settled', 'settle_count', 'flowing_down'):
+        assert np.array_equal(state[name][wet], getattr(expected, name)[wet])
+
+
+def test_only_occupied_chunks_are_allocated():
+    simulation = ChunkedSimulation(1000, 800, chunk_size=32)
+    assert not simulation.chunks
+
+    simulation.add_liquid(5, 5, 1.0)
+    simulation.set_cell_type(700, 990, CellType.SOLID)
+    assert set(simulation.chunks) == {(0, 0), (21, 30)}
+    assert simulation.chunks[21, 30].liquid.shape == (32, 32)
+    assert simulation.types[700, 990] == CellType.SOLID.value
+
+    # Liquid flowing out of a chunk allocates the one it flows into
+    simulation.add_liquid(31, 5, 4.0)
+    for _ in range(5):
+        simulation.step()
+    assert (1, 0) in simulation.chunks
+    assert simulation.liquid[32:40, :40].sum() > 0
@@ -0,0 +1,47 @@
+import pytest
+
+from simulation import CellType, Simulation, VectorizedSimulation
+from simulation.regions import rect
+
+
+@pytest.mark.parametrize('engine', [Simulation, VectorizedSimulation])
+def test_rates_and_schedules(engine):
+    simulation = engine(12, 12)
+    simulation.add_liquid_region(rect(6, 12, 0, 12), 2.0)
+    simulation.source_rate = 0.25
+    simulation.set_cell_type(1, 2, CellType.SOURCE)
+    simulation.emitters.configure(1, 2, rate=0.6, period=4, duty=2)
+    # Without settings of its own, an emitter uses the engine's rate
+    simulation.set_cell_type(1, 9, CellType.SOURCE)
+    simulation.set_cell_type(9, 6, CellType.DRAIN)
+    simulation.emitters.configure(9, 6, rate=0.1, period=3, duty=1)
+    simulation.metrics.enabled = True
+    metrics = simulation.metrics
+
+    for step in range(12):
+        inflow, outflow = metrics.inflow, metrics.outflow
+        simulation.step()
+        if step == 0:
+            # The open neighbours of a source share its rate
+            assert simulation.state()['liquid'][0, 2] == pytest.approx(0.6 / 4)
+
+        on = step % 4 < 2
+        assert metrics.inflow - inflow == pytest.approx(0.6 * on + 0.25)
+        assert metrics.outflow - outflow == pytest.approx(0.1 if step % 3 == 0 else 0)
+
+
+def test_configure_checks_its_arguments():
+    simulation = VectorizedSimulation(8, 8)
+    simulation.set_cell_type(2, 2, CellType.DRAIN)
+
+    with pytest.raises(ValueError):
+        simulation.emitters.configure(3, 3, rate=0.5)
+    with pytest.raises(ValueError):
+        simulation.emitters.configure(2, 2, period=4, duty=5)
+
+    # Settings are kept while the cell stays an emitter of the same type
+    simulation.emitters.configure(2, 2, rate=0.5, period=4, duty=1)
+    simulation.set_cell_type(2, 2, CellType.DRAIN)
+    assert simulation.emitters.settings() == [(2, 2, 0.5, 4, 1)]
+    simulation.set_cell_type(2, 2, CellType.SOURCE)
+    assert simulation.emitters.settings() == []
@@ -0,0 +1,31 @@
+import numpy as np
+
+from simulation import CellType, Ensemble
+from simulation.regions import rect
+
+
+def _pool(simulation):
+    simulation.add_liquid_region(rect(16, 30, 4, 36), 1.0)
+    simulation.set_cell_type(24, 20, CellType.DRAIN)
+    simulation.set_cell_type(4, 10, CellType.SOURCE)
+
+
+def test_members_evolve_like_standalone_simulations():
+    ensemble = Ensemble(_pool, 3, 40, 32, flow_speed=[1.0, 0.5, 1.0], drain_rate=[0.2, 0.2, 0.05])
+    ensemble.run(20)
+    # The last member goes on from a different state
+    ensemble.liquid[2][rect(2, 8, 2, 10)] += 1.5
+    ensemble.settled[2][rect(2, 8, 2, 10)] = False
+
+    simulations = [ensemble.member(index) for index in range(3)]
+    ensemble.run(150)
+    for simulation in simulations:
+        for _ in range(150):
+            simulation.step()
+
+    totals = ensemble.total_liquid()
+    assert len(set(totals.tolist())) == 3
+    for index, simulation in enumerate(simulations):
+        np.testing.assert_allclose(ensemble.liquid[index], simulation.liquid, rtol=0, atol=1e-12)
+        assert np.array_equal(ensemble.settled[index], simulation.settled)
+        assert np.array_equal(ensemble.flowing_down[index], simulation.flowing_down)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from simulation import ENGINES, CellType
+from simulation.equilibrium import fast_forward
+from simulation.scenarios import SCENARIOS
+
+
+@pytest.mark.parametrize('engine', ['cell', 'vectorized', 'chunked'])
+@pytest.mark.parametrize('scenario', ['pipeline', 'dam_break', 'u_tube'])
+def test_fast_forwarded_state_stays_at_rest(engine, scenario):
+    simulation = ENGINES[engine](64, 48)
+    SCENARIOS[scenario](simulation)
+    for _ in range(200):
+        simulation.step()
+
+    solved = fast_forward(simulation)
+    assert solved.any()
+    liquid = np.array(simulation.state()['liquid'])
+
+    for _ in range(10):
+        simulation.step()
+    after = np.array(simulation.state()['liquid'])
+    assert np.array_equal(after[solved], liquid[solved])
+    assert after.min() >= 0
+
+
+def test_regions_next_to_emitters_are_left_alone():
+    simulation = ENGINES['vectorized'](64, 48)
+    SCENARIOS['pipeline'](simulation)
+    for _ in range(200):
+        simulation.step()
+
+    state = simulation.state()
+    emitters = (state['types'] == CellType.SOURCE.value) | (state['types'] == CellType.DRAIN.value)
+    before = state['liquid'].copy()
+    solved = fast_forward(simulation)
+    assert not (solved[1:] & emitters[:-1]).any() and not (solved[:-1] & emitters[1:]).any()
+    assert not (solved[:, 1:] & emitters[:, :-1]).any() and not (solved[:, :-1] & emitters[:, 1:]).any()
+    assert np.array_equal(simulation.liquid[~solved], before[~solved])
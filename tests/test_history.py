@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from simulation import CellType, ChunkedSimulation, Simulation, VectorizedSimulation
+from simulation.history import History
+from simulation.regions import rect
+
+
+def _copy(state: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    return {name: np.array(array) for name, array in state.items()}
+
+
+@pytest.mark.parametrize('engine', [Simulation, VectorizedSimulation, ChunkedSimulation])
+def test_seek_rebuilds_every_recorded_step(engine):
+    simulation = engine(48, 40)
+    simulation.add_liquid_region(rect(2, 10, 2, 12), 1.0)
+    simulation.set_cell_type(30, 20, CellType.SOURCE)
+    history = History(keyframe_interval=7)
+
+    expected = []
+    for step in range(30):
+        # Edits between steps, also far from the moving liquid, end up in the next delta
+        if step == 12:
+            simulation.add_liquid(35, 45, 0.5)
+            simulation.set_cell_types(rect(20, 22, 0, 10), CellType.SOLID)
+        simulation.step()
+        history.record(simulation)
+        expected.append(_copy(simulation.state()))
+
+    assert (history.first_step, history.last_step) == (0, 29)
+    assert len(history.segments) == 5
+    for step, state in enumerate(expected):
+        rebuilt = history.seek(step)
+        for name in state:
+            assert np.array_equal(rebuilt[name], state[name])
+
+
+def test_deltas_only_hold_the_changed_cells():
+    simulation = VectorizedSimulation(256, 256)
+    simulation.add_liquid_region(rect(2, 6, 2, 6), 1.0)
+    history = History(keyframe_interval=100)
+    for _ in range(20):
+        simulation.step()
+        history.record(simulation)
+
+    segment, = history.segments
+    keyframe = sum(array.nbytes for array in segment.keyframe.values())
+    assert segment.nbytes - keyframe < keyframe / 10
+
+
+def test_restore_rewinds_and_recording_replaces_the_future():
+    simulation = VectorizedSimulation(32, 24)
+    simulation.add_liquid_region(rect(2, 10, 2, 12), 1.0)
+    history = History(keyframe_interval=5)
+    for _ in range(20):
+        simulation.step()
+        history.record(simulation)
+    rewound = _copy(history.seek(8))
+
+    history.restore(simulation, 8)
+    assert np.array_equal(simulation.liquid, rewound['liquid'])
+    assert history.last_step == 19
+
+    simulation.add_liquid(0, 30, 2.0)
+    expected = []
+    for _ in range(3):
+        simulation.step()
+        history.record(simulation)
+        expected.append(simulation.liquid.copy())
+    assert history.last_step == 11
+    for step, liquid in enumerate(expected, 9):
+        assert np.array_equal(history.seek(step)['liquid'], liquid)
+
+    with pytest.raises(IndexError):
+        history.seek(12)
+
+
+def test_oldest_segments_are_evicted():
+    simulation = VectorizedSimulation(32, 24)
+    simulation.add_liquid_region(rect(2, 10, 2, 12), 1.0)
+    history = History(max_bytes=30_000, keyframe_interval=4)
+    for _ in range(40):
+        simulation.step()
+        history.record(simulation)
+
+    assert history.nbytes <= 30_000
+    assert history.first_step > 0 and history.first_step % 4 == 0
+    assert history.last_step == 39
+    with pytest.raises(IndexError):
+        history.seek(0)
@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+# Modules of the package which importing it mustn't load
+ENGINE_MODULES = ['simulation.simulation', 'simulation.vectorized', 'simulation.chunked', 'simulation.parallel',
+                  'simulation.ensemble', 'simulation.worker', 'multiprocessing']
+
+
+def _loaded(code: str) -> list[str]:
+    """Returns which of the engine modules are loaded after running the code in a new interpreter."""
+
+    check = f"import sys; {code}; print(' '.join(m for m in {ENGINE_MODULES!r} if m in sys.modules))"
+    return subprocess.run([sys.executable, '-c', check], cwd=ROOT, capture_output=True, text=True,
+                          check=True).stdout.split()
+
+
+def test_engines_are_loaded_on_demand():
+    assert _loaded('import simulation') == []
+    assert _loaded('from simulation import ENGINES, CellType; ENGINES["vectorized"]') == ['simulation.vectorized']
+    assert _loaded('from simulation import ChunkedSimulation') == ['simulation.vectorized', 'simulation.chunked']
+    assert 'multiprocessing' in _loaded('from simulation import ParallelSimulation')
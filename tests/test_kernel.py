@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from simulation import CellType, Simulation, VectorizedSimulation
+from simulation.kernel import BOTTOM, SYMMETRIC_RULE, Flow, FlowRule, flow_bottom, flow_left, get_rule
+
+
+@pytest.mark.parametrize('flow_speed', [1.0, 0.5])
+def test_symmetric_rule_flows_mirrored_grids_the_mirrored_way(flow_speed):
+    rng = np.random.default_rng(3)
+    types = np.where(rng.random((20, 24)) < 0.1, CellType.SOLID.value, CellType.BLANK.value).astype(np.int8)
+    liquid = np.where((rng.random((20, 24)) < 0.5) & (types == CellType.BLANK.value), rng.random((20, 24)) * 2, 0)
+
+    results = []
+    for flip in (slice(None), slice(None, None, -1)):
+        simulation = VectorizedSimulation(24, 20, rule='symmetric')
+        simulation.flow_speed = flow_speed
+        simulation.load_state({
+            'liquid': liquid[:, flip],
+            'types': types[:, flip],
+            'settled': np.zeros((20, 24), dtype=bool),
+            'settle_count': np.zeros((20, 24), dtype=np.int16),
+            'flowing_down': np.zeros((20, 24), dtype=bool),
+        })
+        for _ in range(50):
+            simulation.step()
+        results.append(simulation.liquid[:, flip])
+
+    np.testing.assert_allclose(results[1], results[0], rtol=0, atol=1e-12)
+
+
+def test_rules_are_looked_up_by_name():
+    assert get_rule('symmetric') is SYMMETRIC_RULE
+    assert get_rule(SYMMETRIC_RULE) is SYMMETRIC_RULE
+    with pytest.raises(ValueError):
+        get_rule('unknown')
+    with pytest.raises(ValueError):
+        VectorizedSimulation(8, 8, rule='unknown')
+    with pytest.raises(ValueError):
+        Simulation(8, 8, rule='symmetric')
+
+
+def test_flows_running_together_go_in_different_directions():
+    with pytest.raises(ValueError):
+        FlowRule('twice', ((Flow(BOTTOM, flow_bottom, 'a'), Flow(BOTTOM, flow_left, 'b')),))
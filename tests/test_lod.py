@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from visual.lod import LodPyramid
+
+
+def _state(rng: np.random.Generator, shape: tuple[int, int]) -> dict[str, np.ndarray]:
+    return {
+        'liquid': rng.random(shape) * (rng.random(shape) < 0.5),
+        'types': rng.integers(0, 4, shape).astype(np.int8),
+        'flowing_down': rng.random(shape) < 0.2,
+    }
+
+
+def _edit(rng: np.random.Generator, state: dict[str, np.ndarray], block_size: int, awake: np.ndarray):
+    """Returns a copy of the state with new values in the cells of the awake blocks."""
+
+    height, width = state['liquid'].shape
+    changed = np.kron(awake, np.ones((block_size, block_size), dtype=bool))[:height, :width]
+    fresh = _state(rng, changed.shape)
+    return {name: np.where(changed, fresh[name], array) for name, array in state.items()}
+
+
+# Block sizes of the engines' tiles and chunks and one which isn't a power of two, on a grid whose size isn't a multiple
+# of them
+@pytest.mark.parametrize('block_size', [16, 32, 24])
+def test_incremental_updates_match_a_rebuild(block_size):
+    rng = np.random.default_rng(block_size)
+    shape = (100, 150)
+    blocks = (-(-shape[0] // block_size), -(-shape[1] // block_size))
+    state = _state(rng, shape)
+
+    pyramid = LodPyramid()
+    awake = rng.random(blocks) < 0.3
+    pyramid.update(state, (block_size, awake))
+    for _ in range(4):
+        # A step changes the cells of the blocks awake before or after it
+        previous, awake = awake, rng.random(blocks) < 0.3
+        state = _edit(rng, state, block_size, previous | awake)
+        pyramid.update(state, (block_size, awake))
+
+        expected = LodPyramid()
+        expected.update(state, (block_size, awake))
+        assert len(pyramid.levels) == len(expected.levels)
+        for level, channels in zip(pyramid.levels, expected.levels):
+            np.testing.assert_allclose(level, channels, rtol=0, atol=1e-5)
+
+        rows, columns = slice(0, 13), slice(0, 19)
+        for name, array in pyramid.level(3, rows, columns).items():
+            np.testing.assert_allclose(array, expected.level(3, rows, columns)[name], atol=1e-5)
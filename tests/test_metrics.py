@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from simulation import ENGINES, CellType, ChunkedSimulation, ParallelSimulation, VectorizedSimulation
+from simulation.regions import rect
+
+
+@pytest.mark.parametrize('engine', ['cell', 'vectorized', 'chunked'])
+def test_flows_account_for_the_liquid(engine):
+    simulation = ENGINES[engine](16, 16)
+    simulation.add_liquid_region(rect(4, 12, 2, 14), 1.0)
+    # A drain in the middle of the pool takes liquid which would otherwise flow on
+    simulation.set_cell_type(8, 8, CellType.DRAIN)
+    simulation.set_cell_type(2, 2, CellType.SOURCE)
+    simulation.metrics.enabled = True
+    simulation.metrics.add_region('left', rect(0, 16, 0, 8))
+
+    for _ in range(300):
+        simulation.step()
+
+    metrics = simulation.metrics
+    liquid = np.array(simulation.state()['liquid'])
+    assert metrics.inflow > 0 and metrics.outflow > 0 and metrics.truncated >= 0
+    assert metrics.drift == pytest.approx(0, abs=1e-9)
+    assert metrics.total == pytest.approx(liquid.sum(), abs=1e-9)
+    assert metrics.region_totals['left'] == pytest.approx(liquid[:, :8].sum(), abs=1e-9)
+    assert liquid.min() >= 0
+
+
+def _drain_pool(simulation, drain: tuple[int, int]) -> tuple[np.ndarray, float]:
+    simulation.add_liquid_region(rect(4, 60, 4, 60), 1.0)
+    simulation.set_cell_type(*drain, CellType.DRAIN)
+    simulation.metrics.enabled = True
+    for _ in range(150):
+        simulation.step()
+    return np.array(simulation.state()['liquid']), simulation.metrics.outflow
+
+
+# Chunks of 32 cells and the bands of two workers both meet between rows (and chunks between columns) 31 and 32
+@pytest.mark.parametrize('drain', [(31, 20), (32, 20), (20, 31), (20, 32), (32, 32)])
+def test_drains_on_chunk_and_band_borders(drain):
+    expected, outflow = _drain_pool(VectorizedSimulation(64, 64), drain)
+
+    liquid, chunked_outflow = _drain_pool(ChunkedSimulation(64, 64, chunk_size=32), drain)
+    np.testing.assert_allclose(liquid, expected, rtol=0, atol=1e-12)
+    assert chunked_outflow == pytest.approx(outflow, abs=1e-9)
+
+    with ParallelSimulation(64, 64, workers=2) as simulation:
+        liquid, parallel_outflow = _drain_pool(simulation, drain)
+    np.testing.assert_allclose(liquid, expected, rtol=0, atol=1e-12)
+    assert parallel_outflow == pytest.approx(outflow, abs=1e-9)
+    assert expected.min() >= 0
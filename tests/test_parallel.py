@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from simulation import CellType, ParallelSimulation, VectorizedSimulation
+from simulation.regions import rect
+
+
+def _pool_with_drain(simulation, drain: tuple[int, int]):
+    simulation.add_liquid_region(rect(4, 60, 4, 60), 1.0)
+    simulation.set_cell_type(*drain, CellType.DRAIN)
+    simulation.set_cell_type(10, 10, CellType.SOURCE)
+    for _ in range(150):
+        simulation.step()
+
+
+# With two workers, the bands meet between rows 31 and 32
+@pytest.mark.parametrize('drain', [(31, 20), (32, 20), (32, 31)])
+@pytest.mark.parametrize('workers', [1, 2])
+def test_bands_match_the_vectorized_engine(workers, drain):
+    expected = VectorizedSimulation(64, 64)
+    _pool_with_drain(expected, drain)
+
+    with ParallelSimulation(64, 64, workers=workers) as simulation:
+        assert len(simulation.bands) == workers
+        _pool_with_drain(simulation, drain)
+        np.testing.assert_allclose(simulation.liquid, expected.liquid, rtol=0, atol=1e-12)
+        assert np.array_equal(simulation.settled, expected.settled)
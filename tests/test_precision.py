@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from simulation import CellType, ChunkedSimulation, VectorizedSimulation
+from simulation.regions import rect
+
+
+def _closed_box(engine, precision: str):
+    simulation = engine(48, 40, precision=precision)
+    simulation.set_cell_types(rect(0, 40, 0, 1), CellType.SOLID)
+    simulation.set_cell_types(rect(0, 40, 47, 48), CellType.SOLID)
+    simulation.set_cell_types(rect(39, 40, 0, 48), CellType.SOLID)
+    simulation.add_liquid_region(rect(5, 38, 1, 16), 1.0)
+    simulation.add_liquid_region(rect(30, 38, 20, 46), 0.7)
+    return simulation
+
+
+@pytest.mark.parametrize('engine', [VectorizedSimulation, ChunkedSimulation])
+def test_single_precision_keeps_the_total(engine):
+    single, double = _closed_box(engine, 'float32'), _closed_box(engine, 'float64')
+    assert single.correction is not None
+
+    for _ in range(400):
+        single.step()
+        double.step()
+
+    total = float(double.state()['liquid'].sum())
+    assert single.state()['liquid'].dtype == np.float32
+    # Only the leftovers dropped below `LIQUID_MIN` leave the box, the same in both precisions
+    assert float(single.state()['liquid'].sum(dtype=np.float64)) == pytest.approx(total, rel=1e-7)
@@ -0,0 +1,53 @@
+import numpy as np
+
+from simulation.recording import StateRecorder, StateRecording
+
+
+def _state(seed: int) -> dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    return {
+        'liquid': rng.random((12, 20)).astype(np.float32),
+        'types': rng.integers(0, 4, (12, 20), dtype=np.int8),
+        'flowing_down': rng.random((12, 20)) < 0.5,
+        # Fields which aren't needed to render a frame aren't recorded
+        'settled': np.ones((12, 20), dtype=bool),
+    }
+
+
+def test_frames_are_read_back(tmp_path):
+    filename = str(tmp_path / 'run.ssdr')
+    with StateRecorder(filename, frequency=3) as recorder:
+        for cycle in range(10):
+            recorder.record(_state(cycle), cycle)
+        assert recorder.frames == 4
+
+    with StateRecording(filename) as recording:
+        assert recording.shape == (12, 20)
+        assert recording.cycles == [0, 3, 6, 9]
+        for cycle, frame in recording:
+            expected = _state(cycle)
+            assert frame.keys() == {'liquid', 'types', 'flowing_down'}
+            for name, array in frame.items():
+                assert array.dtype == expected[name].dtype
+                assert np.array_equal(array, expected[name])
+
+
+def test_frame_cut_short_is_ignored(tmp_path):
+    filename = tmp_path / 'run.ssdr'
+    with StateRecorder(str(filename)) as recorder:
+        for cycle in range(3):
+            recorder.record(_state(cycle), cycle)
+
+    filename.write_bytes(filename.read_bytes()[:-10])
+    with StateRecording(str(filename)) as recording:
+        assert recording.cycles == [0, 1]
+        assert np.array_equal(recording[1]['liquid'], _state(1)['liquid'])
+
+
+def test_recording_without_frames(tmp_path):
+    filename = str(tmp_path / 'run.ssdr')
+    with StateRecorder(filename):
+        pass
+
+    with StateRecording(filename) as recording:
+        assert len(recording) == 0 and recording.shape is None
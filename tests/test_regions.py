@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from simulation import ENGINES, CellType
+from simulation.regions import rect
+
+# Rects crossing the borders of the tiles and of the chunks of a 40 by 40 grid
+EDITS = [
+    (rect(14, 19, 3, 12), CellType.SOLID),
+    (rect(30, 34, 15, 18), CellType.SOURCE),
+    (rect(38, 40, 30, 33), CellType.DRAIN),
+    (rect(15, 17, 5, 8), CellType.BLANK),
+]
+POOL = (rect(20, 26, 14, 35), 0.75)
+
+
+def _settled(engine: str):
+    simulation = ENGINES[engine](40, 40)
+    simulation.add_liquid_region(rect(36, 40, 0, 40), 1.0)
+    for _ in range(200):
+        simulation.step()
+    assert not simulation.awake_blocks()[1].any()
+    return simulation
+
+
+@pytest.mark.parametrize('engine', ['cell', 'vectorized', 'chunked'])
+def test_bulk_edits_match_cell_edits(engine):
+    bulk, cells = _settled(engine), _settled(engine)
+
+    for region, _type in EDITS:
+        bulk.set_cell_types(region, _type)
+    bulk.add_liquid_region(*POOL)
+
+    for (rows, cols), _type in EDITS:
+        for x in range(rows.start, rows.stop):
+            for y in range(cols.start, cols.stop):
+                cells.set_cell_type(x, y, _type)
+    (rows, cols), amount = POOL
+    for x in range(rows.start, rows.stop):
+        for y in range(cols.start, cols.stop):
+            cells.add_liquid(x, y, amount)
+    assert bulk.awake_blocks()[1].any()
+
+    for step in range(3):
+        assert np.array_equal(bulk.awake_blocks()[1], cells.awake_blocks()[1])
+        expected = cells.state()
+        for name, array in bulk.state().items():
+            assert np.array_equal(array, expected[name]), (step, name)
+        assert len(bulk.emitters) == len(cells.emitters) > 0
+        bulk.step()
+        cells.step()
@@ -0,0 +1,118 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from config import LIQUID_MAX, WALL_COLOR, SOURCE_COLOR, DRAIN_COLOR, WATER_COLOR
+from simulation import VectorizedSimulation
+from simulation.kernel import BLANK, SOLID, SOURCE, DRAIN
+from simulation.scenario_files import Scenario, load_ascii, load_scenario, parse_ascii
+
+SCENARIOS = os.path.join(os.path.dirname(__file__), '..', 'scenarios')
+
+MAP = ['#S.D', '#~~#', '####']
+
+
+def test_parse_ascii():
+    types, liquid = parse_ascii(MAP)
+
+    assert types.tolist() == [[SOLID, SOURCE, BLANK, DRAIN], [SOLID, BLANK, BLANK, SOLID], [SOLID] * 4]
+    assert liquid.tolist() == [[0, 0, 0, 0], [0, LIQUID_MAX, LIQUID_MAX, 0], [0, 0, 0, 0]]
+
+
+def test_ragged_rows_are_padded_with_blanks():
+    types, liquid = parse_ascii(['#', '#~~', ''])
+
+    assert types.shape == (3, 3)
+    assert types.tolist() == [[SOLID, BLANK, BLANK], [SOLID, BLANK, BLANK], [BLANK] * 3]
+    assert liquid[1].tolist() == [0, LIQUID_MAX, LIQUID_MAX]
+
+
+def test_unknown_characters():
+    with pytest.raises(ValueError, match="'xz'"):
+        parse_ascii(['#x.', 'z.#'])
+
+
+def test_ascii_file():
+    types, liquid = load_ascii(os.path.join(SCENARIOS, 'reservoir.txt'))
+
+    with open(os.path.join(SCENARIOS, 'reservoir.txt')) as file:
+        lines = file.read().splitlines()
+    assert types.shape == (len(lines), len(lines[0]))
+    assert types[1, 4] == SOURCE
+    assert (types[13, 28:37] == DRAIN).all()
+    assert (liquid[3:8, 2:24] == LIQUID_MAX).all()
+    assert liquid.sum() == 5 * 22 * LIQUID_MAX
+
+
+def test_json_file():
+    layout = load_scenario(os.path.join(SCENARIOS, 'reservoir.txt'))
+    scenario = load_scenario(os.path.join(SCENARIOS, 'reservoir.json'))
+
+    assert scenario.name == 'reservoir'
+    assert (scenario.types[9, 10:20] == SOLID).all()
+    assert (scenario.liquid[9, 30:36] == 0.5).all()
+    edited = np.zeros(layout.types.shape, dtype=bool)
+    edited[9, 10:20] = edited[9, 30:36] = True
+    assert (scenario.types[~edited] == layout.types[~edited]).all()
+    assert (scenario.liquid[~edited] == layout.liquid[~edited]).all()
+
+    simulation = scenario.create(VectorizedSimulation)
+    assert (simulation.width, simulation.height) == (scenario.width, scenario.height)
+    assert (simulation.flow_speed, simulation.source_rate, simulation.drain_rate) == (0.8, 0.3, 0.2)
+    assert simulation.emitters.settings() == [(1, 4, 0.4, 200, 150)]
+    state = simulation.state()
+    assert (state['types'] == scenario.types).all()
+    assert (state['liquid'] == scenario.liquid).all()
+
+
+def test_json_map_and_size(tmp_path):
+    path = tmp_path / 'inline.json'
+    path.write_text(json.dumps({'map': MAP, 'liquid': [{'rect': [0, 1, 0, 4], 'amount': 0.25}]}))
+    scenario = load_scenario(str(path))
+    assert scenario.types.tolist() == parse_ascii(MAP)[0].tolist()
+    # Pools only fill the blank cells
+    assert scenario.liquid[0].tolist() == [0, 0, 0.25, 0]
+
+    path.write_text(json.dumps({'width': 5, 'height': 2, 'cells': [{'type': 'drain', 'rect': [1, 2, 0, 5]}]}))
+    scenario = load_scenario(str(path))
+    assert (scenario.width, scenario.height) == (5, 2)
+    assert scenario.types.tolist() == [[BLANK] * 5, [DRAIN] * 5]
+
+
+@pytest.mark.parametrize('spec, message', [
+    ({'cells': []}, 'neither a layout'),
+    ({'map': MAP, 'parameters': {'viscosity': 1}}, 'Unknown parameters'),
+    ({'map': MAP, 'emitters': [{'at': [1, 1]}]}, 'neither a source nor a drain'),
+    ({'map': MAP, 'emitters': [{'at': [5, 0]}]}, 'neither a source nor a drain'),
+])
+def test_json_errors(tmp_path, spec, message):
+    path = tmp_path / 'broken.json'
+    path.write_text(json.dumps(spec))
+
+    with pytest.raises(ValueError, match=message):
+        load_scenario(str(path))
+
+
+def test_image_file(tmp_path):
+    pg = pytest.importorskip('pygame')
+    colors = [[WALL_COLOR, SOURCE_COLOR, (10, 20, 30)], [DRAIN_COLOR, WATER_COLOR, WALL_COLOR]]
+    surface = pg.Surface((3, 2))
+    for x, row in enumerate(colors):
+        for y, color in enumerate(row):
+            surface.set_at((y, x), color)
+    path = str(tmp_path / 'level.png')
+    pg.image.save(surface, path)
+
+    scenario = load_scenario(path)
+
+    assert scenario.types.tolist() == [[SOLID, SOURCE, BLANK], [DRAIN, BLANK, SOLID]]
+    assert scenario.liquid.tolist() == [[0, 0, 0], [0, LIQUID_MAX, 0]]
+
+
+def test_size_mismatch():
+    scenario = Scenario(*parse_ascii(MAP))
+
+    with pytest.raises(ValueError, match='shape'):
+        scenario.apply(VectorizedSimulation(scenario.width + 1, scenario.height))
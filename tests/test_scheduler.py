@@ -0,0 +1,60 @@
+import pytest
+
+from simulation.scheduler import StepScheduler
+
+
+def test_steps_fit_the_budget():
+    scheduler = StepScheduler(budget=0.01, max_steps=50, hysteresis=0.25, smoothing=0.5)
+    assert scheduler.steps == 1
+
+    # 1 ms per step fits 10 steps in the budget
+    scheduler.update(1, 0.001)
+    assert scheduler.step_time == pytest.approx(0.001)
+    assert scheduler.steps == 10
+
+    # Steps twice as slow move the average half way, to 1.5 ms a step and 6 steps
+    scheduler.update(10, 0.02)
+    assert scheduler.step_time == pytest.approx(0.0015)
+    assert scheduler.steps == 6
+
+
+def test_hysteresis():
+    scheduler = StepScheduler(budget=0.01, hysteresis=0.25, smoothing=1.0)
+    scheduler.update(1, 0.001)
+    assert scheduler.steps == 10
+
+    # 12 steps are within a quarter of 10, 8 too, 13 are not
+    scheduler.update(10, 0.01 / 12 * 10)
+    assert scheduler.steps == 10
+    scheduler.update(10, 0.01 / 8 * 10)
+    assert scheduler.steps == 10
+    scheduler.update(10, 0.01 / 13 * 10)
+    assert scheduler.steps == 13
+
+
+def test_steps_are_clamped():
+    scheduler = StepScheduler(budget=0.01, min_steps=2, max_steps=20, smoothing=1.0)
+    scheduler.update(1, 1e-6)
+    assert scheduler.steps == 20
+    scheduler.update(20, 20 * 1.0)
+    assert scheduler.steps == 2
+
+    # Frames without steps say nothing about their cost
+    scheduler.update(0, 1.0)
+    assert scheduler.step_time == pytest.approx(1.0)
+    assert scheduler.steps == 2
+
+
+def test_run():
+    class Counter:
+        steps = 0
+
+        def step(self):
+            self.steps += 1
+
+    scheduler = StepScheduler(budget=1.0, max_steps=7)
+    counter = Counter()
+    assert scheduler.run(counter) == 1
+    # Counting takes far less than the budget, so the next frame runs the most steps
+    assert scheduler.run(counter) == 7
+    assert counter.steps == 8
@@ -0,0 +1,59 @@
+import threading
+
+import numpy as np
+import pytest
+
+from simulation import CellType, ChunkedSimulation, Simulation, VectorizedSimulation
+from simulation.recording import RECORDED_FIELDS
+from simulation.regions import rect
+from simulation.streaming import ChangeTracker, StreamClient, StreamServer, apply_frame, encode_delta, encode_keyframe
+
+
+@pytest.mark.parametrize('engine', [Simulation, VectorizedSimulation, ChunkedSimulation])
+def test_deltas_keep_a_copy_up_to_date(engine):
+    simulation = engine(48, 40)
+    simulation.add_liquid_region(rect(2, 10, 2, 12), 1.0)
+    simulation.set_cell_type(30, 40, CellType.SOURCE)
+    tracker = ChangeTracker(simulation)
+    copy = {name: np.zeros_like(simulation.state()[name]) for name in RECORDED_FIELDS}
+    apply_frame(copy, True, encode_keyframe(simulation.state()))
+
+    for frame in range(20):
+        # A frame covers all the steps since the previous one
+        for _ in range(frame % 3 + 1):
+            simulation.step()
+            tracker.step()
+        indices, values = tracker.changes()
+        apply_frame(copy, False, encode_delta(indices, values))
+
+        state = simulation.state()
+        for name in RECORDED_FIELDS:
+            assert np.array_equal(copy[name], state[name])
+
+
+def test_viewers_follow_the_server():
+    simulation = VectorizedSimulation(48, 40)
+    simulation.add_liquid_region(rect(2, 10, 2, 12), 1.0)
+    with StreamServer(simulation, host='127.0.0.1', port=0, frequency=2) as server:
+        clients = []
+        connect = threading.Thread(target=lambda: clients.append(StreamClient(*server.address)))
+        connect.start()
+        cycle = 0
+        while connect.is_alive():
+            server.update(cycle)
+            cycle += 1
+            connect.join(0.01)
+
+        client, = clients
+        with client:
+            assert client.receive() and client.shape == (40, 48)
+            for _ in range(10):
+                simulation.step()
+                server.update(cycle)
+                if cycle % 2 == 0:
+                    assert client.receive() and client.cycle == cycle
+                    for name in RECORDED_FIELDS:
+                        assert np.array_equal(client.state[name], simulation.state()[name])
+                cycle += 1
+
+    assert client.frames == 6
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from config import LIQUID_MIN
+from simulation import CellType, Simulation, VectorizedSimulation
+from simulation.scenarios import SCENARIOS
+
+
+@pytest.mark.parametrize('scenario', ['basin_fill', 'pipeline', 'dam_break', 'u_tube'])
+def test_follows_the_cell_engine(scenario):
+    expected = Simulation(40, 32)
+    simulation = VectorizedSimulation(40, 32)
+    for engine in (expected, simulation):
+        SCENARIOS[scenario](engine)
+        for _ in range(100):
+            engine.step()
+
+    liquid = expected.state()['liquid']
+    assert liquid.sum() > 0
+    # Unlike the cell engine, the vectorized one only picks up the cells unsettled during a step in the next one
+    np.testing.assert_allclose(simulation.liquid, liquid, rtol=0, atol=1e-2)
+    assert simulation.liquid.sum() == pytest.approx(liquid.sum(), rel=1e-3)
+
+
+def test_cell_api():
+    simulation = VectorizedSimulation(8, 6)
+    simulation.set_cell_type(5, 0, CellType.SOLID)
+    simulation.add_liquid(1, 3, 2.0)
+    simulation.iterations_per_frame = 3
+
+    cells = simulation.run()
+    assert {(cell.x, cell.y) for cell in cells} == {
+        (x, y) for x, y in zip(*np.nonzero((simulation.types != CellType.BLANK.value) | (simulation.liquid >= LIQUID_MIN)))
+    }
+    cell = simulation.cells[5, 0]
+    assert cell.type == CellType.SOLID and cell.top.x == 4 and cell.left is None
+    assert simulation.cells[4, 3].liquid == simulation.liquid[4, 3]
+
+    simulation.reset()
+    assert not simulation.liquid.any() and not simulation.types.any() and not simulation.run()
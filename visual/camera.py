@@ -0,0 +1,112 @@
+import math
+
+from config import PIXEL_SIZE, MAX_ZOOM
+
+
+class Camera:
+    """
+    The part of the grid shown in the viewport, the top left `view_size` pixels of the screen.
+
+    `x` and `y` are the grid column and row at the top left corner of the viewport, and `zoom` is the size of a cell in
+    pixels, which drops below one when zoomed out far enough to show a large grid whole. The camera is kept over the
+    grid, and a grid smaller than the viewport stays in its top left corner.
+    """
+
+    def __init__(self, grid_size: tuple[int, int], view_size: tuple[int, int], zoom: float = PIXEL_SIZE,
+                 max_zoom: float = MAX_ZOOM):
+        self.grid_width, self.grid_height = grid_size
+        self.view_width, self.view_height = view_size
+        self.default_zoom = zoom
+
+        # Zooming out stops once the whole grid fits
+        self.min_zoom = min(zoom, self.view_width / self.grid_width, self.view_height / self.grid_height)
+        self.max_zoom = max(max_zoom, zoom)
+
+        self.reset()
+
+    def reset(self):
+        """Goes back to the default zoom, or zooms out until the whole grid fits if it doesn't at the default zoom."""
+
+        self.zoom = self.min_zoom
+        self.x = self.y = 0.0
+        self._clamp()
+
+    @property
+    def level(self) -> int:
+        """The level of detail to draw at: each pixel shows at most 2 ** level by 2 ** level cells."""
+
+        return max(0, math.ceil(-math.log2(self.zoom)))
+
+    def pan(self, dx: float, dy: float):
+        """Drags the grid by the given number of pixels."""
+
+        self.x -= dx / self.zoom
+        self.y -= dy / self.zoom
+        self._clamp()
+
+    def zoom_at(self, factor: float, position: tuple[int, int]):
+        """Zooms in by the factor, or out if it is below one, keeping the cell under the pixel position in place."""
+
+        x, y = self.x + position[0] / self.zoom, self.y + position[1] / self.zoom
+        self.zoom = min(max(self.zoom * factor, self.min_zoom), self.max_zoom)
+        self.x, self.y = x - position[0] / self.zoom, y - position[1] / self.zoom
+        self._clamp()
+
+    def contains(self, position: tuple[int, int]) -> bool:
+        """Checks whether the pixel position lies in the viewport."""
+
+        return 0 <= position[0] < self.view_width and 0 <= position[1] < self.view_height
+
+    def to_grid(self, position: tuple[int, int]) -> tuple[int, int] | None:
+        """Returns the column and row of the cell at the pixel position, or None if there is no cell there."""
+
+        if not self.contains(position):
+            return None
+
+        column, row = int(self.x + position[0] / self.zoom), int(self.y + position[1] / self.zoom)
+        if not (0 <= column < self.grid_width and 0 <= row < self.grid_height):
+            return None
+        return column, row
+
+    def to_screen(self, column: float, row: float) -> tuple[float, float]:
+        """Returns the pixel position of the top left corner of a cell."""
+
+        return (column - self.x) * self.zoom, (row - self.y) * self.zoom
+
+    def visible(self, cell_size: int = 1) -> tuple[slice, slice]:
+        """Returns the rows and columns of the blocks of `cell_size` by `cell_size` cells the viewport shows."""
+
+        rows = slice(
+            int(self.y // cell_size),
+            min(math.ceil((self.y + self.view_height / self.zoom) / cell_size), math.ceil(self.grid_height / cell_size))
+        )
+        columns = slice(
+            int(self.x // cell_size),
+            min(math.ceil((self.x + self.view_width / self.zoom) / cell_size), math.ceil(self.grid_width / cell_size))
+        )
+        return rows, columns
+
+    def covering(self, rect: tuple[int, int, int, int]) -> tuple[slice, slice]:
+        """Returns the rows and columns of the cells under a rect of pixels, clipped to the viewport and the grid."""
+
+        left, top = max(rect[0], 0), max(rect[1], 0)
+        right, bottom = min(rect[0] + rect[2], self.view_width), min(rect[1] + rect[3], self.view_height)
+        rows = slice(
+            min(int(self.y + top / self.zoom), self.grid_height),
+            min(math.ceil(self.y + bottom / self.zoom), self.grid_height)
+        )
+        columns = slice(
+            min(int(self.x + left / self.zoom), self.grid_width),
+            min(math.ceil(self.x + right / self.zoom), self.grid_width)
+        )
+        return rows, columns
+
+    def pixel(self, column: float, row: float) -> tuple[int, int]:
+        """Returns the pixel the top left corner of a cell is drawn at, rounded the same way for every cell."""
+
+        x, y = self.to_screen(column, row)
+        return round(x), round(y)
+
+    def _clamp(self):
+        self.x = min(max(self.x, 0.0), max(self.grid_width - self.view_width / self.zoom, 0.0))
+        self.y = min(max(self.y, 0.0), max(self.grid_height - self.view_height / self.zoom, 0.0))
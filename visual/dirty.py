@@ -0,0 +1,80 @@
+import numpy as np
+import pygame as pg
+
+from simulation.kernel import spread_to_neighbors
+from simulation.tiles import group_tiles
+from .camera import Camera
+
+
+class DirtyRects:
+    """
+    Keeps track of the parts of the screen which change during a frame, so that only those are drawn again and sent
+    to the display.
+
+    The grid is tracked in the blocks of cells the engine sleeps in: before every step and after edits, `add_blocks`
+    adds the blocks the engine reports awake, see `awake_blocks`, since only those and the cells next to them can
+    change. `add_area` adds the cells under something drawn over the view, such as an overlay, which have to be drawn
+    again to clear it. `invalidate_view` redraws the whole view after anything changing all of it, like moving the
+    camera, and `invalidate` the whole screen. Whatever gets drawn adds its rect with `add`.
+    """
+
+    def __init__(self, awake: tuple[int, np.ndarray], height: int, width: int):
+        self.block_size = awake[0]
+        self.height = height
+        self.width = width
+        self.blocks = np.zeros(awake[1].shape, dtype=bool)
+
+        self.full = True
+        self.view_full = True
+        self._rects: list[pg.Rect] = []
+
+    def invalidate(self):
+        """Makes the next frame redraw the whole screen."""
+
+        self.full = self.view_full = True
+
+    def invalidate_view(self):
+        """Makes the next frame redraw the whole view of the grid."""
+
+        self.view_full = True
+
+    def add(self, rect: pg.Rect):
+        """Adds a rect drawn over during the frame."""
+
+        self._rects.append(pg.Rect(rect))
+
+    def add_blocks(self, awake: tuple[int, np.ndarray]):
+        """Adds the awake blocks of the engine, see `awake_blocks`, and the blocks around them."""
+
+        self.blocks |= awake[1] | spread_to_neighbors(awake[1])
+
+    def add_area(self, camera: Camera, rect: pg.Rect):
+        """Adds the blocks of the cells under a rect of the view."""
+
+        rows, columns = camera.covering(rect)
+        size = self.block_size
+        self.blocks[rows.start // size:-(-rows.stop // size), columns.start // size:-(-columns.stop // size)] = True
+
+    def regions(self) -> list[tuple[slice, slice]] | None:
+        """Returns the rows and columns of the cells to draw again, or None if the whole view has to be drawn."""
+
+        if self.view_full:
+            return None
+
+        size = self.block_size
+        return [
+            (slice(r0 * size, min(r1 * size, self.height)), slice(c0 * size, min(c1 * size, self.width)))
+            for r0, r1, c0, c1 in group_tiles(self.blocks).tolist()
+        ]
+
+    def update(self):
+        """Sends the rects drawn over to the display, like `pg.display.flip` sends all of it, and starts a new frame."""
+
+        if self.full:
+            pg.display.flip()
+        elif self._rects:
+            pg.display.update(self._rects)
+
+        self.full = self.view_full = False
+        self._rects.clear()
+        self.blocks[:] = False
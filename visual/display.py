@@ -1,18 +1,41 @@
+import os
+import time
+
 import pygame_widgets
 
 from config import *
-from simulation import Simulation, Cell, CellType
+from simulation import Simulation, SimulationWorker, Cell, CellType
+from simulation.recording import StateRecorder
+from simulation.checkpoint import Checkpoint, save_checkpoint
+from simulation.equilibrium import fast_forward
+from simulation.history import History
+from simulation.scheduler import StepScheduler
 from .recorder import Recorder
+from .renderer import ArrayRenderer
+from .camera import Camera
+from .dirty import DirtyRects
 from .button import Button
 from .slider import CustomSlider
 from .utils import *
 
+# Width the buttons and sliders below the grid need
+PANEL_WIDTH = 600
+
 
 def run(simulation: Simulation):
     pg.init()
     pg.font.init()
 
-    screen = pg.display.set_mode((WIDTH * PIXEL_SIZE, HEIGHT * PIXEL_SIZE + 125))
+    height, width = simulation.cells.shape
+    view_width, view_height = min(width * PIXEL_SIZE, VIEWPORT_WIDTH), min(height * PIXEL_SIZE, VIEWPORT_HEIGHT)
+    screen = pg.display.set_mode((max(view_width, PANEL_WIDTH), view_height + 125))
+    camera = Camera((width, height), (view_width, view_height))
+
+    # The view of the grid, and the parts of the screen around it which hold the widgets
+    view_rect = pg.Rect(0, 0, view_width, view_height)
+    panel_rects = [pg.Rect(0, view_height, screen.get_width(), screen.get_height() - view_height)]
+    if screen.get_width() > view_width:
+        panel_rects.append(pg.Rect(view_width, 0, screen.get_width() - view_width, view_height))
 
     reset_button = Button(screen, 15, pg.display.get_surface().get_size()[1] - 50, 75, 40,
                           "Reset", 24, (0, 0, 0), (0, 0, 0))
@@ -22,10 +45,13 @@ def run(simulation: Simulation):
     running = True
     lmb_pressed = False
     rmb_pressed = False
+    mmb_pressed = False
     s_pressed = False
     d_pressed = False
     paused = True
     placing_mode = True
+    show_stats = SHOW_STATS
+    simulation.profiler.enabled = show_stats
 
     my_font = pg.font.SysFont('Arial', 16, True)
 
@@ -50,78 +76,211 @@ def run(simulation: Simulation):
     prev_sim_grid_pos: tuple[int, int] | None = None
 
     recording = False
-    recorder = Recorder(filename=RECORDING_OUTPUT_FILE, frequency=RECORDING_FREQUENCY, cols=RECORDING_OUTPUT_COLUMNS, font=font)
+    if RECORDING_MODE == "state":
+        recorder = StateRecorder(filename=RECORDING_STATE_FILE, frequency=RECORDING_FREQUENCY)
+    else:
+        recorder = Recorder(filename=RECORDING_OUTPUT_FILE, frequency=RECORDING_FREQUENCY, cols=RECORDING_OUTPUT_COLUMNS, font=font)
+
+    renderer = ArrayRenderer() if RENDERER == "array" else None
+    dirty_rects = DirtyRects(simulation.awake_blocks(), height, width) if DIRTY_RECTS else None
+
+    worker = SimulationWorker(simulation) if BACKGROUND_SIMULATION else None
+    if worker:
+        renderer = renderer or ArrayRenderer()  # The worker only publishes the state arrays
+        worker.paused = paused
+        worker.start()
+    # Edits go through the worker's command queue while it owns the simulation
+    editor = worker or simulation
+
+    # The worker steps the simulation on its own thread, so the history is only kept when stepping between frames
+    history = History() if HISTORY and not worker else None
+    if history:
+        history.record(simulation)
+
+    scheduler = StepScheduler() if ADAPTIVE_STEPS and not worker else None
 
     cycle = 0
     grid = simulation.cells
-    cells_to_display = set([cell for row in grid for cell in row if not cell.settled])
+    cells_to_display = set() if renderer else set([cell for row in grid for cell in row if not cell.settled])
+    overlays: list[pg.Rect] = []
+    redraw_panel = True
+    view = (camera.x, camera.y, camera.zoom)
     while running:
-        screen.fill((255, 255, 255))  # Make background white
-        screen.blit(info_text, (250, pg.display.get_surface().get_size()[1] - 30))
-        pg.draw.line(screen, (0, 0, 0), (0, HEIGHT*PIXEL_SIZE), (WIDTH*PIXEL_SIZE, HEIGHT*PIXEL_SIZE))
+        if not dirty_rects or dirty_rects.full:
+            screen.fill((255, 255, 255))  # Make background white
+            redraw_panel = True
+        edited = False
 
+        # time.sleep(1 / FPS)
+        clock.tick(FPS)
         if not paused:
-            # time.sleep(1 / FPS)
-            clock.tick(FPS)
-            cells_to_display = simulation.run()
+            if scheduler:
+                simulation.iterations_per_frame = scheduler.steps
+            step_start = time.perf_counter()
+            if not renderer:
+                cells_to_display = simulation.run()
+                if history:
+                    history.record(simulation)
+            elif not worker:  # The worker steps the simulation on its own
+                for _ in range(simulation.iterations_per_frame):
+                    if dirty_rects:
+                        dirty_rects.add_blocks(simulation.awake_blocks())
+                    simulation.step()
+                    if history:
+                        history.record(simulation)
+            if scheduler:
+                scheduler.update(simulation.iterations_per_frame, time.perf_counter() - step_start)
             cycle += 1
 
         events = pg.event.get()
         for event in events:
             if event.type == pg.QUIT:
                 running = False
+            elif event.type == pg.WINDOWEXPOSED and dirty_rects:
+                dirty_rects.invalidate()  # The window was covered, so the whole of it has to be redrawn
             elif event.type == pg.MOUSEBUTTONDOWN:
                 if event.button == 1:  # LMB pressed
                     lmb_pressed = True
-                    display_grid_pos = get_grid_pos()
-                    sim_grid_pos = (display_grid_pos[0] // PIXEL_SIZE, display_grid_pos[1] // PIXEL_SIZE)
-                    if display_grid_pos[1] < HEIGHT*PIXEL_SIZE:  # Check if within simulation space
+                    sim_grid_pos = get_grid_pos(camera)
+                    if sim_grid_pos is not None:  # Check if within simulation space
                         if grid[sim_grid_pos[1], sim_grid_pos[0]].type in [CellType.SOLID, CellType.DRAIN, CellType.SOURCE]:
                             placing_mode = False  # With this mode it will remove blocks when dragged
                         else:
                             placing_mode = True
                     if reset_button.Rect.collidepoint(event.pos):
-                        simulation.reset()
+                        editor.reset()
                         pg.display.flip()
                         cycle = 0
                         placing_mode = 0  # Don't draw on button when clicked
-                        cells_to_display = simulation.run()
+                        cells_to_display = set() if renderer else simulation.run()
+                        if renderer:
+                            renderer.pyramid.invalidate()
+                        if dirty_rects:
+                            dirty_rects.invalidate_view()
                     elif pause_button.Rect.collidepoint(event.pos):
                         if paused:
                             pause_button.change_text("Pause")
                         else:
                             pause_button.change_text("Play")
                         paused = not paused
+                        if worker:
+                            worker.paused = paused
                 if event.button == 3:  # RMB
                     rmb_pressed = True
+                if event.button == 2:  # MMB drags the view
+                    mmb_pressed = True
             elif event.type == pg.MOUSEBUTTONUP:
                 if event.button == 1:  # LMB released
                     lmb_pressed = False
                     prev_sim_grid_pos = None
                 if event.button == 3:  # RMB
                     rmb_pressed = False
+                if event.button == 2:  # MMB
+                    mmb_pressed = False
+            elif event.type == pg.MOUSEMOTION and mmb_pressed:
+                camera.pan(*event.rel)
+            elif event.type == pg.MOUSEWHEEL and camera.contains(pg.mouse.get_pos()):
+                camera.zoom_at(ZOOM_STEP ** event.y, pg.mouse.get_pos())
             elif event.type == pg.KEYDOWN:  # Keyboard press
                 if event.key == pg.K_s:
                     s_pressed = True
                 elif event.key == pg.K_d:
                     d_pressed = True
+                elif event.key in (pg.K_LEFT, pg.K_RIGHT) and history and paused:
+                    # Scrub through the history, stepping from a rewound state continues from there
+                    step = history.position + (1 if event.key == pg.K_RIGHT else -1)
+                    if history.first_step <= step <= history.last_step:
+                        history.restore(simulation, step)
+                        if dirty_rects:
+                            dirty_rects.invalidate_view()
+                        if renderer:
+                            renderer.pyramid.invalidate()
+                        else:
+                            cells_to_display = set(
+                                cell for row in grid for cell in row
+                                if cell.type != CellType.BLANK or cell.liquid >= LIQUID_MIN
+                            )
             elif event.type == pg.KEYUP:
                 if event.key == pg.K_s:
                     s_pressed = False
                 elif event.key == pg.K_d:
                     d_pressed = False
+                elif event.key == pg.K_v:
+                    camera.reset()
+                elif event.key == pg.K_p:
+                    show_stats = not show_stats
+                    simulation.profiler.enabled = show_stats
+                    simulation.profiler.reset()
                 elif event.key == pg.K_r:
                     recording = not recording
                     if recording:
                         recorder.start()
                     else:
                         recorder.stop()
-
-
-        added_liquid_slider.draw()
-        compression_slider.draw()
-        flow_slider.draw()
-        iterations_slider.draw()
+                elif event.key == pg.K_k:
+                    if worker:
+                        worker.submit(save_checkpoint, simulation, CHECKPOINT_FILE)
+                    else:
+                        save_checkpoint(simulation, CHECKPOINT_FILE)
+                elif event.key == pg.K_e:
+                    if worker:
+                        worker.submit(fast_forward, simulation)
+                    else:
+                        fast_forward(simulation)
+                        cells_to_display = set() if renderer else simulation.run()
+                        if renderer:
+                            renderer.pyramid.invalidate()
+                        if dirty_rects:
+                            dirty_rects.invalidate_view()
+                elif event.key == pg.K_l and os.path.exists(CHECKPOINT_FILE):
+                    checkpoint = Checkpoint(CHECKPOINT_FILE)
+                    try:
+                        checkpoint.check(simulation)
+                    except ValueError as error:
+                        print(error)
+                    else:
+                        if worker:
+                            worker.submit(checkpoint.restore, simulation)
+                        else:
+                            checkpoint.restore(simulation)
+                        cells_to_display = set() if renderer else simulation.run()
+                        if renderer:
+                            renderer.pyramid.invalidate()
+                        if dirty_rects:
+                            dirty_rects.invalidate_view()
+                        flow_slider.slider.setValue(checkpoint.parameters['flow_speed'])
+                        compression_slider.slider.setValue(checkpoint.parameters['compression_max'])
+                        iterations_slider.slider.setValue(checkpoint.parameters['iterations_per_frame'])
+                        prev_flow = flow_slider.get_value(2)
+                        prev_compression = compression_slider.get_value(2)
+                        prev_iter = int(iterations_slider.get_value())
+
+
+        # Moving the view changes all of it
+        if (camera.x, camera.y, camera.zoom) != view:
+            view = (camera.x, camera.y, camera.zoom)
+            if dirty_rects:
+                dirty_rects.invalidate_view()
+
+        # The widgets and the rest of the screen around the grid only change with the input
+        if redraw_panel or events:
+            if dirty_rects:
+                for rect in panel_rects:
+                    screen.fill((255, 255, 255), rect)
+                    dirty_rects.add(rect)
+            screen.blit(info_text, (250, pg.display.get_surface().get_size()[1] - 30))
+            pg.draw.line(screen, (0, 0, 0), (0, view_height), (view_width, view_height))
+
+            added_liquid_slider.draw()
+            compression_slider.draw()
+            flow_slider.draw()
+            iterations_slider.draw()
+            pygame_widgets.update(events)
+            reset_button.draw()
+            pause_button.draw()
+
+        # The text boxes of the sliders only show a value changed by the input on the next frame
+        redraw_panel = bool(events)
 
         current_flow = flow_slider.get_value(2)
         current_iter = int(iterations_slider.get_value())
@@ -140,18 +299,17 @@ def run(simulation: Simulation):
             prev_compression = current_compression
 
         liquid_amount = added_liquid_slider.get_value()
-        pygame_widgets.update(events)
 
         if lmb_pressed:  # Define behavior for lmb pressed down
-            display_grid_pos = get_grid_pos()
+            sim_grid_pos = get_grid_pos(camera)
 
-            if display_grid_pos[1] < HEIGHT*PIXEL_SIZE and 0 <= display_grid_pos[0] < WIDTH*PIXEL_SIZE:
-                sim_grid_pos = (display_grid_pos[0] // PIXEL_SIZE, display_grid_pos[1] // PIXEL_SIZE)
+            if sim_grid_pos is not None:
                 pos_changed = sim_grid_pos != prev_sim_grid_pos
                 prev_sim_grid_pos = sim_grid_pos
 
                 if not placing_mode and pos_changed:  # If block exists at pressed position then remove it
-                    simulation.set_cell_type(sim_grid_pos[1], sim_grid_pos[0], CellType.BLANK)
+                    editor.set_cell_type(sim_grid_pos[1], sim_grid_pos[0], CellType.BLANK)
+                    edited = True
                     # Update display even if simulation is paused
                     cell_to_delete = next(
                         (
@@ -164,28 +322,31 @@ def run(simulation: Simulation):
 
                 elif pos_changed:
                     # check if pressed on top of buttons
-                    if (not reset_button.Rect.collidepoint(display_grid_pos)
-                            and not pause_button.Rect.collidepoint(display_grid_pos)):
+                    if (not reset_button.Rect.collidepoint(pg.mouse.get_pos())
+                            and not pause_button.Rect.collidepoint(pg.mouse.get_pos())):
                         if s_pressed:
-                            simulation.set_cell_type(sim_grid_pos[1], sim_grid_pos[0], CellType.SOURCE)
+                            editor.set_cell_type(sim_grid_pos[1], sim_grid_pos[0], CellType.SOURCE)
+                            edited = True
                             cell_to_add = Cell(sim_grid_pos[1], sim_grid_pos[0], CellType.SOURCE)
                             cell_to_add.settled = False
                         elif d_pressed:
-                            simulation.set_cell_type(sim_grid_pos[1], sim_grid_pos[0], CellType.DRAIN)
+                            editor.set_cell_type(sim_grid_pos[1], sim_grid_pos[0], CellType.DRAIN)
+                            edited = True
                             cell_to_add = Cell(sim_grid_pos[1], sim_grid_pos[0], CellType.DRAIN)
                             cell_to_add.settled = False
                         else:
-                            simulation.set_cell_type(sim_grid_pos[1], sim_grid_pos[0], CellType.SOLID)
+                            editor.set_cell_type(sim_grid_pos[1], sim_grid_pos[0], CellType.SOLID)
+                            edited = True
                             cell_to_add = Cell(sim_grid_pos[1], sim_grid_pos[0], CellType.SOLID)
                             cell_to_add.settled = False
                         cells_to_display.add(cell_to_add)
 
         if rmb_pressed:
-            display_grid_pos = get_grid_pos()
-            if display_grid_pos[1] < HEIGHT * PIXEL_SIZE and 0 <= display_grid_pos[0] < WIDTH*PIXEL_SIZE:
-                sim_grid_pos = (display_grid_pos[0] // PIXEL_SIZE, display_grid_pos[1] // PIXEL_SIZE)
+            sim_grid_pos = get_grid_pos(camera)
+            if sim_grid_pos is not None:
                 if not grid[sim_grid_pos[1], sim_grid_pos[0]].type in [CellType.SOLID, CellType.DRAIN, CellType.SOURCE]:
-                    simulation.add_liquid(sim_grid_pos[1], sim_grid_pos[0], liquid_amount)
+                    editor.add_liquid(sim_grid_pos[1], sim_grid_pos[0], liquid_amount)
+                    edited = True
 
                     if paused:
                         # Update display even when simulation is paused
@@ -200,41 +361,88 @@ def run(simulation: Simulation):
                             cell_to_add.add_liquid(liquid_amount)
                             cells_to_display.add(cell_to_add)
 
-        # print(len(cells_to_display))
-        for cell in cells_to_display:
-            pixel_pos = (cell.y * PIXEL_SIZE, cell.x * PIXEL_SIZE)
-            is_falling = cell.top and cell.top.liquid and cell.top.flowing_down
-
-            if cell.type == CellType.SOLID:  # Walls
-                pg.Surface.fill(screen, WALL_COLOR, create_block(pixel_pos, PIXEL_SIZE, PIXEL_SIZE))
-            elif cell.type == CellType.SOURCE:
-                pg.Surface.fill(screen, SOURCE_COLOR, create_block(pixel_pos, PIXEL_SIZE, PIXEL_SIZE))
-            elif cell.type == CellType.DRAIN:
-                pg.Surface.fill(screen, DRAIN_COLOR, create_block(pixel_pos, PIXEL_SIZE, PIXEL_SIZE))
-            elif cell.liquid > LIQUID_MIN:  # Water
-                scaled_color = calc_color_from_pressure(cell.liquid)
-                if not is_falling:
-                    pg.Surface.fill(
-                        screen,
-                        scaled_color,
-                        create_block(pixel_pos, PIXEL_SIZE, min(PIXEL_SIZE, cell.liquid*PIXEL_SIZE))
-                    )
-                else:
-                    pg.Surface.fill(
-                        screen,
-                        scaled_color,
-                        create_block(pixel_pos, PIXEL_SIZE, PIXEL_SIZE)
-                    )
+        if edited and dirty_rects and not worker:
+            dirty_rects.add_blocks(simulation.awake_blocks())
+
+        if renderer:
+            # Only the cells which may have changed are drawn again, along with those under the last frame's overlays
+            regions = None
+            if dirty_rects and not worker:
+                for rect in overlays:
+                    dirty_rects.add_area(camera, rect)
+                regions = dirty_rects.regions()
+            if regions is None:
+                screen.fill((255, 255, 255), view_rect)
+
+            # The worker's snapshots don't say which blocks changed, so the whole view is drawn, and the pyramid is
+            # rebuilt whole when zoomed out
+            if worker:
+                drawn = renderer.draw(screen, worker.snapshot().arrays, camera)
+            else:
+                drawn = renderer.draw(screen, simulation.state(), camera, simulation.awake_blocks(), regions)
+            if dirty_rects:
+                for rect in drawn if regions is not None else [view_rect]:
+                    dirty_rects.add(rect)
+        else:
+            # print(len(cells_to_display))
+            # The cells are drawn one by one over the whole view
+            size = camera.zoom
+            screen.fill((255, 255, 255), view_rect)
+            if dirty_rects:
+                dirty_rects.add(view_rect)
+            screen.set_clip(view_rect)
+            for cell in cells_to_display:
+                pixel_pos = camera.to_screen(cell.y, cell.x)
+                is_falling = cell.top and cell.top.liquid and cell.top.flowing_down
+
+                if cell.type == CellType.SOLID:  # Walls
+                    pg.Surface.fill(screen, WALL_COLOR, create_block(pixel_pos, size, size, size))
+                elif cell.type == CellType.SOURCE:
+                    pg.Surface.fill(screen, SOURCE_COLOR, create_block(pixel_pos, size, size, size))
+                elif cell.type == CellType.DRAIN:
+                    pg.Surface.fill(screen, DRAIN_COLOR, create_block(pixel_pos, size, size, size))
+                elif cell.liquid > LIQUID_MIN:  # Water
+                    scaled_color = calc_color_from_pressure(cell.liquid)
+                    if not is_falling:
+                        pg.Surface.fill(
+                            screen,
+                            scaled_color,
+                            create_block(pixel_pos, size, min(size, cell.liquid*size), size)
+                        )
+                    else:
+                        pg.Surface.fill(
+                            screen,
+                            scaled_color,
+                            create_block(pixel_pos, size, size, size)
+                        )
+            screen.set_clip(None)
 
         if recording and not paused:
-            surface = screen.subsurface(pg.Rect(0, 0, WIDTH * PIXEL_SIZE, HEIGHT * PIXEL_SIZE))
-            recorder.record(surface, cycle)
+            if isinstance(recorder, StateRecorder):
+                recorder.record(worker.snapshot().arrays if worker else simulation.state(), cycle)
+            else:
+                surface = screen.subsurface(pg.Rect(0, 0, view_width, view_height))
+                recorder.record(surface, cycle)
 
         # Redraw
-        display_fps(clock, font, screen)
+        overlays = display_fps(clock, font, screen)
+        if scheduler:
+            overlays += display_steps_per_second(scheduler, my_font, screen)
+        if show_stats:
+            overlays += display_stats(simulation.profiler, my_font, screen)
+            simulation.profiler.reset()
         pg.display.set_caption(f'Current cycle: {cycle} {"(Recording)" if recording else ""}')
-        reset_button.draw()
-        pause_button.draw()
-        pg.display.flip()
-
+        if dirty_rects:
+            for rect in overlays:
+                dirty_rects.add(rect)
+            # The overlays are cleared by drawing what is under them again, the cells or the panel
+            redraw_panel = redraw_panel or any(not view_rect.contains(rect) for rect in overlays)
+            dirty_rects.update()
+        else:
+            pg.display.flip()
+
+    if worker:
+        worker.stop()
+    if recording and isinstance(recorder, StateRecorder):
+        recorder.stop()
     pg.quit()
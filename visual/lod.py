@@ -0,0 +1,142 @@
+import numpy as np
+
+from simulation import CellType
+from simulation.kernel import spread_to_neighbors
+
+# Channels of a pyramid level: the liquid in the blank cells of a block and how many of its cells are of each kind
+_LIQUID, _BLANK, _SOLID, _SOURCE, _DRAIN, _FALLING = range(6)
+_CHANNELS = 6
+
+
+def _channels(liquid: np.ndarray, types: np.ndarray, flowing_down: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+    """Returns the channels of single cells, padded with empty cells to the shape."""
+
+    blank = types == CellType.BLANK.value
+    channels = np.zeros((_CHANNELS, *shape), dtype=np.float32)
+    area = (slice(None), slice(0, liquid.shape[0]), slice(0, liquid.shape[1]))
+    channels[area] = (
+        np.where(blank, liquid, 0),
+        blank,
+        types == CellType.SOLID.value,
+        types == CellType.SOURCE.value,
+        types == CellType.DRAIN.value,
+        flowing_down & (liquid != 0)
+    )
+    return channels
+
+
+def _round_up(size: int, multiple: int) -> int:
+    return -(-size // multiple) * multiple
+
+
+def _halve(channels: np.ndarray) -> np.ndarray:
+    """Adds up the channels of every two by two cells, padding odd sizes with empty cells."""
+
+    _, height, width = channels.shape
+    if height % 2 or width % 2:
+        channels = np.pad(channels, ((0, 0), (0, height % 2), (0, width % 2)))
+
+    # Adding the four strided views is much faster than summing over the axes of a reshaped view
+    return channels[:, 0::2, 0::2] + channels[:, 1::2, 0::2] + channels[:, 0::2, 1::2] + channels[:, 1::2, 1::2]
+
+
+class LodPyramid:
+    """
+    Downsampled copies of the simulation state, for drawing a large grid zoomed out.
+
+    Level `k` holds one cell for every 2 ** k by 2 ** k cells of the grid, with the mean liquid of their blank cells and
+    whether liquid is falling in any of them. It is a source or a drain if any of them is, so that those stay visible,
+    and otherwise a wall if at least as many of them are walls as are blank.
+
+    The levels down to the size of the blocks the engine sleeps in are only updated over the blocks which were awake at
+    the last update or this one, so keeping the pyramid up to date costs about as much as the change. The levels above
+    those are small and are rebuilt whole.
+    """
+
+    def __init__(self):
+        self.levels: list[np.ndarray] = []
+        self._shape: tuple[int, int] | None = None
+        self._awake: tuple[int, np.ndarray] | None = None
+
+    def invalidate(self):
+        """Makes the next update rebuild the whole pyramid."""
+
+        self._shape = None
+
+    def update(self, state: dict[str, np.ndarray], awake: tuple[int, np.ndarray] | None = None):
+        """Brings the pyramid up to date with the state, given the awake blocks of the engine if it has them."""
+
+        shape = state['liquid'].shape
+        if (awake is None or self._shape != shape or self._awake is None or self._awake[0] != awake[0]
+                or self._aligned(awake[0]) == 1):
+            self._build(state, awake)
+        else:
+            block_size, previous = self._awake
+            touched = previous | awake[1]
+            touched |= spread_to_neighbors(touched)
+            self._update_blocks(state, block_size, touched)
+
+        self._shape = shape
+        self._awake = (awake[0], awake[1].copy()) if awake is not None else None
+
+    def level(self, level: int, rows: slice, columns: slice) -> dict[str, np.ndarray]:
+        """Returns the liquid, types and falling liquid of the cells of a level, like a simulation state."""
+
+        channels = self.levels[level - 1][:, rows, columns]
+        solid = channels[_SOLID]
+
+        types = np.where((solid > 0) & (solid >= channels[_BLANK]), CellType.SOLID.value, CellType.BLANK.value)
+        types[channels[_SOURCE] > 0] = CellType.SOURCE.value
+        types[channels[_DRAIN] > 0] = CellType.DRAIN.value
+
+        return {
+            'liquid': channels[_LIQUID] / np.maximum(channels[_BLANK], 1),
+            'types': types.astype(np.uint8),
+            'flowing_down': channels[_FALLING] > 0,
+        }
+
+    def _build(self, state: dict[str, np.ndarray], awake: tuple[int, np.ndarray] | None):
+        """Builds every level from scratch."""
+
+        height, width = state['liquid'].shape
+        block_size = self._aligned(awake[0] if awake is not None else 1)
+
+        # The levels updated block by block are padded to whole blocks, so that every block halves evenly
+        padded = (_round_up(height, block_size), _round_up(width, block_size))
+        channels = _channels(state['liquid'], state['types'], state['flowing_down'], padded)
+
+        self.levels = []
+        while max(channels.shape[1:]) > 1:
+            channels = _halve(channels)
+            self.levels.append(channels)
+
+    def _update_blocks(self, state: dict[str, np.ndarray], block_size: int, touched: np.ndarray):
+        """Updates the levels over the touched blocks, going through each run of them along a row of blocks at once."""
+
+        height, width = state['liquid'].shape
+        aligned = self._aligned(block_size)
+        depth = aligned.bit_length() - 1
+        for row in range(touched.shape[0]):
+            edges = np.flatnonzero(np.diff(np.concatenate(([False], touched[row], [False])).astype(np.int8)))
+            for start, end in edges.reshape(-1, 2):
+                rows = slice(row * block_size, min((row + 1) * block_size, height))
+                columns = slice(start * block_size, min(end * block_size, width))
+                channels = _channels(
+                    state['liquid'][rows, columns],
+                    state['types'][rows, columns],
+                    state['flowing_down'][rows, columns],
+                    (_round_up(rows.stop - rows.start, aligned), _round_up(columns.stop - columns.start, aligned))
+                )
+                for level in range(depth):
+                    channels = _halve(channels)
+                    top, left = rows.start >> (level + 1), columns.start >> (level + 1)
+                    self.levels[level][:, top:top + channels.shape[1], left:left + channels.shape[2]] = channels
+
+        for level in range(depth, len(self.levels)):
+            self.levels[level] = _halve(self.levels[level - 1])
+
+    @staticmethod
+    def _aligned(block_size: int) -> int:
+        """Returns the largest power of two dividing the block size, which blocks can be halved down to evenly."""
+
+        return block_size & -block_size
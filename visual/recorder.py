@@ -2,6 +2,28 @@ import pygame as pg
 import math
 
 
+def contact_sheet(surfaces: list[pg.Surface], cols: int) -> pg.Surface:
+    """Lays the surfaces out in a grid with the given number of columns, on a white background."""
+
+    total = len(surfaces)
+    cols = min(cols, total)
+    rows = math.ceil(total / cols)
+
+    surface = pg.Surface(
+        size=(
+            surfaces[0].get_width() * cols,
+            surfaces[0].get_height() * rows,
+        )
+    )
+    surface.fill((255, 255, 255))
+    for i, s in enumerate(surfaces):
+        x = (i % cols) * s.get_width()
+        y = (i // cols) * s.get_height()
+        surface.blit(s, (x, y))
+
+    return surface
+
+
 class Recorder:
     def __init__(
         self, filename: str, font: pg.font.Font, cols: int = 5, frequency: int = 20
@@ -17,23 +39,7 @@ class Recorder:
         self._surfaces = []
 
     def stop(self):
-        total = len(self._surfaces)
-        cols = min(self._cols, total)
-        rows = math.ceil(total / cols)
-
-        surface = pg.Surface(
-            size=(
-                self._surfaces[0].get_width() * cols,
-                self._surfaces[0].get_height() * rows,
-            )
-        )
-        surface.fill((255, 255, 255))
-        for i, s in enumerate(self._surfaces):
-            x = (i % cols) * s.get_width()
-            y = (i // cols) * s.get_height()
-            surface.blit(s, (x, y))
-
-        pg.image.save(surface, self._filename)
+        pg.image.save(contact_sheet(self._surfaces, self._cols), self._filename)
         self._surfaces = []
 
     def record(self, surface: pg.Surface, cycle: int):
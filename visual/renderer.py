@@ -0,0 +1,141 @@
+import numpy as np
+import pygame as pg
+
+from config import PIXEL_SIZE, LIQUID_MIN, WALL_COLOR, SOURCE_COLOR, DRAIN_COLOR
+from simulation import CellType
+from .camera import Camera
+from .lod import LodPyramid
+from .utils import calc_color_from_pressure
+
+BACKGROUND_COLOR = (255, 255, 255)
+
+# Pressures above this all get the darkest water colour, see `calc_color_from_pressure`
+MAX_PRESSURE = 4
+
+
+def _cut(cells: slice, cell_size: int, view: slice) -> slice:
+    """Returns the cells of a level of detail covering a range of cells of the grid, cut down to those in view."""
+
+    return slice(max(cells.start // cell_size, view.start), min(-(-cells.stop // cell_size), view.stop))
+
+
+class ArrayRenderer:
+    """
+    Renders the whole simulation in one vectorized pass over its state arrays.
+
+    The frame is built at one pixel per cell horizontally and `pixel_size` pixels per cell vertically, which is enough
+    for the partially filled cells, and is scaled up to the screen with a single blit. Given a camera, only the cells in
+    its view are rendered, and when zoomed out to less than a pixel per cell they are taken from a `LodPyramid` at the
+    level which has about one cell per pixel, so drawing costs about the same at any grid size.
+    """
+
+    def __init__(self, pixel_size: int = PIXEL_SIZE, lut_size: int = 256):
+        self.pixel_size = pixel_size
+        self.lut_size = lut_size
+        self.lut = np.array(
+            [calc_color_from_pressure(pressure) for pressure in np.linspace(0, MAX_PRESSURE, lut_size)],
+            dtype=np.uint8
+        )
+
+        self.type_colors = np.array([BACKGROUND_COLOR] * len(CellType), dtype=np.uint8)
+        self.type_colors[CellType.SOLID.value] = WALL_COLOR
+        self.type_colors[CellType.SOURCE.value] = SOURCE_COLOR
+        self.type_colors[CellType.DRAIN.value] = DRAIN_COLOR
+
+        self.pyramid = LodPyramid()
+        self._surface: pg.Surface | None = None
+
+    def render(self, liquid: np.ndarray, types: np.ndarray, flowing_down: np.ndarray,
+               pixel_size: int | None = None) -> np.ndarray:
+        """Returns the frame as an array of shape (width, height * pixel_size, 3), ready for `pygame.surfarray`."""
+
+        size = pixel_size or self.pixel_size
+        water = (types == CellType.BLANK.value) & (liquid > LIQUID_MIN)
+
+        # Liquid falling into a cell fills all of it, otherwise cells fill up from the bottom
+        falling = np.zeros(liquid.shape, dtype=bool)
+        falling[1:] = (liquid[:-1] != 0) & flowing_down[:-1]
+        heights = np.where(falling, size, np.minimum(size, liquid * size))
+
+        first_row = np.where(water, np.floor(size - heights), size).astype(np.int16)
+        first_row[types != CellType.BLANK.value] = 0
+
+        pressure = np.minimum(liquid / MAX_PRESSURE, 1)
+        colors = np.where(
+            water[..., np.newaxis],
+            self.lut[(pressure * (self.lut_size - 1)).astype(np.intp)],
+            self.type_colors[types]
+        )
+
+        filled = np.arange(size)[np.newaxis, :, np.newaxis] >= first_row[:, np.newaxis, :]
+        frame = np.where(filled[..., np.newaxis], colors[:, np.newaxis], np.uint8(255))
+
+        height, width = liquid.shape
+        return frame.reshape(height * size, width, 3).transpose(1, 0, 2)
+
+    def draw(self, screen: pg.Surface, state: dict[str, np.ndarray], camera: Camera | None = None,
+             awake: tuple[int, np.ndarray] | None = None,
+             regions: list[tuple[slice, slice]] | None = None) -> list[pg.Rect]:
+        """
+        Draws the simulation state onto the top left corner of the screen, or the part of it in view of the camera onto
+        its viewport, only drawing the cells of the given `regions` of the grid again if there are any. The awake
+        blocks of the engine, see `awake_blocks`, let the level of detail pyramid be updated only where the state
+        changed. Returns the rects of the screen drawn over.
+        """
+
+        if camera is None:
+            frame = self.render(state['liquid'], state['types'], state['flowing_down'])
+            return [self._blit(screen, frame, (0, 0), (frame.shape[0] * self.pixel_size, frame.shape[1]))]
+
+        level = camera.level
+        cell_size = 2 ** level
+        rows, columns = camera.visible(cell_size)
+        if level:
+            self.pyramid.update(state, awake)
+        else:
+            # The pyramid isn't kept up to date while it isn't used
+            self.pyramid.invalidate()
+
+        if regions is None:
+            regions = [(rows, columns)]
+        else:
+            # The regions in the cells of the level, cut down to the view
+            regions = [
+                (_cut(region_rows, cell_size, rows), _cut(region_columns, cell_size, columns))
+                for region_rows, region_columns in regions
+            ]
+
+        size = min(max(round(cell_size * camera.zoom), 1), self.pixel_size)
+        clip = screen.get_clip()
+        screen.set_clip(pg.Rect(0, 0, camera.view_width, camera.view_height))
+
+        drawn = []
+        for region_rows, region_columns in regions:
+            if region_rows.start >= region_rows.stop or region_columns.start >= region_columns.stop:
+                continue
+
+            # The row above is rendered too and cut off again, since liquid falling from it fills the first row
+            above = min(region_rows.start, 1)
+            source_rows = slice(region_rows.start - above, region_rows.stop)
+            if level:
+                view = self.pyramid.level(level, source_rows, region_columns)
+            else:
+                view = {name: state[name][source_rows, region_columns] for name in ('liquid', 'types', 'flowing_down')}
+            frame = self.render(view['liquid'], view['types'], view['flowing_down'], size)[:, above * size:]
+
+            # Both corners are rounded like those of the neighbouring regions, so that they line up
+            left, top = camera.pixel(region_columns.start * cell_size, region_rows.start * cell_size)
+            right, bottom = camera.pixel(region_columns.stop * cell_size, region_rows.stop * cell_size)
+            drawn.append(self._blit(screen, frame, (left, top), (right - left, bottom - top)))
+
+        screen.set_clip(clip)
+        return drawn
+
+    def _blit(self, screen: pg.Surface, frame: np.ndarray, position: tuple[int, int], size: tuple[int, int]) -> pg.Rect:
+        """Scales a rendered frame to the size in pixels and draws it at the position. Returns the rect drawn over."""
+
+        if self._surface is None or self._surface.get_size() != frame.shape[:2]:
+            self._surface = pg.Surface(frame.shape[:2], depth=24)
+
+        pg.surfarray.blit_array(self._surface, frame)
+        return screen.blit(pg.transform.scale(self._surface, size), position)
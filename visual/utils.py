@@ -5,19 +5,31 @@ from config import PIXEL_SIZE, WATER_COLOR, DARK_WATER_COLOR
 
 def display_fps(clock, font, screen):
     fps_text = font.render(f"FPS: {int(clock.get_fps())}", True, (0,0,0))
-    screen.blit(fps_text, (10, 10))
+    return [screen.blit(fps_text, (10, 10))]
 
 
-def create_block(position, width, height):
-    return pg.Rect(position[0], position[1]+PIXEL_SIZE-height, width, height+1)
+def display_steps_per_second(scheduler, font, screen):
+    steps_text = font.render(f"Steps/s: {scheduler.steps_per_second:.0f} ({scheduler.steps}/frame)", True, (0, 0, 0))
+    return [screen.blit(steps_text, (screen.get_width() - steps_text.get_width() - 10, 10))]
 
 
-def get_grid_pos():
+def display_stats(profiler, font, screen):
+    rects = []
+    for i, line in enumerate(profiler.summary()):
+        stats_text = font.render(line, True, (0, 0, 0))
+        rects.append(screen.blit(stats_text, (10, 40 + i * 18)))
+    return rects
+
+
+def create_block(position, width, height, cell_size=PIXEL_SIZE):
+    return pg.Rect(position[0], position[1]+cell_size-height, width, height+1)
+
+
+def get_grid_pos(camera):
     pos = pg.mouse.get_pos()  # Get current mouse position
 
-    # Change coordinates to grid - so that when pressed in [0, pixel_size) pos stays as 0,
-    # in [pixel_size, 2*pixel_size) it equals 1*pixel_size and so on
-    return (pos[0] // PIXEL_SIZE) * PIXEL_SIZE, (pos[1] // PIXEL_SIZE) * PIXEL_SIZE
+    # Column and row of the cell under the mouse, wherever the camera is, or None outside of the grid
+    return camera.to_grid(pos)
 
 
 def calc_color_from_pressure(pressure):